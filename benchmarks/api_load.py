@@ -0,0 +1,294 @@
+"""
+Load test of the api layer, with the inference replaced by a stand-in that
+waits --delay seconds per run (see benchmarks/serve.py).
+
+	python -m benchmarks.api_load --concurrency 16 --requests 500
+	python -m benchmarks.api_load --scenarios infer ulca --images 4 --image-size 200
+	python -m benchmarks.api_load --name after --compare benchmarks/results/before.json
+
+infer: /ocr/infer
+ulca: /ocr/ulca/v2
+cegis: /ocr/cegis/ and /ocr/cegis/v2 (alternately)
+
+every request carries --images random images of --image-size KB, random
+images are never found in the result cache (which is disabled by the
+benchmark server anyway). the server is started for the run unless --url
+is given, and its rss is sampled from /proc during each scenario (only
+when it is local).
+
+the throughput, the latency percentiles and the rss of each scenario are
+saved as json in benchmarks/results/<name>.json, and compared with the
+same scenarios of the --compare report.
+"""
+
+import argparse
+import asyncio
+import base64
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime
+from os.path import abspath, dirname, join
+from typing import Callable, Dict, List, Optional
+
+import httpx
+
+REPO = dirname(dirname(abspath(__file__)))
+RESULTS_FOLDER = join(REPO, 'benchmarks', 'results')
+
+
+def random_images(count: int, size: int) -> List[str]:
+	return [base64.b64encode(os.urandom(size * 1024)).decode('ascii') for _ in range(count)]
+
+
+def infer_request(images: List[str], idx: int) -> tuple:
+	return '/ocr/infer', {
+		'imageContent': images,
+		'language': 'hi',
+		'version': 'v4',
+		'modality': 'printed',
+	}
+
+
+def ulca_request(images: List[str], idx: int) -> tuple:
+	return '/ocr/ulca/v2', {
+		'image': [{'imageContent': i} for i in images],
+		'config': {'languages': [{'sourceLanguage': 'hi'}]},
+	}
+
+
+def cegis_request(images: List[str], idx: int) -> tuple:
+	return ('/ocr/cegis/', '/ocr/cegis/v2')[idx % 2], {'images': images}
+
+
+SCENARIOS: Dict[str, Callable[[List[str], int], tuple]] = {
+	'infer': infer_request,
+	'ulca': ulca_request,
+	'cegis': cegis_request,
+}
+
+
+def percentile(values: List[float], q: float) -> float:
+	"""
+	nearest rank percentile of the sorted values
+	"""
+	if not values:
+		return 0.0
+	idx = max(0, min(len(values) - 1, int(round(q / 100 * len(values) + 0.5)) - 1))
+	return values[idx]
+
+
+def rss_mb(pid: Optional[int]) -> Dict[str, float]:
+	"""
+	resident and peak resident memory of the process from /proc
+	"""
+	ret = {}
+	if pid is None:
+		return ret
+	try:
+		with open(f'/proc/{pid}/status', 'r') as f:
+			for line in f:
+				key, _, value = line.partition(':')
+				if key in ('VmRSS', 'VmHWM'):
+					ret[key] = round(int(value.split()[0]) / 1024, 1)
+	except OSError:
+		pass
+	return ret
+
+
+async def sample_rss(pid: Optional[int], samples: List[float], interval: float = 0.1) -> None:
+	while True:
+		rss = rss_mb(pid).get('VmRSS')
+		if rss is not None:
+			samples.append(rss)
+		await asyncio.sleep(interval)
+
+
+async def run_scenario(
+	client: httpx.AsyncClient,
+	make_request: Callable[[List[str], int], tuple],
+	args: argparse.Namespace,
+	pid: Optional[int],
+) -> dict:
+	shared = random_images(args.images, args.image_size)
+	latencies = []
+	errors = 0
+
+	async def drive(count: int, record: bool) -> None:
+		counter = iter(range(count))
+
+		async def worker() -> None:
+			nonlocal errors
+			for idx in counter:
+				images = random_images(args.images, args.image_size) if args.unique else shared
+				path, body = make_request(images, idx)
+				start = time.perf_counter()
+				try:
+					response = await client.post(path, json=body)
+					ok = response.status_code == 200
+				except httpx.HTTPError:
+					ok = False
+				if record:
+					latencies.append(time.perf_counter() - start)
+					errors += not ok
+
+		await asyncio.gather(*(worker() for _ in range(args.concurrency)))
+
+	await drive(args.warmup, False)
+	samples = []
+	sampler = asyncio.ensure_future(sample_rss(pid, samples))
+	rss_start = rss_mb(pid).get('VmRSS')
+	start = time.perf_counter()
+	await drive(args.requests, True)
+	duration = time.perf_counter() - start
+	sampler.cancel()
+	rss_end = rss_mb(pid).get('VmRSS')
+	latencies.sort()
+	return {
+		'requests': len(latencies),
+		'errors': errors,
+		'duration_s': round(duration, 3),
+		'throughput_rps': round(len(latencies) / duration, 2),
+		'images_per_s': round(len(latencies) * args.images / duration, 2),
+		'latency_ms': {
+			'mean': round(statistics.mean(latencies) * 1000, 2) if latencies else 0.0,
+			'p50': round(percentile(latencies, 50) * 1000, 2),
+			'p95': round(percentile(latencies, 95) * 1000, 2),
+			'p99': round(percentile(latencies, 99) * 1000, 2),
+			'max': round(latencies[-1] * 1000, 2) if latencies else 0.0,
+		},
+		'rss_mb': {
+			'start': rss_start,
+			'peak': max(samples) if samples else rss_end,
+			'end': rss_end,
+		},
+	}
+
+
+def start_server(args: argparse.Namespace) -> subprocess.Popen:
+	server = subprocess.Popen(
+		[
+			sys.executable, '-m', 'benchmarks.serve',
+			'--port', str(args.port),
+			'--backend', args.backend,
+			'--delay', str(args.delay),
+			'--image-delay', str(args.image_delay),
+		],
+		cwd=REPO,
+		stdout=subprocess.DEVNULL,
+	)
+	deadline = time.time() + 60
+	while time.time() < deadline:
+		if server.poll() is not None:
+			raise RuntimeError('the benchmark server exited')
+		try:
+			if httpx.get(f'http://127.0.0.1:{args.port}/ocr/ping').status_code == 200:
+				return server
+		except httpx.HTTPError:
+			pass
+		time.sleep(0.2)
+	server.terminate()
+	raise RuntimeError('the benchmark server did not start')
+
+
+def commit() -> Optional[str]:
+	try:
+		return subprocess.check_output(
+			['git', 'rev-parse', '--short', 'HEAD'], cwd=REPO, stderr=subprocess.DEVNULL
+		).decode().strip()
+	except (OSError, subprocess.CalledProcessError):
+		return None
+
+
+def compare(report: dict, base: dict) -> None:
+	"""
+	prints the change of every metric from the base report
+	"""
+	def change(new: Optional[float], old: Optional[float]) -> str:
+		if not new or not old:
+			return '-'
+		return f'{(new - old) / old * 100:+.1f}%'
+
+	print(f'{"":20}{base["name"]:>12}{report["name"]:>12}{"change":>10}')
+	for name, scenario in report['scenarios'].items():
+		old = base['scenarios'].get(name)
+		if old is None:
+			continue
+		print(name)
+		rows = [('throughput_rps', scenario['throughput_rps'], old['throughput_rps'])]
+		rows += [(f'{i} ms', scenario['latency_ms'][i], old['latency_ms'][i]) for i in ('p50', 'p95', 'p99')]
+		rows.append(('peak rss mb', scenario['rss_mb']['peak'], old['rss_mb']['peak']))
+		for label, new_value, old_value in rows:
+			print(f'  {label:18}{old_value or 0:>12.2f}{new_value or 0:>12.2f}{change(new_value, old_value):>10}')
+
+
+async def run(args: argparse.Namespace, pid: Optional[int]) -> dict:
+	limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+	async with httpx.AsyncClient(base_url=args.url, limits=limits, timeout=args.timeout) as client:
+		return {
+			i: await run_scenario(client, SCENARIOS[i], args, pid)
+			for i in args.scenarios
+		}
+
+
+def main():
+	parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+	parser.add_argument('--scenarios', nargs='+', choices=list(SCENARIOS), default=list(SCENARIOS))
+	parser.add_argument('--concurrency', type=int, default=8)
+	parser.add_argument('--requests', type=int, default=200, help='requests per scenario')
+	parser.add_argument('--warmup', type=int, default=10, help='requests per scenario run before the measure')
+	parser.add_argument('--images', type=int, default=1, help='images per request')
+	parser.add_argument('--image-size', type=int, default=100, help='KB per image')
+	parser.add_argument('--unique', action='store_true', help='new images for every request')
+	parser.add_argument('--url', help='benchmarks a running api instead of starting one')
+	parser.add_argument('--pid', type=int, help='process of the --url api, to sample its rss')
+	parser.add_argument('--port', type=int, default=8100)
+	parser.add_argument('--backend', choices=['script', 'worker'], default='script')
+	parser.add_argument('--delay', type=float, default=0.1, help='seconds per model run')
+	parser.add_argument('--image-delay', type=float, default=0.0, help='seconds per image')
+	parser.add_argument('--timeout', type=float, default=120)
+	parser.add_argument('--name', default=datetime.now().strftime('%Y%m%d-%H%M%S'))
+	parser.add_argument('--output', help='defaults to benchmarks/results/<name>.json')
+	parser.add_argument('--compare', help='report to compare the results with')
+	args = parser.parse_args()
+
+	server = None
+	pid = args.pid
+	if args.url is None:
+		server = start_server(args)
+		args.url = f'http://127.0.0.1:{args.port}'
+		pid = server.pid
+	try:
+		scenarios = asyncio.run(run(args, pid))
+	finally:
+		if server is not None:
+			server.terminate()
+			server.wait()
+
+	config = vars(args).copy()
+	for name in ('output', 'compare', 'name', 'pid'):
+		config.pop(name)
+	report = {
+		'name': args.name,
+		'created': datetime.now().isoformat(timespec='seconds'),
+		'commit': commit(),
+		'python': platform.python_version(),
+		'config': config,
+		'scenarios': scenarios,
+	}
+	output = args.output or join(RESULTS_FOLDER, f'{args.name}.json')
+	os.makedirs(dirname(abspath(output)), exist_ok=True)
+	with open(output, 'w') as f:
+		json.dump(report, f, indent=2)
+	print(json.dumps(report, indent=2))
+	if args.compare:
+		with open(args.compare, 'r') as f:
+			compare(report, json.load(f))
+
+
+if __name__ == '__main__':
+	main()
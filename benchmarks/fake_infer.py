@@ -0,0 +1,39 @@
+"""
+Stand-in for infer.sh and the other inference scripts, used by the api
+benchmarks (see benchmarks/serve.py).
+
+It takes the first argument that is a folder as the image folder, waits
+like a model run would and writes out.json with a text per image, and
+prob.json as well when it replaces infer_prob.sh.
+
+	FAKE_INFER_DELAY         seconds per run (container start, model load)
+	FAKE_INFER_IMAGE_DELAY   seconds per image
+	FAKE_INFER_SCRIPT        name of the replaced script
+"""
+
+import json
+import os
+import sys
+import time
+from os.path import join
+
+
+def main():
+	folders = [i for i in sys.argv[1:] if os.path.isdir(i)]
+	if not folders:
+		return
+	folder = folders[0]
+	images = sorted(i for i in os.listdir(folder) if i.endswith('.jpg'))
+	time.sleep(
+		float(os.environ.get('FAKE_INFER_DELAY', '0'))
+		+ float(os.environ.get('FAKE_INFER_IMAGE_DELAY', '0')) * len(images)
+	)
+	with open(join(folder, 'out.json'), 'w', encoding='utf-8') as f:
+		json.dump({i: f'text of {i}' for i in images}, f)
+	if 'prob' in os.environ.get('FAKE_INFER_SCRIPT', ''):
+		with open(join(folder, 'prob.json'), 'w', encoding='utf-8') as f:
+			json.dump({i: {'data_prob': '', 'max_prob': ''} for i in images}, f)
+
+
+if __name__ == '__main__':
+	main()
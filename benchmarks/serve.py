@@ -0,0 +1,93 @@
+"""
+Runs the api with stand-in inference backends, for the api benchmarks.
+
+	python -m benchmarks.serve --port 8100 --delay 0.2 --image-delay 0.01
+	python -m benchmarks.serve --backend worker
+
+script: every inference script (infer.sh, infer_ulca_v2.sh, cegis_infer.sh,
+...) is replaced by benchmarks/fake_infer.py, the worker pool is disabled.
+worker: the models run in the worker pool with tests/fake_worker.py.
+
+the scratch folders, logs and archive go to a temporary folder and the
+result cache is disabled unless --cache is given, so every request reaches
+the backend.
+"""
+
+import argparse
+import glob
+import os
+import stat
+import sys
+from os.path import abspath, basename, dirname, join
+from tempfile import TemporaryDirectory
+
+REPO = dirname(dirname(abspath(__file__)))
+
+
+def configure(args: argparse.Namespace, root: str) -> None:
+	"""
+	points the config to the stand-in backends, before the api is imported
+	"""
+	import server.config as config
+	config.MODEL_REGISTRY_FILE = join(REPO, config.MODEL_REGISTRY_FILE)
+	config.WORKER_POOL_ENABLED = args.backend == 'worker'
+	config.WORKER_COMMAND = f'{sys.executable} {REPO}/tests/fake_worker.py {{modality}} {{language}} {{version}} {{root}}'
+	config.WORKER_DATA_ROOT = join(root, 'workers')
+	config.RESULT_CACHE_ENABLED = args.cache
+	config.RESULT_CACHE_FOLDER = None
+	config.WORKSPACE_ROOT = join(root, 'workspaces')
+	config.JOBS_FOLDER = join(root, 'jobs')
+	config.LEXICON_FOLDER = join(root, 'lexicons')
+	config.ULCA_LOGS_FOLDER = join(root, 'ulca_logs')
+	config.ARCHIVE_FOLDER = join(root, 'archive')
+	import server.modules.iitb_v2.config as iitb_config
+	iitb_config.LOGS_FOLDER = join(root, 'iitb_logs')
+	os.environ['FAKE_WORKER_DELAY'] = str(args.delay)
+	os.environ['FAKE_INFER_DELAY'] = str(args.delay)
+	os.environ['FAKE_INFER_IMAGE_DELAY'] = str(args.image_delay)
+
+
+def fake_scripts(folder: str) -> None:
+	"""
+	writes a stand-in for every inference script of the repo in folder
+	"""
+	os.makedirs(folder, exist_ok=True)
+	for path in glob.glob(join(REPO, '*.sh')):
+		name = basename(path)
+		script = join(folder, name)
+		with open(script, 'w') as f:
+			f.write(
+				'#!/bin/sh\n'
+				f'FAKE_INFER_SCRIPT={name} exec {sys.executable} {REPO}/benchmarks/fake_infer.py "$@"\n'
+			)
+		os.chmod(script, os.stat(script).st_mode | stat.S_IXUSR)
+
+
+def main():
+	parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+	parser.add_argument('--host', default='127.0.0.1')
+	parser.add_argument('--port', type=int, default=8100)
+	parser.add_argument('--backend', choices=['script', 'worker'], default='script')
+	parser.add_argument('--delay', type=float, default=0.1, help='seconds per model run')
+	parser.add_argument('--image-delay', type=float, default=0.0, help='seconds per image (script backend)')
+	parser.add_argument('--cache', action='store_true', help='keeps the result cache enabled')
+	args = parser.parse_args()
+
+	sys.path.insert(0, REPO)
+	tmp = TemporaryDirectory(prefix='ocr_bench_')
+	configure(args, tmp.name)
+	fake_scripts(join(tmp.name, 'bin'))
+	# the inference scripts are called relative to the working directory
+	os.chdir(join(tmp.name, 'bin'))
+
+	import uvicorn
+
+	from server.app import app
+
+	# uvicorn raises the stop signal again once the api has shut down
+	app.add_event_handler('shutdown', tmp.cleanup)
+	uvicorn.run(app, host=args.host, port=args.port, log_level='warning', access_log=False)
+
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,128 @@
+"""
+Compares the disk based image path of the tesseract endpoints with the
+in-memory one.
+
+	python -m benchmarks.tesseract_io --images 200 --size 1600x1200
+	python -m benchmarks.tesseract_io --recognise --language hindi
+
+disk: the upload is written to a temporary folder, listed, reopened,
+padded and saved back, and then opened again to be recognised (the
+behaviour before the in-memory path).
+memory: the upload is decoded once and padded in memory.
+
+the latency and the io counters of /proc/self/io (syscalls and bytes) are
+reported per image as json. the recognition is the same for both paths so
+it is only run with --recognise (which needs tesseract).
+"""
+
+import argparse
+import io
+import json
+import os
+import shutil
+import statistics
+import time
+from os.path import join
+from tempfile import TemporaryDirectory
+
+from PIL import Image, ImageDraw
+
+from server.modules.tesseract.engine import (open_image, pad_image,
+                                             tesseract_language,
+                                             tesseract_pools)
+
+PADDING = 10
+
+
+def sample_image(width: int, height: int) -> bytes:
+	img = Image.new('RGB', (width, height), 'white')
+	draw = ImageDraw.Draw(img)
+	for y in range(20, height - 20, 40):
+		draw.text((20, y), 'The quick brown fox jumps over the lazy dog ' * 4, fill='black')
+	out = io.BytesIO()
+	img.save(out, format='JPEG', quality=90)
+	return out.getvalue()
+
+
+def io_counters() -> dict:
+	try:
+		with open('/proc/self/io', 'r') as f:
+			return {k: int(v) for k, v in (i.split(': ') for i in f.read().strip().split('\n'))}
+	except OSError:
+		return {}
+
+
+def disk_path(data: bytes, recognise) -> None:
+	tmp = TemporaryDirectory()
+	with open(join(tmp.name, 'image.jpg'), 'wb+') as f:
+		shutil.copyfileobj(io.BytesIO(data), f)
+	for name in os.listdir(tmp.name):
+		path = join(tmp.name, name)
+		pad_image(open_image(path), PADDING).save(path)
+		recognise(open_image(path))
+	tmp.cleanup()
+
+
+def memory_path(data: bytes, recognise) -> None:
+	recognise(pad_image(open_image(data), PADDING))
+
+
+def run(name: str, func, data: bytes, count: int, recognise) -> dict:
+	latencies = []
+	before = io_counters()
+	for _ in range(count):
+		start = time.perf_counter()
+		func(data, recognise)
+		latencies.append((time.perf_counter() - start) * 1000)
+	after = io_counters()
+	latencies.sort()
+	ret = {
+		'path': name,
+		'images': count,
+		'mean_ms': statistics.mean(latencies),
+		'p50_ms': latencies[len(latencies) // 2],
+		'p95_ms': latencies[min(int(len(latencies) * 0.95), len(latencies) - 1)],
+	}
+	# io per image, syscr/syscw are the read/write syscalls
+	for key in ('syscr', 'syscw', 'rchar', 'wchar', 'write_bytes'):
+		if key in before and key in after:
+			ret[f'{key}_per_image'] = (after[key] - before[key]) / count
+	return ret
+
+
+def main():
+	parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+	parser.add_argument('--images', type=int, default=100)
+	parser.add_argument('--size', default='1600x1200')
+	parser.add_argument('--recognise', action='store_true')
+	parser.add_argument('--language', default='english')
+	parser.add_argument('--output', help='also saves the results to this json file')
+	args = parser.parse_args()
+
+	width, height = map(int, args.size.split('x'))
+	data = sample_image(width, height)
+	if args.recognise:
+		lang = tesseract_language(args.language)
+		recognise = lambda image: tesseract_pools.text(lang, [image])
+	else:
+		recognise = lambda image: image.load()
+
+	results = [
+		run(name, func, data, args.images, recognise)
+		for name, func in (('disk', disk_path), ('memory', memory_path))
+	]
+	report = {
+		'size': args.size,
+		'image_bytes': len(data),
+		'recognise': args.recognise,
+		'results': results,
+		'speedup': results[0]['mean_ms'] / results[1]['mean_ms'],
+	}
+	print(json.dumps(report, indent=4))
+	if args.output:
+		with open(args.output, 'w') as f:
+			json.dump(report, f, indent=4)
+
+
+if __name__ == '__main__':
+	main()
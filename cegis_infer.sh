@@ -10,7 +10,7 @@ else
 	echo -e "DATA_DIR\t$DATA_DIR"
 fi
 
-docker run --rm --user $(id -u):$(id -g) --cpuset-cpus="0-2" --gpus all \
+docker run --rm -e OCR_REQUEST_ID --user $(id -u):$(id -g) --cpuset-cpus="0-2" --gpus all \
 	-v $DATA_DIR:/data \
 	english_char_ocr:ravi \
 	python infer.py
\ No newline at end of file
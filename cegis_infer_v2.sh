@@ -10,7 +10,7 @@ else
 	echo -e "DATA_DIR\t$DATA_DIR"
 fi
 
-docker run --rm --user $(id -u):$(id -g) --gpus all --net host \
+docker run --rm -e OCR_REQUEST_ID --user $(id -u):$(id -g) --gpus all --net host \
 	-v $DATA_DIR:/data \
 	english_char_ocr:shaon \
 	python test.py
\ No newline at end of file
@@ -10,7 +10,7 @@ else
 	echo -e "DATA_DIR\t$DATA_DIR"
 fi
 
-docker run --rm --gpus all --net host \
+docker run --rm -e OCR_REQUEST_ID --gpus all --net host \
 	-v $DATA_DIR:/data \
 	english_char_ocr:v6_cegis \
 	python infer.py
@@ -16,7 +16,7 @@ else
 	echo -e "DATA_DIR\t$DATA_DIR"
 fi
 
-docker run --rm --net host \
+docker run --rm -e OCR_REQUEST_ID --net host \
 	-v $DATA_DIR:/data \
 	ocr:newpostprocess \
 	python infer.py
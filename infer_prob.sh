@@ -9,6 +9,13 @@ MODALITY="$1"
 LANGUAGE="$2"
 DATA_DIR="$3"
 VERSION="$4"
+# packed (prob.bin) or pts (prob.json)
+PROB_FORMAT="${5:-pts}"
+# only the images writing prob.bin take the format argument
+PROB_ARGS=""
+if [ "$PROB_FORMAT" = "packed" ]; then
+	PROB_ARGS="packed"
+fi
 
 
 echo "Performing Inference for $VERSION $LANGUAGE $MODALITY Task"
@@ -31,8 +38,8 @@ else
 	echo -e "DATA_DIR\t$DATA_DIR"
 fi
 
-docker run --rm --gpus all --net host \
+docker run --rm -e OCR_REQUEST_ID --gpus all --net host \
 	-v $MODEL_DIR:/model:ro \
 	-v $DATA_DIR:/data \
 	ocr:$VERSION \
-	python infer_prob.py $MODALITY $LANGUAGE
+	python infer_prob.py $MODALITY $LANGUAGE $PROB_ARGS
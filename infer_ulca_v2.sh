@@ -8,7 +8,7 @@
 MODALITY="$1"
 LANGUAGE="$2"
 VERSION="v2"
-DATA_DIR="/home/ocr/website/images"
+DATA_DIR="${3:-/home/ocr/website/images}"
 
 echo "Performing Inference for $LANGUAGE $MODALITY Task"
 
@@ -30,7 +30,7 @@ else
 	echo -e "DATA_DIR\t$DATA_DIR"
 fi
 
-docker run --rm --gpus all --net host \
+docker run --rm -e OCR_REQUEST_ID --gpus all --net host \
 	-v $MODEL_DIR:/model:ro \
 	-v $DATA_DIR:/data \
 	ocr:v2 \
@@ -22,4 +22,4 @@ fi
 CONTAINER_NAME="infer-$(echo $MODALITY)-$(echo $LANGUAGE)-$(echo $VERSION)"
 echo "Starting the inference in detached docker container: $CONTAINER_NAME"
 
-docker exec $CONTAINER_NAME bash infer.sh
+docker exec -e OCR_REQUEST_ID $CONTAINER_NAME bash infer.sh
@@ -32,7 +32,7 @@ else
 	echo -e "DATA_DIR\t$DATA_DIR"
 fi
 
-docker run --rm --gpus all --net host \
+docker run --rm -e OCR_REQUEST_ID --gpus all --net host \
 	-v $MODEL_DIR:/model:ro \
 	-v $DOCTR_DIR:/root/.cache/doctr:ro \
 	-v $DATA_DIR:/data \
@@ -11,16 +11,39 @@ from typing import List
 
 from dateutil.tz import gettz
 from fastapi import Depends, FastAPI, Form, Request, UploadFile, File
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
+from starlette.background import BackgroundTask
 
 from .dependencies import save_uploaded_images
 from .helper import *
-from .models import OCRImageResponse, OCRRequest, PostprocessRequest
+from .models import OCRImageResponse, PostprocessRequest
+from .modules.archive.images import image_archive
 from .modules.cegis.routes import router as cegis_router
 from .modules.ulca.routes import router as ulca_router
 from .modules.external.routes import router as external_router
 from .modules.iitb_v2.routes import router as iitb_v2_router
-from server.config import IMAGE_FOLDER
+from .modules.jobs.routes import router as jobs_router
+from .modules.registry.routes import router as registry_router
+from .modules.residency.routes import router as residency_router
+from .modules.ingest.download import close_client
+from .modules.core.serialization import encode_response, encoded_responses
+from .modules.core.streaming import STREAM_RESPONSES, stream_results, stream_type
+from .modules.core.tracing import (current_request_id, prefix_logs,
+                                   request_id_of)
+from .modules.postprocess.helper import (postprocess_words,
+                                         reject_packed_probabilities,
+                                         request_index, resolve_words,
+                                         word_probabilities)
+from .modules.logs.writer import close_writers
+from .modules.metrics.routes import router as metrics_router
+from .modules.metrics.timing import (RequestTimer, current_timer,
+                                     requests_in_flight, route_path)
+from .modules.postprocess.routes import router as lexicons_router
+from .modules.tesseract.engine import tesseract_pools
+from .modules.workers.pool import worker_pool
+from .modules.workspaces.manager import workspace_manager
+from server.config import IMAGE_FOLDER, POSTPROCESS_ENGINE, REQUEST_ID_HEADER
 
 from .database import close_mongo_connection, connect_to_mongo
 
@@ -38,21 +61,58 @@ app.add_middleware(
 	allow_credentials=True,
 )
 
+app.add_event_handler('startup', prefix_logs)
 app.add_event_handler('startup', connect_to_mongo)
+app.add_event_handler('startup', sync_loaded_models)
+app.add_event_handler('startup', workspace_manager.cleanup_stale)
+app.add_event_handler('startup', preload_models)
 app.add_event_handler('shutdown', close_mongo_connection)
+app.add_event_handler('shutdown', worker_pool.shutdown)
+app.add_event_handler('shutdown', close_client)
+app.add_event_handler('shutdown', tesseract_pools.shutdown)
+app.add_event_handler('shutdown', close_writers)
+app.add_event_handler('shutdown', image_archive.close)
 
 app.include_router(cegis_router)
 app.include_router(ulca_router)
 app.include_router(external_router)
 app.include_router(iitb_v2_router)
+app.include_router(residency_router)
+app.include_router(registry_router)
+app.include_router(lexicons_router)
+app.include_router(jobs_router)
+app.include_router(metrics_router)
 
 
 
+# the timezone of the logs, looked up once
+LOCAL_TZ = gettz('Asia/Kolkata')
+
+
 @app.middleware('http')
-async def log_request_timestamp(request: Request, call_next):
-	local_tz = gettz('Asia/Kolkata')
-	print(f'Received request at: {datetime.now(tz=local_tz).isoformat()}')
-	return await call_next(request)
+async def instrument_request(request: Request, call_next):
+	"""
+	assigns the request id (see server/modules/core/tracing.py) and times
+	the stages of the request (see server/modules/metrics/timing.py)
+	"""
+	request_id = request_id_of(request)
+	id_token = current_request_id.set(request_id)
+	timer = RequestTimer()
+	token = current_timer.set(timer)
+	print(f'Received request at: {datetime.now(tz=LOCAL_TZ).isoformat()} {request.method} {request.url.path}')
+	requests_in_flight.inc()
+	status = 500
+	try:
+		response = await call_next(request)
+		status = response.status_code
+		response.headers[REQUEST_ID_HEADER] = request_id
+		response.headers['Server-Timing'] = timer.server_timing()
+		return response
+	finally:
+		requests_in_flight.dec()
+		current_timer.reset(token)
+		current_request_id.reset(id_token)
+		timer.observe(route_path(request), request.method, status)
 
 
 @app.get('/ocr/ping', tags=['Testing'])
@@ -105,50 +165,27 @@ def save_uploaded_image(image: UploadFile) -> str:
 	'/ocr/infer',
 	tags=['OCR'],
 	response_model=List[OCRImageResponse],
-	response_model_exclude_none=True
+	response_model_exclude_none=True,
+	openapi_extra=OCR_REQUEST_BODY,
+	responses=encoded_responses(STREAM_RESPONSES),
 )
-def infer_ocr(ocr_request: OCRRequest) -> List[OCRImageResponse]:
-	tmp = TemporaryDirectory(prefix='ocr_images')
-	# tmp = CustomDir(name='/home/ocr/test')
-	process_images(ocr_request.imageContent, tmp.name)
-
-	lcode, language = process_language(ocr_request.language)
-	version = process_version(ocr_request.version)
-	modality = process_modality(ocr_request.modality)
-	print('before verification', language, version, modality)
-	verify_model(language, version, modality)
-	if 'bilingual' in version:
-		language = f'english_{language}'
-	print(language, version, modality)
-	if version == 'v0':
-		load_model(modality, language, version)
-		call(f'./infer_v0.sh {modality} {language}', shell=True)
-	elif version == 'v1_iitb':
-		call(f'./infer_v1_iitb.sh {modality} {language} {tmp.name}', shell=True)
-	elif version == 'v2_iitb':
-		call(f'./infer_v2_iitb.sh {modality} {lcode} {tmp.name}', shell=True)
-	elif version == 'v1_pu':
-		return call_page_pu(language, tmp.name)
-  elif version == 'v1_st_iitj':
-    call(f'./infer_v1_iitj.sh {modality} {langauge} {tmp.name}')
-	elif version == 'tesseract':
-    folder = tmp.name
-		call_tesseract(language, tmp.name)
-	elif version == 'tesseract_bi':
-		folder = tmp.name
-		return call_page_tesseract_bi(language, folder)
-	else:
-		if ocr_request.meta.get('include_probability', False):
-			call(
-				f'./infer_prob.sh {modality} {language} {tmp.name} {version}',
-				shell=True
-			)
-		else:
-			call(
-				f'./infer.sh {modality} {language} {tmp.name} {version}',
-				shell=True
-			)
-	return process_ocr_output(tmp.name)
+async def infer_ocr(request: Request) -> List[OCRImageResponse]:
+	# the body is read here, the images are written straight into the
+	# workspace of the request
+	with workspace_manager.create('ocr_infer') as workspace:
+		ocr_request, images = await read_ocr_request(request, workspace)
+		media_type = stream_type(request)
+		if media_type is None:
+			# the results are encoded as they are, response_model only documents them
+			results = await run_in_threadpool(infer_images, ocr_request, images, workspace.path)
+			return encode_response(request, results)
+		# the workspace is removed once all the results are streamed
+		workspace = workspace.handover()
+	return stream_results(
+		media_type,
+		stream_images(ocr_request, images, workspace.path),
+		BackgroundTask(workspace.cleanup),
+	)
 
 
 @app.post(
@@ -158,38 +195,35 @@ def infer_ocr(ocr_request: OCRRequest) -> List[OCRImageResponse]:
 	response_model_exclude_none=True
 )
 def infer_ocr(
-	images: List[UploadFile] = Depends(save_uploaded_images),
+	folder: str = Depends(save_uploaded_images),
 	language: LanguageEnum = Form(LanguageEnum.hi),
 	modality: ModalityEnum = Form(ModalityEnum.printed),
 	version: VersionEnum = Form(VersionEnum.v2),
 ) -> List[OCRImageResponse]:
-	print(images)
 	_, language = process_language(language)
 	version = process_version(version)
 	modality = process_modality(modality)
 
-	verify_model(language, version, modality)
-	if 'bilingual' in version:
-		language = f'english_{language}'
+	language = verify_model(language, version, modality).model_language
 	print(language, version, modality)
-	folder = '/home/ocr/website/images'
 	if version == 'v0':
-		load_model(modality, language, version)
-		call(f'./infer_v0.sh {modality} {language}', shell=True)
+		infer_v0(folder, modality, language)
 	elif version == 'v5_urdu':
 		call(
 			f'./infer.sh printed urdu {folder} v5_urdu',
-			shell=True
+			shell=True,
+			env=script_env(),
 		)
 	elif version == 'v1_iitb':
-		call(f'./infer_v1_iitb.sh {modality} {language} {folder}', shell=True)
+		call(f'./infer_v1_iitb.sh {modality} {language} {folder}', shell=True, env=script_env())
 	elif version == 'tesseract':
 		# call_tesseract(language, folder)
 		return call_page_tesseract(language, folder)
 	else:
 		call(
 			f'./infer.sh {modality} {language} {folder} {version}',
-			shell=True
+			shell=True,
+			env=script_env(),
 		)
 	return process_ocr_output(folder)
 	# if version == 'v0':
@@ -216,7 +250,17 @@ def OCR_newpostprocess(request: PostprocessRequest) -> List[PostprocessImageResp
 	This is the endpoint to postprocess the OCR output.
 	This endpoints takes the same input as OCRResponse and outputs
 	a list of acceptable alternatives for each word in the output.
+	With the native engine (POSTPROCESS_ENGINE) the alternatives are the
+	closest words by edit distance, whatever the language.
 	"""
+	if POSTPROCESS_ENGINE == 'native':
+		# the lexicon words are preferred over the vocabulary ones
+		index = request_index([
+			(request.lexicon, request.lexicon_id),
+			(request.vocabulary, request.vocabulary_id),
+		])
+		return postprocess_words(request.words, index, word_probabilities(request))
+	reject_packed_probabilities(request)
 	tmp = TemporaryDirectory(prefix='postprocess')
 	# main_folder = tmp.name
 	main_folder = '/home/ocr/temp'
@@ -229,9 +273,9 @@ def OCR_newpostprocess(request: PostprocessRequest) -> List[PostprocessImageResp
 	ocr_path = join(main_folder, 'ocr_output.txt')
 	lexicon_path = join(main_folder, 'lexicon.txt')
 	with open(vocab_path, 'w', encoding='utf-8') as f:
-		f.write('\n'.join(request.vocabulary))
+		f.write('\n'.join(resolve_words(request.vocabulary, request.vocabulary_id)))
 	with open(lexicon_path, 'w', encoding='utf-8') as f:
-		f.write('\n'.join(request.lexicon))
+		f.write('\n'.join(resolve_words(request.lexicon, request.lexicon_id)))
 	ocr_output = []
 	for i,v in enumerate(request.words):
 		print(f'processing for -> {i+1}')
@@ -243,7 +287,7 @@ def OCR_newpostprocess(request: PostprocessRequest) -> List[PostprocessImageResp
 	with open(ocr_path, 'w', encoding='utf-8') as f:
 		f.write('\n'.join(ocr_output))
 
-	call(f'./infer_newpostprocess.sh {main_folder}', shell=True)
+	call(f'./infer_newpostprocess.sh {main_folder}', shell=True, env=script_env())
 	a = open(join(main_folder, 'out.txt'), 'r', encoding='utf-8').read().strip().split('\n')
 	ret = []
 	for i in a:
@@ -267,7 +311,13 @@ def OCR_postprocess(request: PostprocessRequest) -> List[PostprocessImageRespons
 	This is the endpoint to postprocess the OCR output.
 	This endpoints takes the same input as OCRResponse and outputs
 	a list of acceptable alternatives for each word in the output.
+	With the native engine (POSTPROCESS_ENGINE) the alternatives are the
+	closest words by edit distance, whatever the language.
 	"""
+	if POSTPROCESS_ENGINE == 'native':
+		index = request_index([(request.vocabulary, request.vocabulary_id)])
+		return postprocess_words(request.words, index, word_probabilities(request))
+	reject_packed_probabilities(request)
 	tmp = TemporaryDirectory(prefix='postprocess')
 	# main_folder = tmp.name
 	main_folder = '/home/ocr/temp'
@@ -279,7 +329,7 @@ def OCR_postprocess(request: PostprocessRequest) -> List[PostprocessImageRespons
 	vocab_path = join(main_folder, 'vocabulary.txt')
 	ocr_path = join(main_folder, 'ocr_output.txt')
 	with open(vocab_path, 'w', encoding='utf-8') as f:
-		f.write('\n'.join(request.vocabulary))
+		f.write('\n'.join(resolve_words(request.vocabulary, request.vocabulary_id)))
 	ocr_output = []
 	for i,v in enumerate(request.words):
 		print(f'processing for -> {i+1}')
@@ -292,7 +342,7 @@ def OCR_postprocess(request: PostprocessRequest) -> List[PostprocessImageRespons
 		f.write('\n'.join(ocr_output))
 
 	_, language = process_language(request.language)
-	call(f'./infer_postprocess.sh {language} {main_folder}', shell=True)
+	call(f'./infer_postprocess.sh {language} {main_folder}', shell=True, env=script_env())
 	a = open(join(main_folder, 'out.txt'), 'r', encoding='utf-8').read().strip().split('\n')
 	ret = []
 	for i in a:
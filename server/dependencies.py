@@ -1,22 +1,17 @@
-import os
-import shutil
-from os.path import join
-from typing import List
+from typing import Iterator, List
 
 from fastapi import File, UploadFile
 
-from .config import IMAGE_FOLDER
+from .modules.workspaces.manager import workspace_manager
 
 
-def save_uploaded_images(images: List[UploadFile] = File(...)) -> str:
-	print('removing all the previous uploaded files from the image folder')
-	os.system(f'rm -rf {IMAGE_FOLDER}/*')
-	print(images)
-	print(f'Saving {len(images)} to location: {IMAGE_FOLDER}')
-	count = 1
-	for image in images:
-		location = join(IMAGE_FOLDER, f'{count}.jpg')
-		with open(location, 'wb') as f:
-			shutil.copyfileobj(image.file, f)
-		count += 1
-	return IMAGE_FOLDER
+def save_uploaded_images(images: List[UploadFile] = File(...)) -> Iterator[str]:
+	"""
+	saves the uploaded images in a workspace of the request and yields
+	its path, the workspace is removed once the response is sent
+	"""
+	with workspace_manager.create('ocr_test') as workspace:
+		print(f'Saving {len(images)} to location: {workspace.path}')
+		for count, image in enumerate(images, 1):
+			workspace.copy(f'{count}.jpg', image.file)
+		yield workspace.path
@@ -1,19 +1,43 @@
 import base64
-import random
 from PIL import Image
 from tqdm import tqdm
-import json
 import os
-from os.path import basename, join
+import shutil
+import threading
+import time
+from os.path import join
 from subprocess import call, check_output
-from typing import List, Tuple
+from typing import AsyncIterator, Dict, List, Optional, Tuple
 
-import pytesseract
-from fastapi import HTTPException
+from fastapi import HTTPException, Request
+from fastapi.concurrency import run_in_threadpool
 
-from server.config import LANGUAGES, NUMBER_LOADED_MODEL_THRESHOLD, TESS_LANG
+from server.config import (BATCH_MAX_SIZE, BATCH_MAX_WAIT, BATCH_OVERRIDES,
+                           IMAGE_FOLDER, LANGUAGES,
+                           NUMBER_LOADED_MODEL_THRESHOLD, PROB_FORMAT,
+                           RESIDENCY_POLICY, STREAM_CHUNK_SIZE,
+                           TESSERACT_REQUEST_PARALLELISM, WORKER_POOL_ENABLED)
 
 from .models import *
+from .modules.core.serialization import loads
+from .modules.metrics.timing import set_model, stage
+from .modules.core.tensors import read_probabilities
+from .modules.core.tracing import script_env
+from .modules.cache.results import astream_with_cache, infer_with_cache
+from .modules.registry.capabilities import Capability, model_registry
+from .modules.ingest.stream import (StreamedImage, ingest_frames, ingest_json,
+                                    ingest_multipart, parse_streamed,
+                                    request_body)
+from .modules.residency.manager import ResidencyManager
+from .modules.tesseract.engine import (open_image, pad_image,
+                                      tesseract_language, tesseract_pools)
+from .modules.workers.batching import BatchScheduler
+from .modules.workers.pool import WorkerError, worker_pool
+from .modules.workspaces.manager import Workspace
+
+v0_residency = ResidencyManager('v0', NUMBER_LOADED_MODEL_THRESHOLD, RESIDENCY_POLICY)
+v0_lock = threading.Lock()
+v0_folder_lock = threading.Lock()
 
 
 def check_loaded_model() -> List[Tuple[str, str, str]]:
@@ -30,40 +54,121 @@ def check_loaded_model() -> List[Tuple[str, str, str]]:
 	return [tuple(i.split('-')[1:]) for i in a]
 
 
+def sync_loaded_models() -> None:
+	"""
+	registers the v0 containers that are already running (eg. started
+	before a reload of the api) with the residency manager.
+	"""
+	try:
+		loaded_model = check_loaded_model()
+	except Exception as e:
+		print(f'unable to list the loaded models: {e}')
+		return
+	v0_residency.sync(
+		(i[2], i[0], i[1]) for i in loaded_model if len(i) == 3
+	)
+
+
 def load_model(modality: str, language: str, modelid: str) -> None:
 	"""
-	This function calls the load_v0.sh bash file to start the
-	model flask server.
+	This function calls the load.sh bash file to start the
+	model flask server. The running containers are tracked by the
+	residency manager, so docker is not queried on every request.
 	"""
-	loaded_model = check_loaded_model()
-	if tuple([modality, language, modelid]) not in loaded_model:
-		if (len(loaded_model) >= NUMBER_LOADED_MODEL_THRESHOLD):
-			print('unloading the oldest model')
-			call('./unload_oldest.sh', shell=True)
+	key = (modelid, modality, language)
+	with v0_lock:
+		if v0_residency.hit(key):
+			print('model already loaded. No need to reload')
+			return
+		for version, old_modality, old_language in v0_residency.evict_for(key):
+			print(f'unloading the model {version} {old_modality} {old_language}')
+			call(
+				f'./unload.sh {old_modality} {old_language} {version}',
+				shell=True,
+				env=script_env(),
+			)
 		print('loading the new model')
+		start = time.time()
 		call(
-			f'./load.sh {modality} {language} {modelid} /home/ocr/website/images',
-			shell=True
+			f'./load.sh {modality} {language} {modelid} {IMAGE_FOLDER}',
+			shell=True,
+			env=script_env(),
 		)
-	else:
-		print('model already loaded. No need to reload')
+		v0_residency.loaded(key, time.time() - start)
 
 
+def infer_v0(folder: str, modality: str, language: str) -> None:
+	"""
+	the v0 containers are started with IMAGE_FOLDER mounted, so the images
+	of the folder are copied there and the output is copied back.
+	only one request can use the IMAGE_FOLDER at a time.
+	"""
+	with v0_folder_lock:
+		with stage('start'):
+			load_model(modality, language, 'v0')
+		for name in os.listdir(IMAGE_FOLDER):
+			path = join(IMAGE_FOLDER, name)
+			if os.path.isdir(path):
+				shutil.rmtree(path)
+			else:
+				os.remove(path)
+		for name in os.listdir(folder):
+			shutil.copy(join(folder, name), IMAGE_FOLDER)
+		with stage('inference'):
+			call(f'./infer_v0.sh {modality} {language}', shell=True, env=script_env())
+		for name in ('out.json', 'prob.json'):
+			if os.path.exists(join(IMAGE_FOLDER, name)):
+				shutil.copy(join(IMAGE_FOLDER, name), folder)
 
-def process_images(images: List[str], save_path) -> None:
+
+def decode_images(images: List[str]) -> List[bytes]:
 	"""
-	processes all the images in the given list.
-	it saves all the images in the save_path folder.
+	decodes all the base64 encoded images in the given list.
 	"""
+	ret = []
 	for idx, image in enumerate(images):
 		try:
-			with open(join(save_path, f'{idx}.jpg'), 'wb') as f:
-				f.write(base64.b64decode(image))
+			ret.append(base64.b64decode(image))
 		except:
 			raise HTTPException(
 				status_code=400,
 				detail=f'Error while decoding and saving the image #{idx}',
 			)
+	return ret
+
+
+def save_images(images: List[bytes], save_path) -> None:
+	"""
+	saves all the decoded images in the save_path folder as <index>.jpg
+	"""
+	for idx, image in enumerate(images):
+		with open(join(save_path, f'{idx}.jpg'), 'wb') as f:
+			f.write(image)
+
+
+def link_images(paths: List[str], save_path) -> None:
+	"""
+	links (or copies when not possible, eg. across filesystems) the saved
+	images in the save_path folder as <index>.jpg
+	"""
+	link = True
+	for idx, path in enumerate(paths):
+		if link:
+			try:
+				os.link(path, join(save_path, f'{idx}.jpg'))
+				continue
+			except OSError as e:
+				print(f'unable to link the images into {save_path}, copying them: {e}')
+				link = False
+		shutil.copyfile(path, join(save_path, f'{idx}.jpg'))
+
+
+def process_images(images: List[str], save_path) -> None:
+	"""
+	processes all the images in the given list.
+	it saves all the images in the save_path folder.
+	"""
+	save_images(decode_images(images), save_path)
 
 
 def process_language(lcode: LanguageEnum) -> Tuple[str, str]:
@@ -76,167 +181,291 @@ def process_version(ver_no: VersionEnum) -> str:
 	return ver_no.value
 
 
-def verify_model(language, version, modality):
+def verify_model(language, version, modality) -> Capability:
 	"""
-	function that raises httpexception if the model is not available.
+	returns the capability of the model, raises httpexception if the model
+	is not available.
+	"""
+	return model_registry.verify(version, modality, language)
+
+
+def image_index(name: str) -> int:
+	"""
+	returns the index of the image from its filename, eg. 12 for 12.jpg
+	"""
+	return int(name.partition('.')[0])
+
+
+def parse_ocr_results(out: Dict[str, str], probs: Optional[Dict] = None) -> List[OCRImageResponse]:
+	"""
+	converts the out.json (and prob.json) content to the ocr response.
+	the images are sorted by their index in the filename. the output of
+	the models is trusted, so the responses are not validated again.
+	"""
+	names = sorted(out, key=image_index)
+	if probs is not None:
+		return [OCRImageResponse.construct(text=out[i], meta=probs[i]) for i in names]
+	return [OCRImageResponse.construct(text=out[i], meta={}) for i in names]
+
+
+def process_ocr_output(image_folder: str) -> List[OCRImageResponse]:
+	"""
+	process the <folder>/out.json file and returns the ocr response.
 	"""
-	minor_languages = [
-		'bodo',
-		'dogri',
-		'kashmiri',
-		'konkani',
-		'maithili',
-		'nepali',
-		'sanskrit',
-		'santali',
-		'sindhi',
-	]
 	try:
-		# support for minor languages
-		if language in minor_languages:
-			assert version == 'v4_robust'
-		elif version == 'v2':
-			assert language != 'english'
-		elif version == 'v2_robust':
-			assert modality == 'printed'
-		elif version == 'v2.1_robust':
-			# upnishad fine-tuned robust model
-			assert modality  == 'printed' and language == 'telugu'
-		elif version == 'v2_bilingual':
-			assert modality == 'printed' and language not in [
-				'english',
-				'hindi',
-				'urdu'
-			]
-		elif version == 'v3':
-			assert modality == 'handwritten'
-		elif version == 'v3_post':
-			assert modality == 'handwritten'
-		elif version == 'v3_robust':
-			assert modality == 'printed' and language not in [
-				'assamese',
-				'hindi',
-				'urdu'
-			]
-		elif version == 'v3.1_robust':
-			assert modality == 'printed' and language == 'telugu'
-		elif version == 'v3_bilingual':
-			assert modality  == 'printed' and language == 'telugu'
-		elif version == 'v3.1_bilingual':
-			assert modality  == 'printed' and language == 'telugu'
-		elif version in ['v4', 'v4_robust']:
-			assert modality == 'printed' and language != 'urdu'
-		elif version in ['v4_bilingual', 'v4_robustbilingual']:
-			assert modality == 'printed' and language not in ['english', 'urdu']
-		elif any((
-			version.startswith('v4.4'),
-			version.startswith('v4.11'),
-			version.startswith('v4.15'),
-			version.startswith('v4.16'),
-			version.startswith('v4.17'),
-		)):
-			assert modality == 'printed' and language == 'hindi'
-		elif any((
-			version.startswith('v4.13'),
-		)):
-			assert modality == 'printed' and language == 'english'
-		elif any((
-			version.startswith('v4.1'),
-			version.startswith('v4.2'),
-			version.startswith('v4.3'),
-			version.startswith('v4.5'),
-			version.startswith('v4.7'),
-			version.startswith('v4.8'),
-			version.startswith('v4.9'),
-			version.startswith('v4.10'),
-			version.startswith('v4.12'),
-			version.startswith('v4.14'),
-		)):
-			assert modality == 'printed' and language == 'telugu'
-		elif any((
-			version.startswith('v4.6'),
-		)):
-			assert modality == 'printed' and language == 'bengali'
-		elif version == 'v1_iitb':
-			assert modality == 'handwritten' and language not in [
-				'assamese',
-				'kannada',
-				'malayalam',
-				'manipuri',
-				'marathi'
-			] or modality == 'printed' and language in [
-				'hindi',
-				'kannada',
-				'marathi',
-				'tamil',
-				'telugu',
-			]
-		elif version == 'tesseract':
-			assert modality == 'printed' and language != 'manipuri'
-		elif version == 'v3_st':
-			assert modality == 'scenetext' and language != 'english'
-		elif version == 'v4_hw':
-			assert modality == 'handwritten' and language not in [
-				'assamese',
-				'english',
-				'manipuri',
-				'marathi',
-			]
-        elif version == 'v1_st_iitj':
-            assert modality == 'scenetext' and language not in [
-                    'hindi',
-                    'english',
-                    'assamese',
-                    'malayalam',
-                    'punjabi',
-                    'tamil',
-            ]
-	except AssertionError:
-		raise HTTPException(
-			status_code=400,
-			detail=f'No model available for {language} {version} {modality}'
-		)
+		with stage('parse'):
+			with open(join(image_folder, 'out.json'), 'rb') as f:
+				a = loads(f.read())
+			probs = None
+			prob_path = join(image_folder, 'prob.json')
+			packed_path = join(image_folder, 'prob.bin')
+			if os.path.exists(packed_path):
+				probs = read_probabilities(packed_path, sorted(a, key=image_index))
+			elif os.path.exists(prob_path):
+				with open(prob_path, 'rb') as f:
+					probs = loads(f.read())
+			return parse_ocr_results(a, probs)
 	except Exception as e:
 		print(e)
 		raise HTTPException(
 			status_code=500,
-			detail='Unknown exception while verifing the models'
+			detail='Error while parsing the ocr output'
 		)
 
 
-def process_ocr_output(image_folder: str) -> List[OCRImageResponse]:
+def infer_folder(
+	folder: str,
+	lcode: str,
+	language: str,
+	version: str,
+	modality: str,
+	include_probability: bool = False,
+) -> List[OCRImageResponse]:
 	"""
-	process the <folder>/out.json file and returns the ocr response.
+	runs the model on all the images inside the folder and returns one
+	result per image in the order of the image index.
+	the backend of the model is taken from the model registry.
 	"""
-	sorting_func = lambda x:int(x[0].split('.')[0])
-	try:
-		with open(join(image_folder, 'out.json'), 'r', encoding='utf-8') as f:
-			a = f.read().strip()
-		a = json.loads(a)
-		a = list(a.items())
-		a = sorted(a, key=sorting_func)
-		prob_path = join(image_folder, 'prob.json')
-		if os.path.exists(prob_path):
-			with open(prob_path, 'r', encoding='utf-8') as f:
-				probs = f.read().strip()
-			probs = json.loads(probs)
-			return [OCRImageResponse(text=i[1], meta=probs[i[0]]) for i in a]
-		return [OCRImageResponse(text=i[1]) for i in a]
-	except Exception as e:
-		print(e)
+	capability = model_registry.model(version, modality, language)
+	backend = capability.backend if capability is not None else 'worker'
+	prob_format = capability.prob_format if capability is not None else PROB_FORMAT
+	if backend == 'v0':
+		infer_v0(folder, modality, language)
+	elif backend == 'script':
+		with stage('inference'):
+			call(capability.command.format(
+				modality=modality,
+				language=language,
+				lcode=lcode,
+				folder=folder,
+				version=version,
+			), shell=True, env=script_env())
+	elif backend == 'tesseract':
+		with stage('inference'):
+			return call_tesseract(language, folder)
+	else:
+		if WORKER_POOL_ENABLED:
+			try:
+				out, probs = worker_pool.infer(
+					(version, modality, language),
+					folder,
+					include_probability=include_probability,
+					prob_format=prob_format,
+				)
+				with stage('parse'):
+					return parse_ocr_results(out, probs)
+			except WorkerError as e:
+				print(f'{e}. falling back to the inference scripts')
+		with stage('inference'):
+			if include_probability:
+				call(
+					f'./infer_prob.sh {modality} {language} {folder} {version} {prob_format}',
+					shell=True,
+					env=script_env(),
+				)
+			else:
+				call(
+					f'./infer.sh {modality} {language} {folder} {version}',
+					shell=True,
+					env=script_env(),
+				)
+	return process_ocr_output(folder)
+
+
+def call_page_level(
+	language: str,
+	version: str,
+	modality: str,
+	folder: str,
+) -> Optional[List[OCRImageResponse]]:
+	"""
+	runs the page level models, which return the words of a page instead
+	of one result per image. returns None for the other models.
+	"""
+	capability = model_registry.model(version, modality, language)
+	if capability is None or not capability.page_level:
+		return None
+	with stage('inference'):
+		if capability.backend == 'page_pu':
+			return call_page_pu(language, folder)
+		return call_page_tesseract_bi(language, folder)
+
+
+def preload_models() -> None:
+	"""
+	starts the workers of the models marked with preload in the registry,
+	in the background so that the api starts right away
+	"""
+	def preload():
+		for capability in models:
+			try:
+				worker_pool.get(capability.key)
+			except WorkerError as e:
+				print(f'unable to preload {capability.key}: {e}')
+
+	models = [i for i in model_registry.preloaded() if i.backend == 'worker']
+	if models and WORKER_POOL_ENABLED:
+		threading.Thread(target=preload, daemon=True).start()
+
+
+def response_dict(response: OCRImageResponse) -> Dict:
+	"""
+	returns the response as a dict without copying its meta, the meta of
+	the results with probabilities is large
+	"""
+	return {'text': response.text, 'meta': response.meta if response.meta is not None else {}}
+
+
+def run_batch(key: Tuple[str, str, str, str, bool], images: List[str]) -> List[Dict]:
+	"""
+	runs one batch of the batch scheduler, the key is
+	(version, modality, language, lcode, include_probability) and the
+	images are the paths of the saved images
+	"""
+	version, modality, language, lcode, include_probability = key
+	with worker_pool.workspace(prefix='ocr_batch') as folder:
+		link_images(images, folder)
+		ret = infer_folder(folder, lcode, language, version, modality, include_probability)
+	if len(ret) != len(images):
+		print(f'expected {len(images)} results from the model, got {len(ret)}')
 		raise HTTPException(
 			status_code=500,
 			detail='Error while parsing the ocr output'
 		)
+	return [response_dict(i) for i in ret]
+
+
+batch_scheduler = BatchScheduler(
+	run_batch,
+	max_batch_size=BATCH_MAX_SIZE,
+	max_wait=BATCH_MAX_WAIT,
+	overrides={**model_registry.batch_overrides(), **BATCH_OVERRIDES},
+)
+
+
+# documents the bodies accepted by read_ocr_request
+OCR_REQUEST_BODY = request_body(OCRRequest, {
+	'multipart/form-data': {'schema': {
+		'type': 'object',
+		'description': 'the fields of the json body, the images are sent as files and meta as json',
+		'properties': {
+			'images': {'type': 'array', 'items': {'type': 'string', 'format': 'binary'}},
+			'language': {'type': 'string'},
+			'version': {'type': 'string'},
+			'modality': {'type': 'string'},
+			'meta': {'type': 'string'},
+		},
+		'required': ['images', 'language'],
+	}},
+	'application/octet-stream': {'schema': {
+		'type': 'string',
+		'format': 'binary',
+		'description': (
+			'frames of a 4 byte big endian length followed by the data, '
+			'the first frame is the json of the fields without imageContent, '
+			'the others are the images'
+		),
+	}},
+})
+
+
+async def read_ocr_request(
+	request: Request,
+	workspace: Workspace,
+) -> Tuple[OCRRequest, Dict[int, StreamedImage]]:
+	"""
+	reads an OCRRequest sent as json, multipart/form-data or length
+	prefixed frames, the images are written straight into the workspace
+	"""
+	content_type = request.headers.get('content-type', '')
+	with stage('decode'):
+		if content_type.startswith('multipart/form-data'):
+			body, images = await ingest_multipart(request, workspace)
+		elif content_type.startswith('application/octet-stream'):
+			body, images = await ingest_frames(request, workspace)
+		else:
+			body, images = await ingest_json(request, workspace, ('imageContent', '*'))
+	return parse_streamed(OCRRequest, body), images
+
+
+def process_request(
+	ocr_request: OCRRequest,
+	images: Dict[int, StreamedImage],
+) -> Tuple[str, str, str, str, bool]:
+	"""
+	validates the request and returns the
+	(lcode, language, version, modality, include_probability) of the model
+	"""
+	if sorted(images) != list(range(len(ocr_request.imageContent))):
+		raise HTTPException(
+			status_code=400,
+			detail='imageContent should only contain base64 encoded images'
+		)
+	lcode, language = process_language(ocr_request.language)
+	version = process_version(ocr_request.version)
+	modality = process_modality(ocr_request.modality)
+	print('before verification', language, version, modality)
+	language = verify_model(language, version, modality).model_language
+	set_model(version, modality, language)
+	print(language, version, modality)
+	include_probability = ocr_request.meta.get('include_probability', False)
+	return lcode, language, version, modality, include_probability
+
+
+def infer_images(
+	ocr_request: OCRRequest,
+	images: Dict[int, StreamedImage],
+	folder: str,
+) -> List[Dict]:
+	"""
+	runs the requested model on the images streamed into the folder,
+	returns the result dict of each image
+	"""
+	lcode, language, version, modality, include_probability = process_request(
+		ocr_request,
+		images,
+	)
+
+	page = call_page_level(language, version, modality, folder)
+	if page is not None:
+		return [response_dict(i) for i in page]
+
+	# the missing images are batched with the concurrent requests for the model
+	results = infer_with_cache(
+		[images[i].digest for i in range(len(images))],
+		(version, modality, language),
+		lambda missing: batch_scheduler.submit(
+			(version, modality, language, lcode, include_probability),
+			[images[i].path for i in missing],
+		),
+		include_probability,
+	)
+	return results
 
 
 def add_padding(images, size: int):
 	for image in tqdm(images, desc='Adding Padding'):
-		img = Image.open(image)
-		w,h = img.size
-		out = Image.new(img.mode, (w+size*2, h+size*2), (255,255,255))
-		out.paste(img, (size, size))
-		out.save(image)
+		pad_image(open_image(image), size).save(image)
 
 def call_page_pu(language, folder):
 	a = [join(folder, i) for i in os.listdir(folder)]
@@ -254,51 +483,90 @@ def call_page_pu(language, folder):
 		OCRImageResponse(text=ret, meta={})
 	]
 
-def call_page_tesseract(language, folder):
-	a = [join(folder, i) for i in os.listdir(folder)]
-	ret = pytesseract.image_to_data(a[0], lang=TESS_LANG[language]).strip().split('\n')
-	del ret[0]
-	ret = [i.split('\t')[6:] for i in ret if i[10]!='-1']
-	out = []
-	for i in ret:
-		out.append(
-			OCRImageResponse(
-				text=i[-1].strip(),
-				meta={'coords': list(map(int, i[:4]))}
-			)
-		)
-	return out
+def call_page_tesseract(language, folder, bilingual: bool = False):
+	"""
+	recognises the words of all the images of the folder concurrently.
+	the words are grouped per image in the order of the index, meta has
+	their coords and the position of their image.
+	"""
+	a = sorted(os.listdir(folder), key=image_index)
+	a = [join(folder, i) for i in a]
+	pages = tesseract_pools.words(
+		tesseract_language(language, bilingual),
+		a,
+		max_parallel=TESSERACT_REQUEST_PARALLELISM,
+	)
+	return [
+		OCRImageResponse(text=text, meta={'coords': coords, 'image': idx})
+		for idx, words in enumerate(pages)
+		for text, coords in words
+	]
 
 def call_page_tesseract_bi(language, folder):
-	a = [join(folder, i) for i in os.listdir(folder)]
-	ret = pytesseract.image_to_data(a[0], lang=f'eng+{TESS_LANG[language]}').strip().split('\n')
-	del ret[0]
-	ret = [i.split('\t')[6:] for i in ret if i[10]!='-1']
-	out = []
-	for i in ret:
-		out.append(
-			OCRImageResponse(
-				text=i[-1].strip(),
-				meta={'coords': list(map(int, i[:4]))}
-			)
-		)
-	return out
+	return call_page_tesseract(language, folder, bilingual=True)
 
 def call_page_tesseract2(language, folder, bilingual: bool = False):
 	a = [join(folder, i) for i in os.listdir(folder)]
-	if bilingual:
-		ret = pytesseract.image_to_string(a[0], lang='eng+'+TESS_LANG[language]).strip()
-	else:
-		ret = pytesseract.image_to_string(a[0], lang=TESS_LANG[language]).strip()
-	return {'text': ret}
+	lang = tesseract_language(language, bilingual)
+	return {'text': tesseract_pools.text(lang, a[:1])[0]}
 
 
-def call_tesseract(language, folder):
-	a = os.listdir(folder)
+def call_tesseract(language, folder) -> List[OCRImageResponse]:
+	"""
+	recognises the <index>.jpg images of the folder, the images are padded
+	in memory and the results are returned in the order of the index
+	"""
+	a = sorted(os.listdir(folder), key=image_index)
 	a = [join(folder, i) for i in a]
-	add_padding(a, random.randint(10, 10))
-	ret = {}
-	for i in tqdm(a):
-		ret[basename(i)] = pytesseract.image_to_string(i, lang=TESS_LANG[language]).strip()
-	with open(join(folder, 'out.json'), 'w', encoding='utf-8') as f:
-		f.write(json.dumps(ret, indent=4))
+	texts = tesseract_pools.text(
+		tesseract_language(language),
+		a,
+		padding=10,
+		max_parallel=TESSERACT_REQUEST_PARALLELISM,
+	)
+	return [OCRImageResponse(text=i) for i in texts]
+
+
+async def stream_images(
+	ocr_request: OCRRequest,
+	images: Dict[int, StreamedImage],
+	folder: str,
+	chunk_size: int = STREAM_CHUNK_SIZE,
+) -> AsyncIterator[Tuple[int, Dict]]:
+	"""
+	streaming version of infer_images,
+	yields the (index, result) of the images as soon as they are available,
+	the cached ones first and then the others chunk_size images at a time
+	"""
+	lcode, language, version, modality, include_probability = await run_in_threadpool(
+		process_request,
+		ocr_request,
+		images,
+	)
+	if model_registry.model(version, modality, language).page_level:
+		# the page level models return the words of the page at once
+		for idx, result in enumerate(await run_in_threadpool(
+			infer_images,
+			ocr_request,
+			images,
+			folder,
+		)):
+			yield idx, result
+		return
+
+	async def infer(missing: List[int]) -> AsyncIterator[Tuple[List[int], List[Dict]]]:
+		for start in range(0, len(missing), chunk_size):
+			indices = missing[start:start + chunk_size]
+			yield indices, await run_in_threadpool(
+				batch_scheduler.submit,
+				(version, modality, language, lcode, include_probability),
+				[images[i].path for i in indices],
+			)
+
+	async for idx, result in astream_with_cache(
+		[images[i].digest for i in range(len(images))],
+		(version, modality, language),
+		infer,
+		include_probability,
+	):
+		yield idx, result
@@ -1,7 +1,9 @@
 from enum import Enum
 from typing import Any, Dict, List, Optional
 
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, root_validator
+
+from .modules.registry.capabilities import model_registry
 
 
 class LevelEnum(str, Enum):
@@ -47,96 +49,10 @@ class LevelEnum(str, Enum):
 	paragraph = 'paragraph'
 	page = 'page'
 
-class VersionEnum(str, Enum):
-	v0 = 'v0'
-	v2 = 'v2'
-	v2_bilingual = 'v2_bilingual'
-	v2_robust = 'v2_robust'
-	v2_1_robust = 'v2.1_robust'
-	v3 = 'v3'
-	v3_post = 'v3_post'
-	v3_robust = 'v3_robust'
-	v3_1_robust = 'v3.1_robust'
-	v3_bilingual = 'v3_bilingual'
-	v3_1_bilingual = 'v3.1_bilingual'
-	v4 = 'v4'
-	v4_robust = 'v4_robust'
-	v4_bilingual = 'v4_bilingual'
-	v4_robustbilingual = 'v4_robustbilingual'
-	v4_1 = 'v4.1'
-	v4_1_robust = 'v4.1_robust'
-	v4_1_bilingual = 'v4.1_bilingual'
-	v4_1_robustbilingual = 'v4.1_robustbilingual'
-	v4_2 = 'v4.2'
-	v4_2_robust = 'v4.2_robust'
-	v4_2_bilingual = 'v4.2_bilingual'
-	v4_2_robustbilingual = 'v4.2_robustbilingual'
-	v4_3u = 'v4.3u'
-	v4_3u_robust = 'v4.3u_robust'
-	v4_3u_bilingual = 'v4.3u_bilingual'
-	v4_3u_robustbilingual = 'v4.3u_robustbilingual'
-	v4_4l = 'v4.4l'
-	v4_4l_robust = 'v4.4l_robust'
-	v4_4l_bilingual = 'v4.4l_bilingual'
-	v4_4l_robustbilingual = 'v4.4l_robustbilingual'
-	v4_5u = 'v4.5u'
-	v4_5u_robust = 'v4.5u_robust'
-	v4_5u_bilingual = 'v4.5u_bilingual'
-	v4_5u_robustbilingual = 'v4.5u_robustbilingual'
-	v1_iitb = 'v1_iitb'
-	v4_6_robust = 'v4.6_robust'
-	v4_7u = 'v4.7u'
-	v4_7u_robust = 'v4.7u_robust'
-	v4_8u = 'v4.8u'
-	v4_8u_robust = 'v4.8u_robust'
-	v4_9u = 'v4.9u'
-	v4_9u_robust = 'v4.9u_robust'
-	v4_10u = 'v4.10u'
-	v4_10u_robust = 'v4.10u_robust'
-	v4_11l = 'v4.11l'
-	v4_11l_robust = 'v4.11l_robust'
-	v4_11l_bilingual = 'v4.11l_bilingual'
-	v4_11l_robustbilingual = 'v4.11l_robustbilingual'
-	v4_12u = 'v4.12u'
-	v4_13 = 'v4.13'
-	v3_st = 'v3_st'
-	v4_hw = 'v4_hw'
-	v4_14u = 'v4.14u'
-	v4_14u_robust = 'v4.14u_robust'
-	v4_15a_robust = 'v4.15a_robust'
-	v4_16a_robust = 'v4.16a_robust'
-	v4_17a_robust = 'v4.17a_robust'
-	v5 = 'v5'
-	v5_robust = 'v5_robust'
-	v5_bilingual = 'v5_bilingual'
-	v5_robustbilingual = 'v5_robustbilingual'
-	v5_robuster = 'v5_robuster'
-	v5_robusterbilingual = 'v5_robusterbilingual'
-	v5_urdu1 = 'v5_urdu1'
-	v5_urdu2 = 'v5_urdu2'
-	v5_urdu3 = 'v5_urdu3'
-	v5_urdur1 = 'v5_urdur1'
-	v5_urdur2 = 'v5_urdur2'
-
-	# First V5 Upnishad Finetune
-	v5_1_1u = 'v5.1.1u'
-	v5_1_2u = 'v5.1.2u'
-	v5_1_3u = 'v5.1.3u'
-	v5_1_1u_robust = 'v5.1.1u_robust'
-	v5_1_2u_robust = 'v5.1.2u_robust'
-	v5_1_1u_bilingual = 'v5.1.1u_bilingual'
-	v5_1_2u_bilingual = 'v5.1.2u_bilingual'
-	v5_1_3u_bilingual = 'v5.1.3u_bilingual'
-	v5_1_1u_robustbilingual = 'v5.1.1u_robustbilingual'
-	v5_1_2u_robustbilingual = 'v5.1.2u_robustbilingual'
-
-	lipikar = 'lipikar'
-	v1_pu = 'v1_pu'
-	v2_iitb = 'v2_iitb'
-
-	tesseract = 'tesseract'
-  v1_st_iitj = 'v1_st_iitj'
-	tesseract_bi = 'tesseract_bi'
+# generated from the model registry, eg. VersionEnum.v4_1_robust = 'v4.1_robust'
+VersionEnum = Enum('VersionEnum', [
+	(i.replace('.', '_'), i) for i in model_registry.versions
+], type=str)
 
 
 class OCRRequest(BaseModel):
@@ -181,9 +97,30 @@ class OCRImageResponse(BaseModel):
 
 class PostprocessRequest(BaseModel):
 	language: LanguageEnum
-	vocabulary: List[str]
+	vocabulary: Optional[List[str]] = None
 	lexicon: Optional[List[str]] = []
+	vocabulary_id: Optional[str] = Field(
+		None,
+		description='Handle of a vocabulary registered with /ocr/lexicons, replaces vocabulary'
+	)
+	lexicon_id: Optional[str] = Field(
+		None,
+		description='Handle of a lexicon registered with /ocr/lexicons, replaces lexicon'
+	)
 	words: List[OCRImageResponse]
+	probabilities: Optional[str] = Field(
+		None,
+		description=(
+			'base64 of the data_prob and max_prob of all the words in the packed '
+			'tensor format, replaces the probabilities in the meta of the words'
+		)
+	)
+
+	@root_validator(skip_on_failure=True)
+	def check_vocabulary(cls, values):
+		if values.get('vocabulary') is None and not values.get('vocabulary_id'):
+			raise ValueError('either vocabulary or vocabulary_id is required')
+		return values
 
 
 class PostprocessImageResponse(BaseModel):
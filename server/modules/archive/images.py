@@ -0,0 +1,177 @@
+"""
+Archive of the images uploaded to the ulca and iitb routes.
+
+The images are stored once per content, under their sha256 in sharded
+folders (<folder>/ab/cd/abcd....jpg), by a background thread. The requests
+only queue the images that are not known to be archived already, the queue
+is bounded by the size of the images in it and the new images are dropped
+when it is full. The archive can be sampled (a deterministic share of the
+distinct images, chosen by their hash) and throttled (at most max_rate
+images written per second).
+"""
+
+import os
+import queue
+import threading
+import time
+from collections import OrderedDict
+from os.path import join
+from typing import List, Optional, Tuple
+
+from server.config import (ARCHIVE_FOLDER, ARCHIVE_MAX_RATE,
+                           ARCHIVE_QUEUE_BYTES, ARCHIVE_SAMPLE_RATE)
+
+
+class ImageArchive:
+
+	def __init__(
+		self,
+		folder: str,
+		sample_rate: float = 1.0,
+		max_rate: Optional[float] = None,
+		max_bytes: int = 256 * 1024 * 1024,
+		known_items: int = 100000,
+	):
+		self.folder = folder
+		self.sample_rate = sample_rate
+		self.max_rate = max_rate
+		self.max_bytes = max_bytes
+		self.known_items = known_items
+		self.queue: 'queue.Queue[Optional[Tuple[str, bytes]]]' = queue.Queue()
+		self.queued_bytes = 0
+		# digests archived (or queued) recently, they are not queued again
+		self.known: 'OrderedDict[str, None]' = OrderedDict()
+		self.lock = threading.Lock()
+		self.thread: Optional[threading.Thread] = None
+		self.archived = 0
+		self.skipped = 0
+		self.dropped = 0
+
+	def path(self, digest: str) -> str:
+		return join(self.folder, digest[:2], digest[2:4], f'{digest}.jpg')
+
+	def sampled(self, digest: str) -> bool:
+		return int(digest[:8], 16) < self.sample_rate * 0x100000000
+
+	def wanted(self, digest: str) -> bool:
+		"""
+		whether the image has to be archived, false for the images that are
+		not sampled or known to be archived
+		"""
+		if not self.sampled(digest):
+			return False
+		with self.lock:
+			if digest in self.known:
+				self.known.move_to_end(digest)
+				self.skipped += 1
+				return False
+		return True
+
+	def archive(self, digest: str, image: bytes) -> bool:
+		"""
+		queues the image, returns False if it is not archived
+		"""
+		if not self.wanted(digest):
+			return False
+		return self._queue(digest, image)
+
+	def archive_files(self, images: List[Tuple[str, str]]) -> None:
+		"""
+		queues the (path, digest) of the images, they are read right away as
+		the files are usually removed with the request
+		"""
+		for path, digest in images:
+			if not self.wanted(digest):
+				continue
+			try:
+				with open(path, 'rb') as f:
+					image = f.read()
+			except OSError as e:
+				print(f'unable to archive {path}: {e}')
+				continue
+			self._queue(digest, image)
+
+	def _queue(self, digest: str, image: bytes) -> bool:
+		with self.lock:
+			if digest in self.known:
+				self.skipped += 1
+				return False
+			if self.queued_bytes + len(image) > self.max_bytes:
+				self.dropped += 1
+				return False
+			self.queued_bytes += len(image)
+			self._remember(digest)
+		self._start()
+		self.queue.put((digest, image))
+		return True
+
+	def _remember(self, digest: str) -> None:
+		self.known[digest] = None
+		self.known.move_to_end(digest)
+		while len(self.known) > self.known_items:
+			self.known.popitem(last=False)
+
+	def _start(self) -> None:
+		if self.thread is not None and self.thread.is_alive():
+			return
+		with self.lock:
+			if self.thread is None or not self.thread.is_alive():
+				self.thread = threading.Thread(target=self._run, name='image-archive', daemon=True)
+				self.thread.start()
+
+	def _run(self) -> None:
+		while True:
+			item = self.queue.get()
+			try:
+				if item is None:
+					return
+				digest, image = item
+				with self.lock:
+					self.queued_bytes -= len(image)
+				start = time.time()
+				self._write(digest, image)
+				if self.max_rate:
+					time.sleep(max(0, 1 / self.max_rate - (time.time() - start)))
+			finally:
+				self.queue.task_done()
+
+	def _write(self, digest: str, image: bytes) -> None:
+		path = self.path(digest)
+		if os.path.exists(path):
+			with self.lock:
+				self.skipped += 1
+			return
+		tmp_path = f'{path}.{os.getpid()}.tmp'
+		try:
+			os.makedirs(os.path.dirname(path), exist_ok=True)
+			with open(tmp_path, 'wb') as f:
+				f.write(image)
+			os.replace(tmp_path, path)
+		except OSError as e:
+			print(f'unable to archive the image {digest}: {e}')
+			with self.lock:
+				self.known.pop(digest, None)
+			return
+		with self.lock:
+			self.archived += 1
+
+	def flush(self) -> None:
+		"""
+		waits until the queued images are written
+		"""
+		if self.thread is not None and self.thread.is_alive():
+			self.queue.join()
+
+	def close(self, timeout: float = 10) -> None:
+		if self.thread is not None and self.thread.is_alive():
+			self.queue.put(None)
+			self.thread.join(timeout)
+		self.thread = None
+
+
+image_archive = ImageArchive(
+	ARCHIVE_FOLDER,
+	sample_rate=ARCHIVE_SAMPLE_RATE,
+	max_rate=ARCHIVE_MAX_RATE,
+	max_bytes=ARCHIVE_QUEUE_BYTES,
+)
@@ -0,0 +1,325 @@
+"""
+Content addressed cache of the ocr results.
+
+The results are keyed by the sha256 of the decoded image bytes and the model
+that produced them. There is a small in-memory lru tier per process and an
+optional on-disk tier (one json file per result, sharded by the key prefix)
+that is shared by all the api processes on the machine.
+
+The probabilities are stored alongside the text of a result when the
+request asked for them, so a request with include_probability is served
+from the cache when the result was inferred with them and a request without
+it gets the result without them. The results of the requests without
+include_probability are cached without them, whatever the model returned,
+as the probabilities are far larger than the text.
+"""
+
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from os.path import join
+from typing import (AsyncIterator, Awaitable, Callable, Dict, List, Optional,
+                    Tuple)
+
+from fastapi import HTTPException
+from fastapi.concurrency import run_in_threadpool
+
+from server.config import (RESULT_CACHE_ENABLED, RESULT_CACHE_FOLDER,
+                           RESULT_CACHE_FOLDER_MAX_ITEMS,
+                           RESULT_CACHE_MAX_ITEMS, RESULT_CACHE_TTL)
+from server.modules.core.serialization import dumps, loads
+
+
+def image_digest(image: bytes) -> str:
+	return hashlib.sha256(image).hexdigest()
+
+
+class ResultCache:
+
+	def __init__(
+		self,
+		max_items: int = 100000,
+		ttl: float = 7 * 24 * 60 * 60,
+		folder: Optional[str] = None,
+		folder_max_items: int = 1000000,
+		enabled: bool = True,
+	):
+		self.max_items = max_items
+		self.ttl = ttl
+		self.folder = folder
+		self.folder_max_items = folder_max_items
+		self.enabled = enabled
+		self.items: 'OrderedDict[str, Tuple[float, Dict]]' = OrderedDict()
+		self.lock = threading.Lock()
+		self.hits = 0
+		self.misses = 0
+		self._writes = 0
+
+	def key(
+		self,
+		digest: str,
+		version: str,
+		modality: str,
+		language: str,
+	) -> str:
+		model = f'{version}:{modality}:{language}'
+		return hashlib.sha256(f'{digest}:{model}'.encode('utf-8')).hexdigest()
+
+	def _path(self, key: str) -> str:
+		return join(self.folder, key[:2], f'{key}.json')
+
+	def _get_disk(self, key: str) -> Optional[Dict]:
+		path = self._path(key)
+		try:
+			if os.path.getmtime(path) + self.ttl < time.time():
+				os.remove(path)
+				return None
+			with open(path, 'rb') as f:
+				return loads(f.read())
+		except (OSError, ValueError):
+			return None
+
+	def _set_disk(self, key: str, value: Dict) -> None:
+		path = self._path(key)
+		tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+		try:
+			os.makedirs(os.path.dirname(path), exist_ok=True)
+			with open(tmp_path, 'wb') as f:
+				f.write(dumps(value))
+			os.replace(tmp_path, path)
+		except OSError as e:
+			print(f'unable to write the cached result: {e}')
+			return
+		self._writes += 1
+		if self._writes % 1000 == 0:
+			threading.Thread(target=self.prune_disk, daemon=True).start()
+
+	def prune_disk(self) -> None:
+		"""
+		removes the expired results and then the oldest ones while the
+		on-disk tier holds more than folder_max_items results.
+		"""
+		files = []
+		now = time.time()
+		for root, _, names in os.walk(self.folder):
+			for name in names:
+				path = join(root, name)
+				try:
+					mtime = os.path.getmtime(path)
+					if mtime + self.ttl < now:
+						os.remove(path)
+					else:
+						files.append((mtime, path))
+				except OSError:
+					pass
+		files.sort()
+		for _, path in files[:max(len(files) - self.folder_max_items, 0)]:
+			try:
+				os.remove(path)
+			except OSError:
+				pass
+
+	def get(self, key: str) -> Optional[Dict]:
+		if not self.enabled:
+			return None
+		with self.lock:
+			item = self.items.get(key)
+			if item is not None and item[0] < time.time():
+				del self.items[key]
+				item = None
+			if item is not None:
+				self.items.move_to_end(key)
+				self.hits += 1
+				return item[1]
+		value = self._get_disk(key) if self.folder else None
+		with self.lock:
+			if value is None:
+				self.misses += 1
+				return None
+			self.hits += 1
+		self._set_memory(key, value)
+		return value
+
+	def _set_memory(self, key: str, value: Dict) -> None:
+		with self.lock:
+			self.items[key] = (time.time() + self.ttl, value)
+			self.items.move_to_end(key)
+			while len(self.items) > self.max_items:
+				self.items.popitem(last=False)
+
+	def set(self, key: str, value: Dict) -> None:
+		if not self.enabled:
+			return
+		self._set_memory(key, value)
+		if self.folder:
+			self._set_disk(key, value)
+
+	def clear(self) -> None:
+		with self.lock:
+			self.items.clear()
+
+
+result_cache = ResultCache(
+	max_items=RESULT_CACHE_MAX_ITEMS,
+	ttl=RESULT_CACHE_TTL,
+	folder=RESULT_CACHE_FOLDER,
+	folder_max_items=RESULT_CACHE_FOLDER_MAX_ITEMS,
+	enabled=RESULT_CACHE_ENABLED,
+)
+
+
+# keys of the probabilities in the meta of the results
+PROBABILITY_KEYS = ('data_prob', 'max_prob', 'prob_format')
+
+
+def has_probability(result: Dict) -> bool:
+	meta = result.get('meta') or {}
+	return any(i in meta for i in PROBABILITY_KEYS)
+
+
+def without_probability(result: Dict) -> Dict:
+	if not has_probability(result):
+		return result
+	meta = result['meta']
+	return {
+		**result,
+		'meta': {k: v for k, v in meta.items() if k not in PROBABILITY_KEYS},
+	}
+
+
+def cached_result(value: Optional[Dict], include_probability: bool) -> Optional[Dict]:
+	"""
+	returns the result of a cached value, None if the probabilities were
+	requested and the result was inferred without them
+	"""
+	if value is None or 'result' not in value:
+		return None
+	if include_probability:
+		return value['result'] if value.get('probability') else None
+	return without_probability(value['result'])
+
+
+def lookup_results(
+	digests: List[str],
+	model: Tuple[str, str, str],
+	include_probability: bool = False,
+) -> Tuple[List[str], List[Optional[Dict]], List[int]]:
+	"""
+	returns the cache keys, the cached results (None when missing) and the
+	indices of the images missing from the cache
+	"""
+	keys = [result_cache.key(i, *model) for i in digests]
+	results = [cached_result(result_cache.get(i), include_probability) for i in keys]
+	missing = [idx for idx, i in enumerate(results) if i is None]
+	if missing and len(missing) != len(digests):
+		print(f'{len(digests) - len(missing)}/{len(digests)} results found in the cache')
+	return keys, results, missing
+
+
+def store_results(
+	keys: List[str],
+	results: List[Optional[Dict]],
+	missing: List[int],
+	inferred: List[Dict],
+	include_probability: bool = False,
+) -> List[Dict]:
+	"""
+	caches the results inferred for the missing images and merges them
+	with the cached ones in the request order
+	"""
+	if len(inferred) != len(missing):
+		print(f'expected {len(missing)} results from the model, got {len(inferred)}')
+		raise HTTPException(
+			status_code=500,
+			detail='Error while parsing the ocr output'
+		)
+	for idx, result in zip(missing, inferred):
+		if not include_probability:
+			result = without_probability(result)
+		result_cache.set(keys[idx], {'result': result, 'probability': include_probability})
+		results[idx] = result
+	return results
+
+
+def infer_with_cache(
+	digests: List[str],
+	model: Tuple[str, str, str],
+	infer: Callable[[List[int]], List[Dict]],
+	include_probability: bool = False,
+) -> List[Dict]:
+	"""
+	returns the results of all the images in the request order.
+	only the images missing from the cache are sent to the model, infer
+	is called with their indices and must return their results in the
+	same order.
+	"""
+	keys, results, missing = lookup_results(digests, model, include_probability)
+	if not missing:
+		return results
+	return store_results(keys, results, missing, infer(missing), include_probability)
+
+
+async def ainfer_with_cache(
+	digests: List[str],
+	model: Tuple[str, str, str],
+	infer: Callable[[List[int]], Awaitable[List[Dict]]],
+	include_probability: bool = False,
+) -> List[Dict]:
+	"""
+	async version of infer_with_cache, infer is a coroutine function
+	"""
+	keys, results, missing = await run_in_threadpool(
+		lookup_results,
+		digests,
+		model,
+		include_probability,
+	)
+	if not missing:
+		return results
+	inferred = await infer(missing)
+	return await run_in_threadpool(
+		store_results,
+		keys,
+		results,
+		missing,
+		inferred,
+		include_probability,
+	)
+
+
+async def astream_with_cache(
+	digests: List[str],
+	model: Tuple[str, str, str],
+	infer: Callable[[List[int]], AsyncIterator[Tuple[List[int], List[Dict]]]],
+	include_probability: bool = False,
+) -> AsyncIterator[Tuple[int, Dict]]:
+	"""
+	streaming version of ainfer_with_cache, yields the (index, result) of
+	the cached images first and then of the inferred ones as they come.
+	infer is an async generator yielding (indices, results) of the missing
+	images in any number of steps.
+	"""
+	keys, results, missing = await run_in_threadpool(
+		lookup_results,
+		digests,
+		model,
+		include_probability,
+	)
+	for idx, result in enumerate(results):
+		if result is not None:
+			yield idx, result
+	if not missing:
+		return
+	async for indices, inferred in infer(missing):
+		await run_in_threadpool(
+			store_results,
+			keys,
+			results,
+			indices,
+			inferred,
+			include_probability,
+		)
+		for idx in indices:
+			yield idx, results[idx]
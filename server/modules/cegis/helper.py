@@ -0,0 +1,36 @@
+from subprocess import call
+from tempfile import TemporaryDirectory
+from typing import List
+
+from server.helper import (decode_images, process_ocr_output, response_dict,
+                           save_images)
+from server.modules.cache.results import image_digest, infer_with_cache
+from server.modules.core.tracing import script_env
+from server.modules.metrics.timing import set_model, stage
+
+from .models import OCRImageResponse
+
+
+def infer_cegis(images: List[str], script: str) -> List[OCRImageResponse]:
+	"""
+	runs the cegis model of the given script on the images that are not
+	already present in the result cache. the cached results keep the meta
+	of the model but the cegis responses only carry the text.
+	"""
+	set_model(script, 'printed', 'english')
+	with stage('decode'):
+		images = decode_images(images)
+	tmp = TemporaryDirectory(prefix='ocr_cegis')
+
+	def infer(missing: List[int]) -> List[dict]:
+		save_images([images[i] for i in missing], tmp.name)
+		with stage('inference'):
+			call(f'./{script} {tmp.name}', shell=True, env=script_env())
+		return [response_dict(i) for i in process_ocr_output(tmp.name)]
+
+	results = infer_with_cache(
+		[image_digest(i) for i in images],
+		(script, 'printed', 'english'),
+		infer,
+	)
+	return [OCRImageResponse(text=i['text']) for i in results]
@@ -1,11 +1,8 @@
-from subprocess import call
-from tempfile import TemporaryDirectory
 from typing import List
 
 from fastapi import APIRouter
 
-from server.helper import process_images, process_ocr_output
-
+from .helper import infer_cegis
 from .models import OCRImageResponse, OCRRequest
 
 router = APIRouter(
@@ -20,10 +17,7 @@ router = APIRouter(
 	response_model_exclude_none=True
 )
 def infer_ocr(ocr_request: OCRRequest) -> List[OCRImageResponse]:
-	tmp = TemporaryDirectory(prefix='ocr_cegis')
-	process_images(ocr_request.images, tmp.name)
-	call(f'./cegis_infer.sh {tmp.name}', shell=True)
-	return process_ocr_output(tmp.name)
+	return infer_cegis(ocr_request.images, 'cegis_infer.sh')
 
 
 @router.post(
@@ -32,10 +26,7 @@ def infer_ocr(ocr_request: OCRRequest) -> List[OCRImageResponse]:
 	response_model_exclude_none=True
 )
 def shaon_infer_ocr(ocr_request: OCRRequest) -> List[OCRImageResponse]:
-	tmp = TemporaryDirectory(prefix='ocr_cegis')
-	process_images(ocr_request.images, tmp.name)
-	call(f'./cegis_infer_v2.sh {tmp.name}', shell=True)
-	return process_ocr_output(tmp.name)
+	return infer_cegis(ocr_request.images, 'cegis_infer_v2.sh')
 
 @router.post(
 	'/v3',
@@ -46,10 +37,7 @@ def cegis_v3_english_char_ocr(ocr_request: OCRRequest) -> List[OCRImageResponse]
 	"""
 	**ResNet18** model trained by Ajoy and deployed on March 21, 2023
 	"""
-	tmp = TemporaryDirectory(prefix='ocr_cegis')
-	process_images(ocr_request.images, tmp.name)
-	call(f'./cegis_infer_v3.sh {tmp.name}', shell=True)
-	return process_ocr_output(tmp.name)
+	return infer_cegis(ocr_request.images, 'cegis_infer_v3.sh')
 
 @router.post(
 	'/v4',
@@ -60,10 +48,7 @@ def cegis_v4_english_char_ocr(ocr_request: OCRRequest) -> List[OCRImageResponse]
 	"""
 	**ResNet50** model trained by Ajoy and deployed on March 21, 2023
 	"""
-	tmp = TemporaryDirectory(prefix='ocr_cegis')
-	process_images(ocr_request.images, tmp.name)
-	call(f'./cegis_infer_v4.sh {tmp.name}', shell=True)
-	return process_ocr_output(tmp.name)
+	return infer_cegis(ocr_request.images, 'cegis_infer_v4.sh')
 
 
 @router.post(
@@ -75,10 +60,7 @@ def cegis_v5_ocr(ocr_request: OCRRequest) -> List[OCRImageResponse]:
 	"""
 	**??** model trained by Jasjeeet and deployedd on April 24, 2023
 	"""
-	tmp = TemporaryDirectory(prefix='ocr_cegis')
-	process_images(ocr_request.images, tmp.name)
-	call(f'./cegis_infer_v4.sh {tmp.name}', shell=True)
-	return process_ocr_output(tmp.name)
+	return infer_cegis(ocr_request.images, 'cegis_infer_v4.sh')
 
 
 @router.post(
@@ -90,7 +72,4 @@ def cegis_v6_ocr(ocr_request: OCRRequest) -> List[OCRImageResponse]:
 	"""
 	TrOCR based model trained by Jasjeeet and deployedd on June 19, 2023
 	"""
-	tmp = TemporaryDirectory(prefix='ocr_cegis')
-	process_images(ocr_request.images, tmp.name)
-	call(f'./cegis_infer_v6.sh {tmp.name}', shell=True)
-	return process_ocr_output(tmp.name)
\ No newline at end of file
+	return infer_cegis(ocr_request.images, 'cegis_infer_v6.sh')
\ No newline at end of file
@@ -0,0 +1,55 @@
+import asyncio
+from typing import Dict
+
+from server.config import BACKEND_CONCURRENCY, DEFAULT_BACKEND_CONCURRENCY
+from server.modules.metrics.timing import stage
+
+from .tracing import script_env
+
+
+class BackendLimit:
+	"""
+	semaphore counting the requests running and waiting for the backend
+	"""
+
+	def __init__(self, limit: int):
+		self.semaphore = asyncio.Semaphore(limit)
+		self.running = 0
+		self.waiting = 0
+
+	async def __aenter__(self) -> None:
+		self.waiting += 1
+		try:
+			await self.semaphore.acquire()
+		finally:
+			self.waiting -= 1
+		self.running += 1
+
+	async def __aexit__(self, *args) -> None:
+		self.running -= 1
+		self.semaphore.release()
+
+
+backend_limits: Dict[str, BackendLimit] = {}
+
+
+def backend_limit(backend: str) -> BackendLimit:
+	"""
+	returns the semaphore bounding the number of requests that are
+	running the given backend at the same time
+	"""
+	if backend not in backend_limits:
+		backend_limits[backend] = BackendLimit(
+			BACKEND_CONCURRENCY.get(backend, DEFAULT_BACKEND_CONCURRENCY)
+		)
+	return backend_limits[backend]
+
+
+async def run_script(command: str) -> int:
+	"""
+	async version of subprocess.call(command, shell=True), the event loop
+	keeps serving the other requests while the script is running.
+	"""
+	with stage('inference'):
+		process = await asyncio.create_subprocess_shell(command, env=script_env())
+		return await process.wait()
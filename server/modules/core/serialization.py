@@ -0,0 +1,160 @@
+"""
+Fast serialisation of the results.
+
+The results are serialised straight from the parsed dicts, without building
+and validating pydantic models, with orjson when it is installed (json
+otherwise). The clients can ask for a more compact body with the Accept
+header:
+
+	application/json      always available
+	application/msgpack   when msgpack is installed
+	application/cbor      when cbor2 is installed
+
+and for a compressed one with Accept-Encoding (gzip, or br when brotli is
+installed). The bodies smaller than RESPONSE_COMPRESSION_MIN_SIZE are sent
+as they are. The PackedTensors of the probabilities are encoded as base64
+strings by every encoder.
+"""
+
+import gzip
+import json
+from typing import Any, Callable, Dict, List, Optional, Union
+
+from fastapi import Request
+from starlette.responses import Response
+
+from server.config import (RESPONSE_BROTLI_QUALITY,
+                           RESPONSE_COMPRESSION_MIN_SIZE, RESPONSE_GZIP_LEVEL)
+from server.modules.core.tensors import PackedTensors
+from server.modules.metrics.timing import stage
+
+try:
+	import orjson
+except ImportError:
+	orjson = None
+try:
+	import msgpack
+except ImportError:
+	msgpack = None
+try:
+	import cbor2
+except ImportError:
+	cbor2 = None
+try:
+	import brotli
+except ImportError:
+	brotli = None
+
+JSON = 'application/json'
+MSGPACK = 'application/msgpack'
+CBOR = 'application/cbor'
+
+
+def default(obj: Any) -> Any:
+	"""
+	encodes the objects the encoders do not know about
+	"""
+	if isinstance(obj, PackedTensors):
+		return obj.encode()
+	raise TypeError(f'Object of type {type(obj).__name__} is not serializable')
+
+
+def loads(data: Union[str, bytes]) -> Any:
+	if orjson is not None:
+		return orjson.loads(data)
+	return json.loads(data)
+
+
+def dumps(obj: Any) -> bytes:
+	"""
+	returns the utf-8 json of obj
+	"""
+	if orjson is not None:
+		return orjson.dumps(
+			obj,
+			default=default,
+			option=orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY,
+		)
+	return json.dumps(obj, ensure_ascii=False, default=default).encode('utf-8')
+
+
+ENCODERS: Dict[str, Callable[[Any], bytes]] = {JSON: dumps}
+if msgpack is not None:
+	ENCODERS[MSGPACK] = lambda x: msgpack.packb(x, use_bin_type=True, default=default)
+	ENCODERS['application/x-msgpack'] = ENCODERS[MSGPACK]
+if cbor2 is not None:
+	ENCODERS[CBOR] = lambda x: cbor2.dumps(x, default=lambda encoder, value: encoder.encode(default(value)))
+
+COMPRESSORS: Dict[str, Callable[[bytes], bytes]] = {
+	'gzip': lambda x: gzip.compress(x, RESPONSE_GZIP_LEVEL),
+}
+if brotli is not None:
+	COMPRESSORS['br'] = lambda x: brotli.compress(x, quality=RESPONSE_BROTLI_QUALITY)
+
+
+def accepted(header: str) -> List[str]:
+	"""
+	returns the values of an Accept/Accept-Encoding header by preference,
+	the ones with q=0 are left out
+	"""
+	ret = []
+	for position, value in enumerate(header.split(',')):
+		value, *params = [i.strip() for i in value.split(';')]
+		quality = 1.0
+		for param in params:
+			if param.startswith('q='):
+				try:
+					quality = float(param[2:])
+				except ValueError:
+					quality = 0
+		if value and quality > 0:
+			ret.append((-quality, position, value.lower()))
+	return [i[2] for i in sorted(ret)]
+
+
+def negotiate_media_type(request: Request) -> str:
+	"""
+	returns the preferred media type of the client among the available
+	ones, json when none of them is accepted
+	"""
+	for media_type in accepted(request.headers.get('accept', '')):
+		if media_type in ENCODERS:
+			return media_type
+	return JSON
+
+
+def negotiate_encoding(request: Request) -> Optional[str]:
+	for encoding in accepted(request.headers.get('accept-encoding', '')):
+		if encoding in COMPRESSORS:
+			return encoding
+		if encoding == 'identity':
+			return None
+	return None
+
+
+def encode_response(request: Request, content: Any, status_code: int = 200) -> Response:
+	"""
+	returns the response with the content encoded as negotiated with the
+	client
+	"""
+	media_type = negotiate_media_type(request)
+	headers = {'vary': 'Accept, Accept-Encoding'}
+	with stage('serialize'):
+		body = ENCODERS[media_type](content)
+		encoding = negotiate_encoding(request)
+		if encoding is not None and len(body) >= RESPONSE_COMPRESSION_MIN_SIZE:
+			body = COMPRESSORS[encoding](body)
+			headers['content-encoding'] = encoding
+	return Response(body, status_code=status_code, headers=headers, media_type=media_type)
+
+
+def encoded_responses(responses: Optional[Dict] = None) -> Dict:
+	"""
+	documents the available media types of the 200 response in the openapi
+	schema, along with the ones of responses
+	"""
+	responses = dict(responses or {})
+	ok = dict(responses.get(200, {}))
+	ok['content'] = {**{i: {} for i in ENCODERS}, **ok.get('content', {})}
+	responses[200] = ok
+	return responses
@@ -0,0 +1,83 @@
+"""
+Streaming of the per image results.
+
+When the Accept header of a request asks for application/x-ndjson or
+text/event-stream, the results are sent one by one as soon as they are
+available, along with the index of their image:
+
+	{"index": 2, "result": {...}}
+
+An error after the response has started is sent as {"error": "..."} and
+server-sent events end with a done event.
+"""
+
+from typing import AsyncIterator, Dict, Optional, Tuple
+
+from fastapi import HTTPException, Request
+from starlette.background import BackgroundTask
+from starlette.responses import StreamingResponse
+
+from server.modules.metrics.timing import current_timer
+
+from .serialization import dumps
+
+NDJSON = 'application/x-ndjson'
+SSE = 'text/event-stream'
+
+# documents the streamed responses in the openapi schema
+STREAM_RESPONSES = {
+	200: {
+		'description': 'the results, one by one with the index of their image when streamed',
+		'content': {NDJSON: {}, SSE: {}},
+	},
+}
+
+
+def stream_type(request: Request) -> Optional[str]:
+	"""
+	returns the streaming media type accepted by the client if any
+	"""
+	accept = request.headers.get('accept', '')
+	for media_type in (NDJSON, SSE):
+		if media_type in accept:
+			return media_type
+	return None
+
+
+def format_event(media_type: str, event: Dict, name: str = 'result') -> bytes:
+	data = dumps(event)
+	if media_type == SSE:
+		return b'event: ' + name.encode('utf-8') + b'\ndata: ' + data + b'\n\n'
+	return data + b'\n'
+
+
+def stream_results(
+	media_type: str,
+	results: AsyncIterator[Tuple[int, Dict]],
+	background: Optional[BackgroundTask] = None,
+) -> StreamingResponse:
+	"""
+	streams the (index, result) pairs, background runs once the stream is
+	over (eg. to remove the workspace of the request). the stages run while
+	the results are sent are observed once the stream is over.
+	"""
+	timer = current_timer.get()
+	if timer is not None:
+		timer.defer()
+
+	async def body() -> AsyncIterator[bytes]:
+		try:
+			async for index, result in results:
+				yield format_event(media_type, {'index': index, 'result': result})
+		except HTTPException as e:
+			yield format_event(media_type, {'error': e.detail}, 'error')
+		except Exception as e:
+			print(f'error while streaming the results: {e}')
+			yield format_event(media_type, {'error': 'Error while processing the images'}, 'error')
+		finally:
+			if timer is not None:
+				timer.finish()
+		if media_type == SSE:
+			yield format_event(media_type, {}, 'done')
+
+	return StreamingResponse(body(), media_type=media_type, background=background)
@@ -0,0 +1,150 @@
+"""
+Compact packed encoding of the probability tensors (data_prob/max_prob).
+
+All the tensors of a batch are packed in one blob:
+
+	b'OCRT' | count (u32)
+	count x [dtype (u8) | ndim (u8) | shape (ndim x u32) | offset (u64)]
+	the data of each tensor, little endian and aligned to 8 bytes
+
+the offsets are from the start of the blob. The tensors are read without a
+copy with numpy.frombuffer, so a memory mapped file (see load_tensors) is
+only paged in for the tensors that are actually used.
+
+The probabilities read from the prob.bin of the models are kept as views of
+the blob (PackedTensors) and only packed on their own per image when the
+response is serialised (see server/modules/core/serialization.py).
+"""
+
+import base64
+import mmap
+import struct
+from typing import Dict, List, Union
+
+import numpy as np
+
+MAGIC = b'OCRT'
+PACKED = 'packed'
+DTYPES = {1: np.dtype('<f2'), 2: np.dtype('<f4')}
+DTYPE_CODES = {v: k for k, v in DTYPES.items()}
+
+
+class TensorFormatError(ValueError):
+	pass
+
+
+def pack_tensors(tensors: List, dtype: str = '<f2') -> bytes:
+	"""
+	packs the arrays (or nested lists) as dtype, float16 by default
+	"""
+	dtype = np.dtype(dtype)
+	arrays = [np.ascontiguousarray(i, dtype=dtype) for i in tensors]
+	header_size = 8 + sum(10 + 4 * i.ndim for i in arrays)
+	offset = (header_size + 7) & ~7
+	header = [MAGIC, struct.pack('<I', len(arrays))]
+	offsets = []
+	for array in arrays:
+		offsets.append(offset)
+		header.append(struct.pack(f'<BB{array.ndim}IQ', DTYPE_CODES[dtype], array.ndim, *array.shape, offset))
+		offset = (offset + array.nbytes + 7) & ~7
+	out = bytearray(offset)
+	header = b''.join(header)
+	out[:len(header)] = header
+	for start, array in zip(offsets, arrays):
+		out[start:start + array.nbytes] = array.tobytes()
+	return bytes(out)
+
+
+def unpack_tensors(data: Union[bytes, bytearray, memoryview, mmap.mmap]) -> List[np.ndarray]:
+	"""
+	returns the read only arrays packed in data, without copying them
+	"""
+	try:
+		if bytes(data[:4]) != MAGIC:
+			raise TensorFormatError('not a packed tensor blob')
+		count, = struct.unpack_from('<I', data, 4)
+		position = 8
+		ret = []
+		for _ in range(count):
+			code, ndim = struct.unpack_from('<BB', data, position)
+			shape = struct.unpack_from(f'<{ndim}I', data, position + 2)
+			offset, = struct.unpack_from('<Q', data, position + 2 + 4 * ndim)
+			position += 10 + 4 * ndim
+			dtype = DTYPES[code]
+			size = int(np.prod(shape, dtype=np.int64))
+			ret.append(np.frombuffer(data, dtype=dtype, count=size, offset=offset).reshape(shape))
+		return ret
+	except (struct.error, KeyError, ValueError) as e:
+		if isinstance(e, TensorFormatError):
+			raise
+		raise TensorFormatError(f'invalid packed tensor blob: {e}')
+
+
+def load_tensors(path: str) -> List[np.ndarray]:
+	"""
+	memory maps the packed file and returns its arrays
+	"""
+	with open(path, 'rb') as f:
+		data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+	return unpack_tensors(data)
+
+
+def encode_tensors(tensors: List) -> str:
+	return base64.b64encode(pack_tensors(tensors)).decode('ascii')
+
+
+def decode_tensors(data: str) -> List[np.ndarray]:
+	try:
+		blob = base64.b64decode(data)
+	except ValueError as e:
+		raise TensorFormatError(f'invalid base64: {e}')
+	return unpack_tensors(blob)
+
+
+class PackedTensors:
+	"""
+	tensors of one image, views of the blob they were read from. they are
+	packed (and base64 encoded) when the response is serialised.
+	"""
+
+	__slots__ = ('arrays',)
+
+	def __init__(self, arrays: List[np.ndarray]):
+		self.arrays = arrays
+
+	@property
+	def nbytes(self) -> int:
+		return sum(i.nbytes for i in self.arrays)
+
+	def encode(self) -> str:
+		return encode_tensors(self.arrays)
+
+
+def encoded_meta(meta: Dict) -> Dict:
+	"""
+	returns the meta with its PackedTensors encoded as base64 strings
+	"""
+	if not any(isinstance(i, PackedTensors) for i in meta.values()):
+		return meta
+	return {k: v.encode() if isinstance(v, PackedTensors) else v for k, v in meta.items()}
+
+
+def read_probabilities(path: str, names: List[str]) -> dict:
+	"""
+	reads the prob.bin written by the models, it has the data_prob and
+	max_prob of every image in the order of names. returns the meta of
+	each image with its tensors as views of the blob. the file is read in
+	memory rather than mapped, the results can outlive their folder.
+	"""
+	with open(path, 'rb') as f:
+		tensors = unpack_tensors(f.read())
+	if len(tensors) != 2 * len(names):
+		raise TensorFormatError(f'expected {2 * len(names)} tensors in {path}, got {len(tensors)}')
+	return {
+		name: {
+			'data_prob': PackedTensors(tensors[2 * idx:2 * idx + 1]),
+			'max_prob': PackedTensors(tensors[2 * idx + 1:2 * idx + 2]),
+			'prob_format': PACKED,
+		}
+		for idx, name in enumerate(names)
+	}
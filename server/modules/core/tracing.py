@@ -0,0 +1,90 @@
+"""
+Request ids, to follow a request through the api and the inference runs.
+
+The id is taken from the REQUEST_ID_HEADER of the request (when it looks
+like an id) or generated, and kept in a context variable for the duration
+of the request. It is
+
+	sent back in the REQUEST_ID_HEADER of the response
+	passed to the inference scripts (and their containers) as OCR_REQUEST_ID
+	sent to the inference workers along with each folder
+	prefixed to every line printed while the request is processed
+"""
+
+import os
+import re
+import sys
+import threading
+from contextvars import ContextVar
+from typing import Dict, Optional, TextIO
+from uuid import uuid4
+
+from fastapi import Request
+
+from server.config import REQUEST_ID_HEADER
+
+REQUEST_ID_ENV = 'OCR_REQUEST_ID'
+VALID_ID = re.compile('[A-Za-z0-9._:-]{1,128}')
+
+current_request_id: 'ContextVar[Optional[str]]' = ContextVar('current_request_id', default=None)
+
+
+def request_id_of(request: Request) -> str:
+	"""
+	returns the id sent by the client, or a new one if it is missing or
+	not a valid id
+	"""
+	request_id = request.headers.get(REQUEST_ID_HEADER, '')
+	if VALID_ID.fullmatch(request_id):
+		return request_id
+	return uuid4().hex
+
+
+def script_env() -> Optional[Dict[str, str]]:
+	"""
+	returns the environment of the scripts run for the current request,
+	None (the environment of the api) outside of a request
+	"""
+	request_id = current_request_id.get()
+	if request_id is None:
+		return None
+	return {**os.environ, REQUEST_ID_ENV: request_id}
+
+
+class RequestIdStream:
+	"""
+	prefixes the lines written while a request is processed with its id
+	"""
+
+	def __init__(self, stream: TextIO):
+		self.stream = stream
+		# whether the next write of the thread starts a line
+		self.local = threading.local()
+
+	def write(self, text: str) -> int:
+		request_id = current_request_id.get()
+		if request_id is not None and text:
+			prefix = f'[{request_id}] '
+			lines = text.split('\n')
+			start = 0 if getattr(self.local, 'line_start', True) else 1
+			for idx in range(start, len(lines)):
+				if lines[idx]:
+					lines[idx] = prefix + lines[idx]
+			self.local.line_start = text.endswith('\n')
+			self.stream.write('\n'.join(lines))
+		else:
+			if text:
+				self.local.line_start = text.endswith('\n')
+			self.stream.write(text)
+		return len(text)
+
+	def __getattr__(self, name: str):
+		return getattr(self.stream, name)
+
+
+def prefix_logs() -> None:
+	"""
+	prefixes the lines printed to stdout with the id of their request
+	"""
+	if not isinstance(sys.stdout, RequestIdStream):
+		sys.stdout = RequestIdStream(sys.stdout)
@@ -16,9 +16,10 @@ from fastapi import HTTPException
 from fastapi.responses import FileResponse
 from PIL import Image
 
-import pytesseract
 from server.config import LANGUAGES, NUMBER_LOADED_MODEL_THRESHOLD, TESS_LANG
 from google.cloud import vision
+from server.modules.tesseract.engine import (open_image, tesseract_language,
+                                             tesseract_pools)
 
 from .models import *
 
@@ -39,13 +40,19 @@ LANGUAGES = {
 	'ur': 'urdu',
 }
 
-def call_page_tesseract2(language, folder, bilingual: bool = False):
-	a = [join(folder, i) for i in os.listdir(folder)]
-	if bilingual:
-		ret = pytesseract.image_to_string(a[0], lang='eng+'+TESS_LANG[language]).strip()
-	else:
-		ret = pytesseract.image_to_string(a[0], lang=TESS_LANG[language]).strip()
-	return {'text': ret}
+def call_page_tesseract2(language, image: bytes, bilingual: bool = False):
+	"""
+	recognises the encoded image in memory
+	"""
+	try:
+		image = open_image(image)
+	except Exception:
+		raise HTTPException(
+			status_code=400,
+			detail='Unable to decode the image'
+		)
+	lang = tesseract_language(language, bilingual)
+	return {'text': tesseract_pools.text(lang, [image])[0]}
 
 def parse_google_response(response):
 	a = response.full_text_annotation
@@ -98,13 +105,11 @@ def visualize_google(image_path, response):
 	cv2.imwrite(save_location, img)
 	return FileResponse(save_location)
 
-def call_google_ocr(language, folder):
-	a = [join(folder, i) for i in os.listdir(folder)]
+def call_google_ocr(language, images: List[bytes]):
 	ret = []
 	client = vision.ImageAnnotatorClient()
-	for i in a:
-		with open(i, 'rb') as f:
-			img = vision.Image(content=f.read())
+	for i in images:
+		img = vision.Image(content=i)
 		response = client.document_text_detection(
 			image=img,
 			image_context={
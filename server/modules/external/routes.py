@@ -1,11 +1,8 @@
 from subprocess import call
 
 from fastapi import APIRouter, Request, UploadFile, File, Form, Depends, HTTPException
-from tempfile import TemporaryDirectory
-from os.path import join
+from fastapi.concurrency import run_in_threadpool
 
-import uuid
-import shutil
 from .helper import call_page_tesseract2, call_google_ocr
 from .models import Token
 from .dependencies import get_token
@@ -24,14 +21,7 @@ def infer_ocr(
 	language: str = Form('english'),
 	bilingual: bool = Form(False),
 ):
-	tmp = TemporaryDirectory()
-	location = join(tmp.name, '{}.{}'.format(
-		str(uuid.uuid4()),
-		image.filename.strip().split('.')[-1]
-	))
-	with open(location, 'wb+') as f:
-		shutil.copyfileobj(image.file, f)
-	return call_page_tesseract2(language, tmp.name, bilingual)
+	return call_page_tesseract2(language, image.file.read(), bilingual)
 
 
 @router.post(
@@ -57,13 +47,7 @@ async def infer_google_ocr(
 	language: str = Form('en'),
 	token: Token = Depends(get_token)
 ):
-	tmp = TemporaryDirectory()
-	location = join(tmp.name, '{}.{}'.format(
-		str(uuid.uuid4()),
-		image.filename.strip().split('.')[-1]
-	))
-	with open(location, 'wb+') as f:
-		shutil.copyfileobj(image.file, f)
+	content = await image.read()
 	if token.quota < 1:
 		raise HTTPException(
 			status_code=400,
@@ -71,4 +55,4 @@ async def infer_google_ocr(
 		)
 	else:
 		await token.update(quota=token.quota-1)
-	return call_google_ocr(language, tmp.name)
\ No newline at end of file
+	return await run_in_threadpool(call_google_ocr, language, [content])
\ No newline at end of file
@@ -1,7 +1,9 @@
-from subprocess import call
-import os
-
 from fastapi import APIRouter, Request
+from fastapi.concurrency import run_in_threadpool
+
+from server.modules.core.aio import backend_limit, run_script
+from server.modules.metrics.timing import set_model
+from server.modules.workspaces.manager import workspace_manager
 
 from .helper import *
 from .models import OCRRequest, OCRResponse
@@ -18,19 +20,18 @@ router = APIRouter(
 	response_model_exclude_none=True
 )
 async def infer_ocr(ocr_request: OCRRequest, request: Request) -> OCRResponse:
-	process_images(ocr_request.image)
 	lcode, language, modality, dlevel = process_config(ocr_request.config)
 
 	# if len(os.listdir(MODEL_FOLDER))==0:
 	# 	download_models_from_file(models_txt_path,MODEL_FOLDER)
 
-	if modality=='handwritten':
-		call(f'./infer_iitb_v2.sh {modality} {lcode} {IMAGE_FOLDER}', shell=True)
-		ret = process_ocr_output(lcode, modality, IMAGE_FOLDER)
-		await save_logs(request, ret)
-		return ret
-	if modality=='printed':
-		call(f'./infer_iitb_v2.sh {modality} {lcode} {IMAGE_FOLDER}', shell=True)
-		ret = process_ocr_output(lcode, modality, IMAGE_FOLDER)
-		await save_logs(request, ret)
-		return ret
+	if modality not in ('handwritten', 'printed'):
+		return None
+	set_model('iitb_v2', modality, language)
+	with workspace_manager.create('iitb_v2') as workspace:
+		digests = await process_images(ocr_request.image, workspace)
+		async with backend_limit('iitb_v2'):
+			await run_script(f'./infer_v2_iitb.sh {modality} {lcode} {workspace.path}')
+		ret = await run_in_threadpool(process_ocr_output, lcode, modality, workspace.path)
+	await save_logs(request, ocr_request, digests, ret)
+	return ret
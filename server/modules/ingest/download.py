@@ -0,0 +1,144 @@
+"""
+Concurrent downloads of the images given as urls.
+
+All the downloads go through one keep-alive connection pool. The images of
+a request are fetched concurrently (up to DOWNLOAD_CONCURRENCY at a time),
+streamed into the request workspace with a size cap and hashed on the way.
+Images that are already jpeg are kept as they are, the others are
+converted to jpeg like before.
+"""
+
+import asyncio
+import os
+from os.path import join
+from typing import Dict, Optional
+
+import httpx
+from fastapi import HTTPException
+from fastapi.concurrency import run_in_threadpool
+from PIL import Image
+
+from server.config import (DOWNLOAD_CONCURRENCY, DOWNLOAD_CONNECT_TIMEOUT,
+                           DOWNLOAD_MAX_CONNECTIONS, DOWNLOAD_TIMEOUT,
+                           INGEST_MAX_IMAGE_SIZE)
+from server.modules.cache.results import image_digest
+from server.modules.metrics.timing import stage
+from server.modules.workspaces.manager import Workspace
+
+from .stream import ImageSink, StreamedImage
+
+JPEG_MAGIC = b'\xff\xd8\xff'
+
+# the client is bound to the event loop it was created on
+_client: Optional[httpx.AsyncClient] = None
+_client_loop: Optional[asyncio.AbstractEventLoop] = None
+
+
+def get_client() -> httpx.AsyncClient:
+	global _client, _client_loop
+	loop = asyncio.get_running_loop()
+	if _client is None or _client_loop is not loop:
+		_client = httpx.AsyncClient(
+			follow_redirects=True,
+			timeout=httpx.Timeout(DOWNLOAD_TIMEOUT, connect=DOWNLOAD_CONNECT_TIMEOUT),
+			limits=httpx.Limits(
+				max_connections=DOWNLOAD_MAX_CONNECTIONS,
+				max_keepalive_connections=DOWNLOAD_MAX_CONNECTIONS,
+			),
+		)
+		_client_loop = loop
+	return _client
+
+
+async def close_client() -> None:
+	global _client
+	if _client is not None:
+		await _client.aclose()
+		_client = None
+
+
+def convert_image(workspace: Workspace, source: StreamedImage, name: str) -> StreamedImage:
+	"""
+	converts the downloaded image to a jpeg of the workspace, which
+	replaces the downloaded one in the quota
+	"""
+	with Image.open(source.path) as img:
+		if img.mode not in ('RGB', 'L'):
+			img = img.convert('RGB')
+		img.save(join(workspace.path, name), 'JPEG')
+	os.remove(source.path)
+	workspace.release(source.size)
+	path = workspace.account(name)
+	with open(path, 'rb') as f:
+		image = f.read()
+	return StreamedImage(name, path, image_digest(image), len(image))
+
+
+async def download_image(
+	client: httpx.AsyncClient,
+	url: str,
+	workspace: Workspace,
+	name: str,
+	max_size: int,
+) -> StreamedImage:
+	sink = ImageSink(workspace, f'{name}.download', max_size)
+	try:
+		async with client.stream('GET', url) as r:
+			if r.status_code != 200:
+				raise ValueError(f'status_code is {r.status_code} while downloading the image from url')
+			if int(r.headers.get('content-length', 0)) > max_size:
+				raise HTTPException(
+					status_code=413,
+					detail=f'The image {name} is larger than {max_size} bytes'
+				)
+			async for chunk in r.aiter_bytes():
+				sink.write(chunk)
+	finally:
+		sink.file.close()
+	image = sink.close()
+	with open(image.path, 'rb') as f:
+		magic = f.read(len(JPEG_MAGIC))
+	if magic == JPEG_MAGIC:
+		path = join(workspace.path, name)
+		os.replace(image.path, path)
+		return StreamedImage(name, path, image.digest, image.size)
+	return await run_in_threadpool(convert_image, workspace, image, name)
+
+
+async def download_images(
+	urls: Dict[int, str],
+	workspace: Workspace,
+	concurrency: int = DOWNLOAD_CONCURRENCY,
+	max_size: int = INGEST_MAX_IMAGE_SIZE,
+) -> Dict[int, StreamedImage]:
+	"""
+	downloads the urls (keyed by the index of the image) concurrently and
+	saves them in the workspace as {index}.jpg
+	"""
+	client = get_client()
+	semaphore = asyncio.Semaphore(concurrency)
+
+	async def download(idx: int, url: str) -> StreamedImage:
+		async with semaphore:
+			print('downloading the image:', url)
+			try:
+				return await download_image(client, url, workspace, f'{idx}.jpg', max_size)
+			except HTTPException:
+				raise
+			except Exception as e:
+				print(f'unable to download {url}: {e}')
+				raise HTTPException(
+					status_code=400,
+					detail='Error while downloading and saving the image #{}'.format(idx)
+				)
+
+	tasks = [asyncio.ensure_future(download(i, j)) for i, j in urls.items()]
+	try:
+		with stage('download'):
+			images = await asyncio.gather(*tasks)
+	except BaseException:
+		# the other downloads are stopped before the workspace is removed
+		for task in tasks:
+			task.cancel()
+		raise
+	return dict(zip(urls, images))
@@ -0,0 +1,595 @@
+"""
+Streaming ingestion of the request bodies.
+
+The body is parsed while it is being received. The base64 images found at
+the given path (eg. ('imageContent', '*')) are decoded chunk by chunk
+straight into the request workspace instead of being kept in memory, so
+the memory used by a request does not depend on the number of images:
+
+	body, images = await ingest_json(request, workspace, ('imageContent', '*'))
+	ocr_request = parse_streamed(OCRRequest, body)
+
+The streamed strings are replaced by their sha256 in the body and
+images maps the index of the '*' of the path to the saved image.
+
+ingest_frames and ingest_multipart read the same fields from a length
+prefixed binary body or a multipart/form-data one, which skips base64.
+"""
+
+import base64
+import copy
+import hashlib
+import json
+import re
+import string
+from dataclasses import dataclass
+from os.path import join
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple, Type, Union
+
+from fastapi import HTTPException, Request
+from fastapi.exceptions import RequestValidationError
+from multipart.multipart import MultipartParser, parse_options_header
+from pydantic import BaseModel, ValidationError
+
+from server.config import (INGEST_MAX_FIELD_SIZE, INGEST_MAX_IMAGE_SIZE,
+                           INGEST_MAX_REQUEST_SIZE)
+from server.modules.workspaces.manager import Workspace
+
+Path = Tuple[Union[str, int], ...]
+
+WHITESPACE = b' \t\n\r'
+LITERAL = re.compile(rb'[^,}\]\s]+')
+STRING_END = re.compile(rb'["\\]')
+# every byte which is not part of the base64 alphabet is skipped like
+# base64.b64decode does
+NOT_BASE64 = bytes(
+	i for i in range(256)
+	if chr(i) not in string.ascii_letters + string.digits + '+/='
+)
+
+
+@dataclass
+class StreamedImage:
+	name: str
+	path: str
+	digest: str
+	size: int
+
+
+def invalid_body(detail: str = 'Invalid json body') -> HTTPException:
+	return HTTPException(status_code=400, detail=detail)
+
+
+class ImageSink:
+	"""
+	writes the image received in arbitrary chunks into a file of the
+	workspace, hashing it on the way
+	"""
+
+	def __init__(self, workspace: Workspace, name: str, max_size: int):
+		self.workspace = workspace
+		self.name = name
+		self.path = join(workspace.path, name)
+		self.max_size = max_size
+		self.file = open(self.path, 'wb')
+		self.sha = hashlib.sha256()
+		self.size = 0
+
+	def write(self, image: bytes) -> None:
+		self.size += len(image)
+		if self.size > self.max_size:
+			raise HTTPException(
+				status_code=413,
+				detail=f'The image {self.name} is larger than {self.max_size} bytes'
+			)
+		self.workspace.reserve(len(image))
+		self.sha.update(image)
+		self.file.write(image)
+
+	def close(self) -> StreamedImage:
+		self.file.close()
+		return StreamedImage(self.name, self.path, self.sha.hexdigest(), self.size)
+
+
+class Base64Sink(ImageSink):
+	"""
+	decodes the base64 string written in arbitrary chunks into a file of
+	the workspace
+	"""
+
+	def __init__(self, workspace: Workspace, name: str, max_size: int):
+		super().__init__(workspace, name, max_size)
+		self.pending = b''
+
+	def write(self, data: bytes) -> None:
+		data = self.pending + data.translate(None, NOT_BASE64)
+		end = len(data) - len(data) % 4
+		self.pending = data[end:]
+		if end:
+			self._decode(data[:end])
+
+	def _decode(self, data: bytes) -> None:
+		try:
+			image = base64.b64decode(data)
+		except ValueError:
+			raise HTTPException(
+				status_code=400,
+				detail=f'Error while decoding the image {self.name}'
+			)
+		super().write(image)
+
+	def close(self) -> StreamedImage:
+		if self.pending:
+			self._decode(self.pending)
+		return super().close()
+
+
+class BodyReader:
+	"""
+	buffered reader of the request body that enforces its size limit
+	"""
+
+	def __init__(self, stream: AsyncIterator[bytes], max_request_size: int):
+		self.stream = stream.__aiter__()
+		self.max_request_size = max_request_size
+		self.buffer = b''
+		self.pos = 0
+		self.received = 0
+		self.eof = False
+
+	async def fill(self) -> bool:
+		"""
+		reads the next chunk of the body, returns False at the end of it
+		"""
+		if self.eof:
+			return False
+		try:
+			chunk = await self.stream.__anext__()
+		except StopAsyncIteration:
+			self.eof = True
+			return False
+		self.received += len(chunk)
+		if self.received > self.max_request_size:
+			raise HTTPException(
+				status_code=413,
+				detail=f'The request is larger than {self.max_request_size} bytes'
+			)
+		self.buffer = self.buffer[self.pos:] + chunk
+		self.pos = 0
+		return True
+
+	async def at_end(self) -> bool:
+		while self.pos == len(self.buffer):
+			if not await self.fill():
+				return True
+		return False
+
+	async def read(self, size: int) -> bytes:
+		while len(self.buffer) - self.pos < size:
+			if not await self.fill():
+				raise invalid_body('The request body is truncated')
+		ret = self.buffer[self.pos:self.pos + size]
+		self.pos += size
+		return ret
+
+	async def copy(self, size: int, sink: ImageSink) -> None:
+		"""
+		writes the next size bytes of the body to the sink as they arrive
+		"""
+		while size:
+			if await self.at_end():
+				raise invalid_body('The request body is truncated')
+			chunk = self.buffer[self.pos:self.pos + size]
+			self.pos += len(chunk)
+			size -= len(chunk)
+			sink.write(chunk)
+
+	async def rest(self) -> AsyncIterator[bytes]:
+		"""
+		yields the rest of the body as it arrives
+		"""
+		while not await self.at_end():
+			chunk = self.buffer[self.pos:]
+			self.pos = len(self.buffer)
+			yield chunk
+
+
+class StreamParser(BodyReader):
+
+	def __init__(
+		self,
+		stream: AsyncIterator[bytes],
+		workspace: Workspace,
+		pattern: Path,
+		max_image_size: int,
+		max_request_size: int,
+		max_field_size: int,
+	):
+		super().__init__(stream, max_request_size)
+		self.workspace = workspace
+		self.pattern = pattern
+		self.max_image_size = max_image_size
+		self.max_field_size = max_field_size
+		self.images: Dict[int, StreamedImage] = {}
+
+	async def peek(self) -> bytes:
+		"""
+		skips the whitespace and returns the next byte without consuming it
+		"""
+		while True:
+			while self.pos < len(self.buffer) and self.buffer[self.pos] in WHITESPACE:
+				self.pos += 1
+			if self.pos < len(self.buffer):
+				return self.buffer[self.pos:self.pos + 1]
+			if not await self.fill():
+				return b''
+
+	async def expect(self, token: bytes) -> None:
+		if await self.peek() != token:
+			raise invalid_body()
+		self.pos += 1
+
+	def matches(self, path: Path) -> bool:
+		return len(path) == len(self.pattern) and all(
+			isinstance(i, int) if j == '*' else i == j
+			for i, j in zip(path, self.pattern)
+		)
+
+	async def parse(self) -> Any:
+		value = await self.value(())
+		if await self.peek() != b'':
+			raise invalid_body()
+		return value
+
+	async def value(self, path: Path) -> Any:
+		token = await self.peek()
+		if token == b'{':
+			return await self.object(path)
+		if token == b'[':
+			return await self.array(path)
+		if token == b'"':
+			if self.matches(path):
+				return await self.image(path)
+			return await self.string()
+		return await self.literal()
+
+	async def object(self, path: Path) -> Dict:
+		ret = {}
+		await self.expect(b'{')
+		if await self.peek() == b'}':
+			self.pos += 1
+			return ret
+		while True:
+			if await self.peek() != b'"':
+				raise invalid_body()
+			key = await self.string()
+			await self.expect(b':')
+			ret[key] = await self.value(path + (key,))
+			token = await self.peek()
+			self.pos += 1
+			if token == b'}':
+				return ret
+			if token != b',':
+				raise invalid_body()
+
+	async def array(self, path: Path) -> list:
+		ret = []
+		await self.expect(b'[')
+		if await self.peek() == b']':
+			self.pos += 1
+			return ret
+		while True:
+			ret.append(await self.value(path + (len(ret),)))
+			token = await self.peek()
+			self.pos += 1
+			if token == b']':
+				return ret
+			if token != b',':
+				raise invalid_body()
+
+	async def literal(self) -> Any:
+		while True:
+			match = LITERAL.match(self.buffer, self.pos)
+			if match is None:
+				raise invalid_body()
+			if match.end() < len(self.buffer) or not await self.fill():
+				break
+		match = LITERAL.match(self.buffer, self.pos)
+		self.pos = match.end()
+		try:
+			return json.loads(match.group())
+		except ValueError:
+			raise invalid_body()
+
+	async def chunks(self) -> AsyncIterator[bytes]:
+		"""
+		yields the raw content of the string at the current position, the
+		escape sequences are yielded on their own
+		"""
+		self.pos += 1
+		while True:
+			match = STRING_END.search(self.buffer, self.pos)
+			if match is None:
+				if self.pos < len(self.buffer):
+					yield self.buffer[self.pos:]
+				self.pos = len(self.buffer)
+				if not await self.fill():
+					raise invalid_body()
+				continue
+			if match.start() > self.pos:
+				yield self.buffer[self.pos:match.start()]
+			self.pos = match.start() + 1
+			if match.group() == b'"':
+				return
+			while len(self.buffer) - self.pos < 5 and await self.fill():
+				pass
+			size = 5 if self.buffer[self.pos:self.pos + 1] == b'u' else 1
+			yield b'\\' + self.buffer[self.pos:self.pos + size]
+			self.pos += size
+
+	async def string(self) -> str:
+		raw = []
+		size = 0
+		async for chunk in self.chunks():
+			size += len(chunk)
+			if size > self.max_field_size:
+				raise HTTPException(
+					status_code=413,
+					detail=f'A field of the request is larger than {self.max_field_size} bytes'
+				)
+			raw.append(chunk)
+		try:
+			return json.loads(b'"' + b''.join(raw) + b'"')
+		except ValueError:
+			raise invalid_body()
+
+	async def image(self, path: Path) -> str:
+		index = path[self.pattern.index('*')]
+		sink = Base64Sink(self.workspace, f'{index}.jpg', self.max_image_size)
+		try:
+			async for chunk in self.chunks():
+				if chunk[:1] == b'\\':
+					try:
+						chunk = json.loads(b'"' + chunk + b'"').encode('utf-8')
+					except ValueError:
+						raise invalid_body()
+				sink.write(chunk)
+			image = sink.close()
+		finally:
+			sink.file.close()
+		self.images[index] = image
+		return image.digest
+
+
+class MultipartSinks:
+	"""
+	callbacks of the multipart parser, the files of the images field are
+	written to the workspace as they arrive and the other fields are kept
+	"""
+
+	def __init__(self, workspace: Workspace, max_image_size: int, max_field_size: int):
+		self.workspace = workspace
+		self.max_image_size = max_image_size
+		self.max_field_size = max_field_size
+		self.fields: Dict[str, str] = {}
+		self.images: Dict[int, StreamedImage] = {}
+		self.field_size = 0
+		self.header = b''
+		self.headers: Dict[bytes, bytes] = {}
+		self.name: Optional[str] = None
+		self.value: List[bytes] = []
+		self.sink: Optional[ImageSink] = None
+		self.ended = False
+
+	def callbacks(self) -> Dict:
+		return {
+			'on_part_begin': self.on_part_begin,
+			'on_header_field': self.on_header_field,
+			'on_header_value': self.on_header_value,
+			'on_header_end': self.on_header_end,
+			'on_headers_finished': self.on_headers_finished,
+			'on_part_data': self.on_part_data,
+			'on_part_end': self.on_part_end,
+			'on_end': self.on_end,
+		}
+
+	def on_part_begin(self) -> None:
+		self.header = b''
+		self.headers = {}
+		self.name = None
+		self.value = []
+
+	def on_header_field(self, data: bytes, start: int, end: int) -> None:
+		self.header += data[start:end]
+
+	def on_header_value(self, data: bytes, start: int, end: int) -> None:
+		name = self.header.lower()
+		self.headers[name] = self.headers.get(name, b'') + data[start:end]
+
+	def on_header_end(self) -> None:
+		self.header = b''
+
+	def on_headers_finished(self) -> None:
+		_, options = parse_options_header(self.headers.get(b'content-disposition', b''))
+		self.name = options.get(b'name', b'').decode('utf-8', 'replace')
+		if b'filename' not in options:
+			if self.name == 'images':
+				raise invalid_body('images should only contain files')
+		elif self.name == 'images':
+			self.sink = ImageSink(self.workspace, f'{len(self.images)}.jpg', self.max_image_size)
+		else:
+			# the other files are not part of the request
+			self.name = None
+
+	def on_part_data(self, data: bytes, start: int, end: int) -> None:
+		if self.sink is not None:
+			self.sink.write(data[start:end])
+		elif self.name is not None:
+			self.field_size += end - start
+			if self.field_size > self.max_field_size:
+				raise HTTPException(
+					status_code=413,
+					detail=f'The fields of the request are larger than {self.max_field_size} bytes'
+				)
+			self.value.append(data[start:end])
+
+	def on_part_end(self) -> None:
+		if self.sink is not None:
+			self.images[len(self.images)] = self.sink.close()
+			self.sink = None
+		elif self.name is not None:
+			value = b''.join(self.value)
+			try:
+				self.fields[self.name] = value.decode('utf-8')
+			except UnicodeDecodeError:
+				self.fields[self.name] = value.decode('latin-1')
+
+	def on_end(self) -> None:
+		self.ended = True
+
+	def close(self) -> None:
+		if self.sink is not None:
+			self.sink.file.close()
+
+
+async def ingest_json(
+	request: Request,
+	workspace: Workspace,
+	pattern: Path,
+	max_image_size: int = INGEST_MAX_IMAGE_SIZE,
+	max_request_size: int = INGEST_MAX_REQUEST_SIZE,
+	max_field_size: int = INGEST_MAX_FIELD_SIZE,
+) -> Tuple[Any, Dict[int, StreamedImage]]:
+	"""
+	parses the json body of the request, the images at the pattern are
+	saved inside the workspace as {index}.jpg and replaced by their sha256
+	"""
+	parser = StreamParser(
+		request.stream(),
+		workspace,
+		pattern,
+		max_image_size,
+		max_request_size,
+		max_field_size,
+	)
+	body = await parser.parse()
+	return body, parser.images
+
+
+async def ingest_frames(
+	request: Request,
+	workspace: Workspace,
+	max_image_size: int = INGEST_MAX_IMAGE_SIZE,
+	max_request_size: int = INGEST_MAX_REQUEST_SIZE,
+	max_field_size: int = INGEST_MAX_FIELD_SIZE,
+) -> Tuple[Dict, Dict[int, StreamedImage]]:
+	"""
+	reads a length prefixed body, every frame is a 4 byte big endian
+	length followed by that many bytes. the first frame is the json of the
+	fields of the request, the others are the raw images which are written
+	to the workspace as they arrive. the sha256 of the images is set as the
+	imageContent of the returned body.
+	"""
+	reader = BodyReader(request.stream(), max_request_size)
+	size = int.from_bytes(await reader.read(4), 'big')
+	if size > max_field_size:
+		raise HTTPException(
+			status_code=413,
+			detail=f'The fields of the request are larger than {max_field_size} bytes'
+		)
+	try:
+		body = json.loads(await reader.read(size))
+		assert isinstance(body, dict)
+	except (ValueError, AssertionError):
+		raise invalid_body()
+	images = {}
+	while not await reader.at_end():
+		size = int.from_bytes(await reader.read(4), 'big')
+		sink = ImageSink(workspace, f'{len(images)}.jpg', max_image_size)
+		try:
+			await reader.copy(size, sink)
+		finally:
+			sink.file.close()
+		images[len(images)] = sink.close()
+	body['imageContent'] = [images[i].digest for i in range(len(images))]
+	return body, images
+
+
+async def ingest_multipart(
+	request: Request,
+	workspace: Workspace,
+	max_image_size: int = INGEST_MAX_IMAGE_SIZE,
+	max_request_size: int = INGEST_MAX_REQUEST_SIZE,
+	max_field_size: int = INGEST_MAX_FIELD_SIZE,
+) -> Tuple[Dict, Dict[int, StreamedImage]]:
+	"""
+	reads a multipart/form-data body, the images are the files of the
+	images field and meta is a json field. the body is parsed as it
+	arrives and the images are written to the workspace without being
+	spooled first. the sha256 of the images is set as the imageContent of
+	the returned body.
+	"""
+	_, options = parse_options_header(request.headers.get('content-type', ''))
+	if not options.get(b'boundary'):
+		raise invalid_body('The multipart boundary is missing')
+	reader = BodyReader(request.stream(), max_request_size)
+	sinks = MultipartSinks(workspace, max_image_size, max_field_size)
+	parser = MultipartParser(options[b'boundary'], sinks.callbacks())
+	try:
+		async for chunk in reader.rest():
+			parser.write(chunk)
+		parser.finalize()
+	except ValueError:
+		raise invalid_body('Invalid multipart body')
+	finally:
+		sinks.close()
+	if not sinks.ended:
+		raise invalid_body('The request body is truncated')
+	body: Dict[str, Any] = dict(sinks.fields)
+	if 'meta' in body:
+		try:
+			body['meta'] = json.loads(body['meta'])
+		except ValueError:
+			raise invalid_body('meta should be a json object')
+	images = sinks.images
+	body['imageContent'] = [images[i].digest for i in range(len(images))]
+	return body, images
+
+
+def parse_streamed(model: Type[BaseModel], body: Any) -> BaseModel:
+	"""
+	validates the parsed body like fastapi does for the regular endpoints
+	"""
+	try:
+		return model.parse_obj(body)
+	except ValidationError as e:
+		raise RequestValidationError(e.raw_errors, body=body)
+
+
+def request_body(model: Type[BaseModel], content: Optional[Dict] = None) -> Dict:
+	"""
+	openapi_extra documenting the body of an endpoint that reads it itself,
+	content documents the other accepted content types
+	"""
+	# the schema is cached by pydantic, it must not be modified
+	schema = copy.deepcopy(model.schema(ref_template='{model}'))
+	definitions = schema.pop('definitions', {})
+
+	def inline(value: Any) -> Any:
+		if isinstance(value, dict):
+			if '$ref' in value:
+				return inline(definitions[value['$ref']])
+			return {k: inline(v) for k, v in value.items()}
+		if isinstance(value, list):
+			return [inline(i) for i in value]
+		return value
+
+	return {
+		'requestBody': {
+			'content': {
+				'application/json': {'schema': inline(schema)},
+				**(content or {}),
+			},
+			'required': True,
+		},
+	}
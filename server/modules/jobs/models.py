@@ -0,0 +1,144 @@
+from datetime import datetime, timedelta
+from enum import Enum
+from typing import Any, Dict, List, Optional
+from uuid import uuid4
+
+from pydantic import BaseModel, Field
+from pymongo import ASCENDING, ReplaceOne, ReturnDocument
+
+from server.database import get_db
+from server.models import OCRImageResponse
+
+from ..core.mixins import DBModelMixin
+
+
+class JobStatusEnum(str, Enum):
+	queued = 'queued'
+	running = 'running'
+	done = 'done'
+	failed = 'failed'
+
+
+class Job(BaseModel, DBModelMixin):
+	id: Optional[str] = Field(default_factory=lambda: str(uuid4()))
+	status: JobStatusEnum = JobStatusEnum.queued
+	request: Dict[str, Any] = Field(
+		description='the OCRRequest of the job, imageContent holds the sha256 of the images'
+	)
+	folder: str = Field(description='folder of the images, shared with the job workers')
+	images: int
+	completed: int = 0
+	error: Optional[str]
+	worker: Optional[str]
+	attempts: int = Field(0, description='runs of the job that hit a transient error')
+	retry_at: Optional[datetime] = Field(description='a requeued job is not claimed before then')
+	created: Optional[datetime] = Field(default_factory=datetime.now)
+	modified: Optional[datetime] = Field(default_factory=datetime.now)
+	started: Optional[datetime]
+	finished: Optional[datetime]
+
+	class Config:
+		use_enum_values = True
+
+	class Meta:
+		collection_name = 'jobs'
+		# one document per image, the results of a large job do not fit in
+		# a single mongo document
+		results_collection_name = 'job_results'
+
+	async def heartbeat(self) -> bool:
+		"""
+		renews the claim of the worker on the job, returns False when the job
+		was claimed by another worker in the meantime
+		"""
+		ret = await get_db()[self.Meta.collection_name].update_one(
+			{'id': self.id, 'worker': self.worker},
+			{'$set': {'modified': datetime.now()}},
+		)
+		return ret.matched_count == 1
+
+	@classmethod
+	async def create_indexes(cls) -> None:
+		await get_db()[cls.Meta.results_collection_name].create_index(
+			[('job_id', ASCENDING), ('index', ASCENDING)],
+			unique=True,
+		)
+
+	async def save_results(self, start: int, results: List[Dict[str, Any]]) -> None:
+		"""
+		saves the results of the images from start, a chunk that is run
+		again replaces its results
+		"""
+		if not results:
+			return
+		await get_db()[self.Meta.results_collection_name].bulk_write([
+			ReplaceOne(
+				{'job_id': self.id, 'index': start + idx},
+				{'job_id': self.id, 'index': start + idx, 'result': result},
+				upsert=True,
+			) for idx, result in enumerate(results)
+		], ordered=False)
+
+	async def load_results(self, offset: int, limit: int) -> List[Optional[Dict[str, Any]]]:
+		"""
+		returns the results of the images from offset, None for the images
+		that are not processed yet
+		"""
+		end = min(offset + limit, self.images)
+		ret: List[Optional[Dict[str, Any]]] = [None] * max(end - offset, 0)
+		cursor = get_db()[self.Meta.results_collection_name].find(
+			{'job_id': self.id, 'index': {'$gte': offset, '$lt': end}},
+		)
+		async for i in cursor:
+			ret[i['index'] - offset] = i['result']
+		return ret
+
+	@classmethod
+	async def claim(cls, worker: str, stale_after: float) -> Optional['Job']:
+		"""
+		atomically marks the oldest queued job (or a running one whose
+		worker stopped reporting) as running by the worker and returns it
+		"""
+		now = datetime.now()
+		ret = await get_db()[cls.Meta.collection_name].find_one_and_update(
+			{'$or': [
+				{
+					'status': JobStatusEnum.queued.value,
+					'retry_at': {'$not': {'$gt': now}},
+				},
+				{
+					'status': JobStatusEnum.running.value,
+					'modified': {'$lt': now - timedelta(seconds=stale_after)},
+				},
+			]},
+			{'$set': {
+				'status': JobStatusEnum.running.value,
+				'worker': worker,
+				'started': now,
+				'modified': now,
+			}},
+			sort=[('created', 1)],
+			return_document=ReturnDocument.AFTER,
+		)
+		return cls(**ret) if ret else None
+
+
+class JobStatus(BaseModel):
+	id: str
+	status: JobStatusEnum
+	images: int = Field(description='number of images of the job')
+	completed: int = Field(description='number of images already processed')
+	error: Optional[str]
+	created: datetime
+	started: Optional[datetime]
+	finished: Optional[datetime]
+
+
+class JobResults(BaseModel):
+	id: str
+	status: JobStatusEnum
+	offset: int = Field(description='index of the first image of the page')
+	results: List[Optional[OCRImageResponse]] = Field(
+		description='result of every image of the page, null while it is not processed'
+	)
+	next: Optional[int] = Field(description='offset of the next page, missing on the last page')
@@ -0,0 +1,102 @@
+import json
+
+from fastapi import APIRouter, HTTPException, Query, Request
+from fastapi.concurrency import run_in_threadpool
+
+from server.config import (JOB_QUOTA, JOBS_FOLDER, JOBS_RESULTS_PAGE_SIZE,
+                           JOBS_TOTAL_QUOTA)
+from server.helper import OCR_REQUEST_BODY, process_request, read_ocr_request
+from server.models import OCRImageResponse
+from server.modules.workspaces.manager import WorkspaceManager
+
+from .models import Job, JobResults, JobStatus
+
+router = APIRouter(
+	prefix='/ocr/jobs',
+	tags=['Jobs'],
+)
+
+# the images of the jobs are kept here until a worker has processed them
+jobs_storage = WorkspaceManager(JOBS_FOLDER, JOB_QUOTA, JOBS_TOTAL_QUOTA)
+
+
+async def get_job(job_id: str) -> Job:
+	job = await Job.get(job_id)
+	if job is None:
+		raise HTTPException(status_code=404, detail='No such job present')
+	return job
+
+
+@router.post(
+	'',
+	response_model=JobStatus,
+	status_code=202,
+	openapi_extra=OCR_REQUEST_BODY,
+)
+async def submit_job(request: Request) -> JobStatus:
+	"""
+	queues the images of the request (same body as /ocr/infer) and returns
+	the job to poll. the job is processed by the job workers.
+	"""
+	# the queued jobs count against the quota until a worker removed them
+	await run_in_threadpool(jobs_storage.account_detached)
+	with jobs_storage.create('job') as workspace:
+		ocr_request, images = await read_ocr_request(request, workspace)
+		process_request(ocr_request, images)
+		job = Job(
+			request=json.loads(ocr_request.json()),
+			folder=workspace.path,
+			images=len(images),
+		)
+		await job.save()
+		workspace.detach()
+	return JobStatus(**job.dict())
+
+
+@router.get('/{job_id}', response_model=JobStatus)
+async def get_job_status(job_id: str) -> JobStatus:
+	return JobStatus(**(await get_job(job_id)).dict())
+
+
+@router.get(
+	'/{job_id}/results',
+	response_model=JobResults,
+	response_model_exclude_none=True,
+)
+async def get_job_results(
+	job_id: str,
+	offset: int = Query(0, ge=0),
+	limit: int = Query(JOBS_RESULTS_PAGE_SIZE, ge=1, le=JOBS_RESULTS_PAGE_SIZE),
+) -> JobResults:
+	"""
+	returns one page of the results processed so far, null for the remaining
+	images. the next pages are fetched with the offset given in next.
+	"""
+	job = await get_job(job_id)
+	results = await job.load_results(offset, limit)
+	end = offset + len(results)
+	return JobResults(
+		id=job.id,
+		status=job.status,
+		offset=offset,
+		results=results,
+		next=end if end < job.images else None,
+	)
+
+
+@router.get(
+	'/{job_id}/results/{index}',
+	response_model=OCRImageResponse,
+	response_model_exclude_none=True,
+)
+async def get_job_result(job_id: str, index: int) -> OCRImageResponse:
+	job = await get_job(job_id)
+	if not 0 <= index < job.images:
+		raise HTTPException(status_code=404, detail='No such image in the job')
+	result, = await job.load_results(index, 1)
+	if result is None:
+		raise HTTPException(
+			status_code=409,
+			detail=f'The image is not processed yet, the job is {job.status}'
+		)
+	return OCRImageResponse(**result)
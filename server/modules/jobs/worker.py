@@ -0,0 +1,154 @@
+"""
+Drains the queued jobs independently of the api processes, so that the
+inference and the request handling can be scaled separately:
+
+	python -m server.modules.jobs.worker
+
+The worker needs access to the JOBS_FOLDER of the api processes. The
+results are saved after every JOBS_CHUNK_SIZE images. The worker renews its
+claim on the job every JOBS_HEARTBEAT_INTERVAL seconds, a job whose worker
+stopped doing so for JOBS_STALE_AFTER seconds is requeued and resumes from
+the last saved chunk. A job that hits a transient error is requeued as well,
+after JOBS_RETRY_AFTER seconds, and only fails after JOBS_MAX_ATTEMPTS runs.
+"""
+
+import asyncio
+import os
+import shutil
+import socket
+from datetime import datetime, timedelta
+from os.path import join
+from typing import Dict, List
+
+from fastapi import HTTPException
+from fastapi.concurrency import run_in_threadpool
+from pydantic import ValidationError
+
+from server.config import (JOBS_CHUNK_SIZE, JOBS_HEARTBEAT_INTERVAL,
+                           JOBS_MAX_ATTEMPTS, JOBS_POLL_INTERVAL,
+                           JOBS_RETRY_AFTER, JOBS_STALE_AFTER)
+from server.database import close_mongo_connection, connect_to_mongo
+from server.helper import infer_images, link_images
+from server.models import OCRRequest
+from server.modules.core.tensors import encoded_meta
+from server.modules.ingest.stream import StreamedImage
+from server.modules.workspaces.manager import workspace_manager
+
+from .models import Job, JobStatusEnum
+
+
+def infer_chunk(job: Job, start: int, end: int) -> List[Dict]:
+	"""
+	runs the model of the job on its images from start to end
+	"""
+	request = OCRRequest.parse_obj({
+		**job.request,
+		'imageContent': job.request['imageContent'][start:end],
+	})
+	with workspace_manager.create('job_chunk') as workspace:
+		link_images(
+			[join(job.folder, f'{idx}.jpg') for idx in range(start, end)],
+			workspace.path,
+		)
+		images = {
+			idx: StreamedImage(
+				f'{idx}.jpg',
+				join(workspace.path, f'{idx}.jpg'),
+				digest,
+				0,
+			) for idx, digest in enumerate(request.imageContent)
+		}
+		results = infer_images(request, images, workspace.path)
+	# the packed probabilities are stored as their base64 strings
+	return [{**i, 'meta': encoded_meta(i.get('meta') or {})} for i in results]
+
+
+async def heartbeat(job: Job, interval: float) -> None:
+	"""
+	keeps the claim on the job while its chunks run, returns when another
+	worker claimed the job
+	"""
+	while True:
+		await asyncio.sleep(interval)
+		try:
+			if not await job.heartbeat():
+				print(f'the job {job.id} was claimed by another worker')
+				return
+		except Exception as e:
+			print(f'unable to renew the claim on the job {job.id}: {e}')
+
+
+def is_transient(e: Exception) -> bool:
+	"""
+	whether the job may succeed when it is run again. the invalid requests
+	and the other 4xx errors are final, the rest (eg. the 503 when there is
+	no scratch space, a worker that failed to start) are not.
+	"""
+	if isinstance(e, HTTPException):
+		return e.status_code >= 500
+	return not isinstance(e, ValidationError)
+
+
+async def run_job(
+	job: Job,
+	chunk_size: int = JOBS_CHUNK_SIZE,
+	heartbeat_interval: float = JOBS_HEARTBEAT_INTERVAL,
+	retry_after: float = JOBS_RETRY_AFTER,
+	max_attempts: int = JOBS_MAX_ATTEMPTS,
+) -> None:
+	print(f'running the job {job.id} from image {job.completed}/{job.images}')
+	beat = asyncio.ensure_future(heartbeat(job, heartbeat_interval))
+	try:
+		for start in range(job.completed, job.images, chunk_size):
+			end = min(start + chunk_size, job.images)
+			results = await run_in_threadpool(infer_chunk, job, start, end)
+			if beat.done():
+				# the job and its folder belong to the other worker now
+				return
+			await job.save_results(start, results)
+			await job.update(completed=end)
+		await job.update(status=JobStatusEnum.done.value, finished=datetime.now())
+	except Exception as e:
+		error = e.detail if isinstance(e, HTTPException) else str(e)
+		attempts = job.attempts + 1
+		if is_transient(e) and attempts < max_attempts:
+			print(f'the job {job.id} is requeued after: {e}')
+			# the images are kept for the next run
+			await job.update(
+				status=JobStatusEnum.queued.value,
+				worker=None,
+				error=error,
+				attempts=attempts,
+				retry_at=datetime.now() + timedelta(seconds=retry_after),
+			)
+			return
+		print(f'the job {job.id} failed: {e}')
+		await job.update(
+			status=JobStatusEnum.failed.value,
+			error=error,
+			attempts=attempts,
+			finished=datetime.now(),
+		)
+	finally:
+		beat.cancel()
+	shutil.rmtree(job.folder, ignore_errors=True)
+
+
+async def main() -> None:
+	await connect_to_mongo()
+	await Job.create_indexes()
+	worker = f'{socket.gethostname()}:{os.getpid()}'
+	print(f'job worker {worker} started')
+	try:
+		while True:
+			job = await Job.claim(worker, JOBS_STALE_AFTER)
+			if job is None:
+				await asyncio.sleep(JOBS_POLL_INTERVAL)
+				continue
+			await run_job(job)
+	finally:
+		await close_mongo_connection()
+
+
+if __name__ == '__main__':
+	asyncio.run(main())
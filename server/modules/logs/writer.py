@@ -0,0 +1,164 @@
+"""
+Buffered logging of the requests.
+
+log only puts the record on a bounded in-memory queue, a background thread
+appends the queued records as compact json lines to <folder>/<name>.<pid>.jsonl
+(one file per api process, so they never write to the same file). The file
+is rotated to <name>.<time>.<pid>.<n>.jsonl.gz once it is larger than max_bytes
+or older than max_age. When the queue is full the records are dropped, and
+counted, instead of slowing down the requests.
+"""
+
+import gzip
+import os
+import queue
+import shutil
+import threading
+import time
+from os.path import join
+from typing import Dict, List, Optional
+
+from server.config import (LOGS_FLUSH_INTERVAL, LOGS_MAX_AGE, LOGS_MAX_BYTES,
+                           LOGS_QUEUE_SIZE)
+from server.modules.core.serialization import dumps
+
+# the writers of the process, closed when the api stops
+writers: List['LogWriter'] = []
+
+
+class LogWriter:
+
+	def __init__(
+		self,
+		folder: str,
+		name: str,
+		max_queue: int = LOGS_QUEUE_SIZE,
+		max_bytes: int = LOGS_MAX_BYTES,
+		max_age: float = LOGS_MAX_AGE,
+		flush_interval: float = LOGS_FLUSH_INTERVAL,
+		batch_size: int = 256,
+	):
+		self.folder = folder
+		self.name = name
+		self.max_bytes = max_bytes
+		self.max_age = max_age
+		self.flush_interval = flush_interval
+		self.batch_size = batch_size
+		self.queue: 'queue.Queue[Optional[Dict]]' = queue.Queue(max_queue)
+		self.lock = threading.Lock()
+		self.thread: Optional[threading.Thread] = None
+		self.file = None
+		self.opened = 0.0
+		self.written = 0
+		self.dropped = 0
+		self.rotations = 0
+		writers.append(self)
+
+	@property
+	def path(self) -> str:
+		return join(self.folder, f'{self.name}.{os.getpid()}.jsonl')
+
+	def log(self, record: Dict) -> bool:
+		"""
+		queues the record, returns False if it was dropped
+		"""
+		self._start()
+		try:
+			self.queue.put_nowait(record)
+			return True
+		except queue.Full:
+			with self.lock:
+				self.dropped += 1
+				dropped = self.dropped
+			if dropped % 1000 == 1:
+				print(f'the {self.name} logs queue is full, {dropped} records dropped so far')
+			return False
+
+	def _start(self) -> None:
+		if self.thread is not None and self.thread.is_alive():
+			return
+		with self.lock:
+			if self.thread is None or not self.thread.is_alive():
+				self.thread = threading.Thread(
+					target=self._run,
+					name=f'{self.name}-logs',
+					daemon=True,
+				)
+				self.thread.start()
+
+	def _run(self) -> None:
+		while True:
+			try:
+				records = [self.queue.get(timeout=self.flush_interval)]
+			except queue.Empty:
+				records = []
+			while records and len(records) < self.batch_size:
+				try:
+					records.append(self.queue.get_nowait())
+				except queue.Empty:
+					break
+			stop = None in records
+			self._write([i for i in records if i is not None])
+			for _ in records:
+				self.queue.task_done()
+			if stop:
+				self._close_file()
+				return
+
+	def _write(self, records: List[Dict]) -> None:
+		try:
+			if records:
+				if self.file is None:
+					os.makedirs(self.folder, exist_ok=True)
+					self.file = open(self.path, 'ab')
+					self.opened = time.time()
+				self.file.write(b''.join(dumps(i) + b'\n' for i in records))
+				self.file.flush()
+				self.written += len(records)
+			if self.file is not None and (
+				self.file.tell() >= self.max_bytes
+				or time.time() - self.opened >= self.max_age
+			):
+				self.rotate()
+		except OSError as e:
+			print(f'unable to write the {self.name} logs: {e}')
+			self._close_file()
+
+	def _close_file(self) -> None:
+		if self.file is not None:
+			try:
+				self.file.close()
+			except OSError:
+				pass
+			self.file = None
+
+	def rotate(self) -> None:
+		"""
+		closes the current file and compresses it, only called by the writer
+		"""
+		self._close_file()
+		self.rotations += 1
+		stamp = time.strftime('%Y%m%d-%H%M%S')
+		rotated = join(self.folder, f'{self.name}.{stamp}.{os.getpid()}.{self.rotations}.jsonl')
+		os.replace(self.path, rotated)
+		with open(rotated, 'rb') as f, gzip.open(f'{rotated}.gz', 'wb') as out:
+			shutil.copyfileobj(f, out)
+		os.remove(rotated)
+
+	def flush(self) -> None:
+		"""
+		waits until the queued records are written
+		"""
+		if self.thread is not None and self.thread.is_alive():
+			self.queue.join()
+
+	def close(self, timeout: float = 10) -> None:
+		if self.thread is not None and self.thread.is_alive():
+			self.queue.put(None)
+			self.thread.join(timeout)
+		self.thread = None
+
+
+def close_writers() -> None:
+	for writer in writers:
+		writer.close()
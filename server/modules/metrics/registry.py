@@ -0,0 +1,206 @@
+"""
+Minimal Prometheus metrics, exported in the text format by /ocr/metrics.
+
+The counters, gauges and histograms are kept in memory by each api process.
+The values that are already tracked elsewhere (queue sizes, cache and
+residency counters) are not updated on every request, they are read with
+callbacks when the metrics are scraped.
+"""
+
+import math
+import threading
+from bisect import bisect_left
+from typing import Callable, Dict, Iterator, List, Sequence, Tuple, Union
+
+# seconds, up to the slow inference runs
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+# (name suffix, label values, extra label pairs, value)
+Sample = Tuple[str, Tuple[str, ...], Tuple[Tuple[str, str], ...], float]
+
+
+def format_value(value: float) -> str:
+	if math.isinf(value):
+		return '+Inf' if value > 0 else '-Inf'
+	if float(value).is_integer():
+		return str(int(value))
+	return repr(float(value))
+
+
+def escape(value: str) -> str:
+	return value.replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+class Metric:
+	kind = 'untyped'
+
+	def __init__(self, name: str, documentation: str, labels: Sequence[str] = ()):
+		self.name = name
+		self.documentation = documentation
+		self.labels = tuple(labels)
+		self.values: Dict[Tuple[str, ...], object] = {}
+		self.lock = threading.Lock()
+
+	def _key(self, labels: Dict[str, object]) -> Tuple[str, ...]:
+		if len(labels) != len(self.labels):
+			raise ValueError(f'{self.name} expects the labels {self.labels}, got {tuple(labels)}')
+		return tuple(str(labels[i]) for i in self.labels)
+
+	def samples(self) -> Iterator[Sample]:
+		with self.lock:
+			values = list(self.values.items())
+		for key, value in values:
+			yield '', key, (), value
+
+	def render(self) -> List[str]:
+		ret = [
+			f'# HELP {self.name} {escape(self.documentation)}',
+			f'# TYPE {self.name} {self.kind}',
+		]
+		for suffix, key, extra, value in self.samples():
+			pairs = list(zip(self.labels, key)) + list(extra)
+			labels = ','.join(f'{i}="{escape(j)}"' for i, j in pairs)
+			labels = f'{{{labels}}}' if labels else ''
+			ret.append(f'{self.name}{suffix}{labels} {format_value(value)}')
+		return ret
+
+
+class Counter(Metric):
+	kind = 'counter'
+
+	def inc(self, amount: float = 1, **labels) -> None:
+		key = self._key(labels)
+		with self.lock:
+			self.values[key] = self.values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+	kind = 'gauge'
+
+	def set(self, value: float, **labels) -> None:
+		key = self._key(labels)
+		with self.lock:
+			self.values[key] = value
+
+	def inc(self, amount: float = 1, **labels) -> None:
+		key = self._key(labels)
+		with self.lock:
+			self.values[key] = self.values.get(key, 0) + amount
+
+	def dec(self, amount: float = 1, **labels) -> None:
+		self.inc(-amount, **labels)
+
+
+class Histogram(Metric):
+	kind = 'histogram'
+
+	def __init__(
+		self,
+		name: str,
+		documentation: str,
+		labels: Sequence[str] = (),
+		buckets: Sequence[float] = DEFAULT_BUCKETS,
+	):
+		super().__init__(name, documentation, labels)
+		self.buckets = tuple(sorted(buckets))
+
+	def observe(self, value: float, **labels) -> None:
+		key = self._key(labels)
+		# the count of each bucket is kept on its own and summed when rendered
+		idx = bisect_left(self.buckets, value)
+		with self.lock:
+			state = self.values.get(key)
+			if state is None:
+				state = self.values[key] = [[0] * (len(self.buckets) + 1), 0.0]
+			state[0][idx] += 1
+			state[1] += value
+
+	def samples(self) -> Iterator[Sample]:
+		with self.lock:
+			values = [(i, list(j[0]), j[1]) for i, j in self.values.items()]
+		for key, counts, total in values:
+			count = 0
+			for bound, bucket in zip(self.buckets + (math.inf,), counts):
+				count += bucket
+				yield '_bucket', key, (('le', format_value(bound)),), count
+			yield '_sum', key, (), total
+			yield '_count', key, (), count
+
+
+class Callback(Metric):
+	"""
+	a metric read when it is scraped, function returns the value or a dict
+	of the values keyed by their label values
+	"""
+
+	def __init__(
+		self,
+		name: str,
+		documentation: str,
+		kind: str,
+		function: Callable[[], Union[float, Dict[Tuple[str, ...], float]]],
+		labels: Sequence[str] = (),
+	):
+		super().__init__(name, documentation, labels)
+		self.kind = kind
+		self.function = function
+
+	def samples(self) -> Iterator[Sample]:
+		values = self.function()
+		if not isinstance(values, dict):
+			values = {(): values}
+		for key, value in values.items():
+			yield '', tuple(str(i) for i in key), (), value
+
+
+class Registry:
+
+	def __init__(self):
+		self.metrics: Dict[str, Metric] = {}
+		self.lock = threading.Lock()
+
+	def register(self, metric: Metric) -> Metric:
+		with self.lock:
+			if metric.name in self.metrics:
+				raise ValueError(f'the metric {metric.name} is already registered')
+			self.metrics[metric.name] = metric
+		return metric
+
+	def counter(self, name: str, documentation: str, labels: Sequence[str] = ()) -> Counter:
+		return self.register(Counter(name, documentation, labels))
+
+	def gauge(self, name: str, documentation: str, labels: Sequence[str] = ()) -> Gauge:
+		return self.register(Gauge(name, documentation, labels))
+
+	def histogram(
+		self,
+		name: str,
+		documentation: str,
+		labels: Sequence[str] = (),
+		buckets: Sequence[float] = DEFAULT_BUCKETS,
+	) -> Histogram:
+		return self.register(Histogram(name, documentation, labels, buckets))
+
+	def callback(
+		self,
+		name: str,
+		documentation: str,
+		kind: str,
+		function: Callable,
+		labels: Sequence[str] = (),
+	) -> Callback:
+		return self.register(Callback(name, documentation, kind, function, labels))
+
+	def render(self) -> str:
+		with self.lock:
+			metrics = list(self.metrics.values())
+		ret = []
+		for metric in metrics:
+			try:
+				ret.extend(metric.render())
+			except Exception as e:
+				print(f'unable to collect the metric {metric.name}: {e}')
+		return '\n'.join(ret) + '\n'
+
+
+metrics = Registry()
@@ -0,0 +1,130 @@
+from typing import Dict, Tuple
+
+from fastapi import APIRouter
+from starlette.responses import Response
+
+from server.helper import batch_scheduler
+from server.modules.archive.images import image_archive
+from server.modules.cache.results import result_cache
+from server.modules.core.aio import backend_limits
+from server.modules.logs.writer import writers
+from server.modules.postprocess.lexicons import lexicon_store
+from server.modules.residency.manager import residency_managers
+
+from .registry import metrics
+
+router = APIRouter(
+	prefix='/ocr',
+	tags=['Metrics'],
+)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def batch_queue() -> Dict[Tuple[str, str, str], int]:
+	"""
+	images waiting in the open batches, by model
+	"""
+	ret = {}
+	with batch_scheduler.lock:
+		for key, batch in batch_scheduler.pending.items():
+			model = tuple(str(i) for i in key[:3])
+			ret[model] = ret.get(model, 0) + len(batch.images)
+	return ret
+
+
+def cache_counter(name: str) -> Dict[Tuple[str], int]:
+	return {
+		('results',): getattr(result_cache, name),
+		('lexicons',): getattr(lexicon_store, name),
+	}
+
+
+def residency(name: str) -> Dict[Tuple[str], int]:
+	return {(i,): getattr(j, name) for i, j in list(residency_managers.items())}
+
+
+metrics.callback(
+	'ocr_batch_queue_images',
+	'images waiting for their batch to start',
+	'gauge',
+	batch_queue,
+	('version', 'modality', 'language'),
+)
+metrics.callback(
+	'ocr_backend_in_flight',
+	'requests running an inference backend',
+	'gauge',
+	lambda: {(i,): j.running for i, j in backend_limits.items()},
+	('backend',),
+)
+metrics.callback(
+	'ocr_backend_queue',
+	'requests waiting for an inference backend',
+	'gauge',
+	lambda: {(i,): j.waiting for i, j in backend_limits.items()},
+	('backend',),
+)
+metrics.callback(
+	'ocr_log_queue_records',
+	'request logs waiting to be written',
+	'gauge',
+	lambda: {(i.name,): i.queue.qsize() for i in writers},
+	('log',),
+)
+metrics.callback(
+	'ocr_archive_queue_bytes',
+	'bytes of the images waiting to be archived',
+	'gauge',
+	lambda: image_archive.queued_bytes,
+)
+metrics.callback(
+	'ocr_cache_hits_total',
+	'lookups found in the cache',
+	'counter',
+	lambda: cache_counter('hits'),
+	('cache',),
+)
+metrics.callback(
+	'ocr_cache_misses_total',
+	'lookups missing from the cache',
+	'counter',
+	lambda: cache_counter('misses'),
+	('cache',),
+)
+metrics.callback(
+	'ocr_models_loaded',
+	'models currently loaded',
+	'gauge',
+	lambda: {(i,): len(j.models) for i, j in list(residency_managers.items())},
+	('manager',),
+)
+metrics.callback(
+	'ocr_model_hits_total',
+	'requests for a model that was already loaded',
+	'counter',
+	lambda: residency('hits'),
+	('manager',),
+)
+metrics.callback(
+	'ocr_model_loads_total',
+	'models loaded',
+	'counter',
+	lambda: residency('loads'),
+	('manager',),
+)
+metrics.callback(
+	'ocr_model_evictions_total',
+	'models unloaded to make space for another one',
+	'counter',
+	lambda: residency('evictions'),
+	('manager',),
+)
+
+
+@router.get('/metrics', response_class=Response)
+def get_metrics() -> Response:
+	"""
+	metrics of this api process in the prometheus text format
+	"""
+	return Response(metrics.render(), media_type=CONTENT_TYPE)
@@ -0,0 +1,154 @@
+"""
+Timing of the processing stages of the requests.
+
+The middleware starts a RequestTimer for every request and keeps it in a
+context variable. The code of each stage adds its duration with stage(name),
+the context is copied to the threadpool so this works from the sync code as
+well. Once the request is over the durations are observed in the stage
+histogram, labelled with the endpoint and the model of the request. The
+streamed responses keep running their stages after the middleware returned,
+they defer the stage histograms until the body is sent (see defer).
+
+	decode      reading the body and decoding the images into the workspace
+	download    downloading the images given as urls
+	workspace   creating the scratch folder of the request
+	start       starting a container/worker and loading the model
+	inference   running the model
+	parse       reading the output of the model
+	serialize   encoding the response
+"""
+
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Iterator, Optional, Tuple
+
+from starlette.requests import Request
+
+from .registry import metrics
+
+STAGES = ('decode', 'download', 'workspace', 'start', 'inference', 'parse', 'serialize')
+
+requests_total = metrics.counter(
+	'ocr_requests_total',
+	'requests served',
+	('endpoint', 'method', 'status'),
+)
+requests_in_flight = metrics.gauge(
+	'ocr_requests_in_flight',
+	'requests being processed',
+)
+request_duration = metrics.histogram(
+	'ocr_request_duration_seconds',
+	'time until the response headers are sent',
+	('endpoint', 'method'),
+)
+stage_duration = metrics.histogram(
+	'ocr_stage_duration_seconds',
+	'time spent by the requests in each processing stage',
+	('endpoint', 'stage', 'version', 'modality', 'language'),
+)
+
+
+class RequestTimer:
+
+	def __init__(self):
+		self.start = time.perf_counter()
+		self.stages: Dict[str, float] = {}
+		self.model: Tuple[str, str, str] = ('', '', '')
+		self.lock = threading.Lock()
+		# parts of the response still running after the middleware returned
+		self.pending = 0
+		self.endpoint: Optional[str] = None
+
+	def add(self, name: str, seconds: float) -> None:
+		with self.lock:
+			self.stages[name] = self.stages.get(name, 0) + seconds
+
+	def elapsed(self) -> float:
+		return time.perf_counter() - self.start
+
+	def server_timing(self) -> str:
+		"""
+		returns the Server-Timing header of the stages so far, in ms
+		"""
+		with self.lock:
+			stages = list(self.stages.items())
+		stages.append(('total', self.elapsed()))
+		return ', '.join(f'{i};dur={j * 1000:.1f}' for i, j in stages)
+
+	def defer(self) -> None:
+		"""
+		delays the stage histograms until finish is called, for the bodies
+		that are produced while they are sent
+		"""
+		with self.lock:
+			self.pending += 1
+
+	def finish(self) -> None:
+		with self.lock:
+			self.pending -= 1
+			done = self.pending == 0 and self.endpoint is not None
+		if done:
+			self.observe_stages()
+
+	def observe(self, endpoint: str, method: str, status: int) -> None:
+		requests_total.inc(endpoint=endpoint, method=method, status=status)
+		request_duration.observe(self.elapsed(), endpoint=endpoint, method=method)
+		with self.lock:
+			self.endpoint = endpoint
+			done = self.pending == 0
+		if done:
+			self.observe_stages()
+
+	def observe_stages(self) -> None:
+		version, modality, language = self.model
+		with self.lock:
+			stages = list(self.stages.items())
+		for name, seconds in stages:
+			stage_duration.observe(
+				seconds,
+				endpoint=self.endpoint,
+				stage=name,
+				version=version,
+				modality=modality,
+				language=language,
+			)
+
+
+current_timer: 'ContextVar[Optional[RequestTimer]]' = ContextVar('current_timer', default=None)
+
+
+@contextmanager
+def stage(name: str) -> Iterator[None]:
+	"""
+	adds the time spent in the block to the stage of the current request
+	"""
+	timer = current_timer.get()
+	if timer is None:
+		yield
+		return
+	start = time.perf_counter()
+	try:
+		yield
+	finally:
+		timer.add(name, time.perf_counter() - start)
+
+
+def route_path(request: Request) -> str:
+	"""
+	returns the path template of the route of the request (eg.
+	/ocr/jobs/{job_id}), the raw paths would make too many series
+	"""
+	route = request.scope.get('route')
+	return getattr(route, 'path', 'unmatched')
+
+
+def set_model(version: str, modality: str, language: str) -> None:
+	"""
+	labels the stages of the current request with its model
+	"""
+	timer = current_timer.get()
+	if timer is not None:
+		timer.model = (str(version), str(modality), str(language))
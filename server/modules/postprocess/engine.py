@@ -0,0 +1,94 @@
+"""
+In-process lexicon matching for the postprocess endpoints.
+
+The words of the vocabulary/lexicon are indexed with symmetric deletes:
+every word is stored under all the strings obtained by deleting up to
+max_distance characters from it (from its first prefix_length characters,
+which keeps the index small for large lexicons). A word is looked up by
+generating its own deletes, the entries sharing a delete are the only
+candidates and their real edit distance is computed to rank them.
+"""
+
+from typing import Dict, Iterable, List, Set, Tuple
+
+
+def edit_distance(a: str, b: str, max_distance: int) -> int:
+	"""
+	returns the optimal string alignment distance (levenshtein with
+	transpositions) of a and b, or max_distance + 1 if it is larger
+	"""
+	if abs(len(a) - len(b)) > max_distance:
+		return max_distance + 1
+	previous = None
+	current = list(range(len(b) + 1))
+	for i in range(1, len(a) + 1):
+		before, previous, current = previous, current, [i] + [0] * len(b)
+		for j in range(1, len(b) + 1):
+			cost = 0 if a[i - 1] == b[j - 1] else 1
+			current[j] = min(
+				previous[j] + 1,
+				current[j - 1] + 1,
+				previous[j - 1] + cost,
+			)
+			if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+				current[j] = min(current[j], before[j - 2] + 1)
+		if min(current) > max_distance:
+			return max_distance + 1
+	return current[-1]
+
+
+class LexiconIndex:
+
+	def __init__(
+		self,
+		words: Iterable[str] = (),
+		max_distance: int = 2,
+		prefix_length: int = 7,
+	):
+		"""
+		the rank of a word is its position in words, the earlier words are
+		preferred over the later ones at the same distance
+		"""
+		self.max_distance = max_distance
+		self.prefix_length = max(prefix_length, max_distance + 1)
+		self.words: Dict[str, int] = {}
+		self.deletes: Dict[str, List[str]] = {}
+		for word in words:
+			self.add(word)
+
+	def __len__(self) -> int:
+		return len(self.words)
+
+	def _deletes(self, word: str) -> Set[str]:
+		word = word[:self.prefix_length]
+		ret = {word}
+		edits = {word}
+		for _ in range(self.max_distance):
+			edits = {i[:j] + i[j + 1:] for i in edits for j in range(len(i))}
+			ret |= edits
+		return ret
+
+	def add(self, word: str) -> None:
+		word = word.strip()
+		if not word or word in self.words:
+			return
+		self.words[word] = len(self.words)
+		for delete in self._deletes(word):
+			self.deletes.setdefault(delete, []).append(word)
+
+	def lookup(self, word: str, limit: int = 10) -> List[Tuple[str, int]]:
+		"""
+		returns up to limit (word, distance) of the closest words, sorted by
+		the distance and then by the rank of the words
+		"""
+		word = word.strip()
+		candidates = set()
+		for delete in self._deletes(word):
+			candidates.update(self.deletes.get(delete, ()))
+		ret = []
+		for candidate in candidates:
+			distance = edit_distance(word, candidate, self.max_distance)
+			if distance <= self.max_distance:
+				ret.append((candidate, distance))
+		ret.sort(key=lambda x: (x[1], self.words[x[0]]))
+		return ret[:limit]
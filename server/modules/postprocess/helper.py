@@ -0,0 +1,110 @@
+from typing import List, Optional, Tuple
+
+import numpy as np
+from fastapi import HTTPException
+
+from server.config import POSTPROCESS_MAX_ALTERNATIVES, POSTPROCESS_MAX_DISTANCE
+from server.models import (OCRImageResponse, PostprocessImageResponse,
+                           PostprocessRequest)
+from server.modules.core.tensors import (PACKED, TensorFormatError,
+                                         decode_tensors)
+
+from .engine import LexiconIndex
+from .lexicons import lexicon_store
+
+
+def build_index(*word_lists: List[str]) -> LexiconIndex:
+	"""
+	indexes the words of all the lists, the words of the first lists are
+	ranked before the ones of the later lists
+	"""
+	index = LexiconIndex(max_distance=POSTPROCESS_MAX_DISTANCE)
+	for words in word_lists:
+		for word in words:
+			index.add(word)
+	return index
+
+
+def resolve_words(words: List[str], handle: Optional[str]) -> List[str]:
+	"""
+	returns the words of the registered handle if given, else the words
+	"""
+	if handle:
+		return lexicon_store.words(handle)
+	return words
+
+
+def request_index(lists: List[Tuple[List[str], Optional[str]]]) -> LexiconIndex:
+	"""
+	returns the index of the (words, handle) of a request in order of
+	preference. when all of them are handles the cached index is used.
+	"""
+	lists = [i for i in lists if i[0] or i[1]]
+	if lists and all(handle for _, handle in lists):
+		return lexicon_store.index(*[handle for _, handle in lists])
+	return build_index(*[resolve_words(*i) for i in lists])
+
+
+def word_probabilities(request: PostprocessRequest) -> Optional[List[Tuple[np.ndarray, np.ndarray]]]:
+	"""
+	returns the (data_prob, max_prob) of every word when they are sent in
+	the packed format, either as one blob for all the words or in the meta
+	of each word. returns None for the legacy pts probabilities.
+	"""
+	try:
+		if request.probabilities:
+			tensors = decode_tensors(request.probabilities)
+		elif request.words and all((i.meta or {}).get('prob_format') == PACKED for i in request.words):
+			tensors = []
+			for word in request.words:
+				tensors.extend(decode_tensors(word.meta['data_prob']))
+				tensors.extend(decode_tensors(word.meta['max_prob']))
+		else:
+			return None
+	except (TensorFormatError, KeyError) as e:
+		raise HTTPException(
+			status_code=400,
+			detail=f'Unable to decode the probabilities: {e}'
+		)
+	if len(tensors) != 2 * len(request.words):
+		raise HTTPException(
+			status_code=400,
+			detail=f'Expected {2 * len(request.words)} probability tensors, got {len(tensors)}'
+		)
+	return list(zip(tensors[::2], tensors[1::2]))
+
+
+def reject_packed_probabilities(request: PostprocessRequest) -> None:
+	"""
+	the postprocess containers only read the pts probabilities of each word,
+	the packed ones are only supported by the native engine
+	"""
+	if request.probabilities or any((i.meta or {}).get('prob_format') == PACKED for i in request.words):
+		raise HTTPException(
+			status_code=400,
+			detail='The packed probabilities are only supported by the native postprocess engine'
+		)
+
+
+def postprocess_words(
+	words: List[OCRImageResponse],
+	index: LexiconIndex,
+	probs: Optional[List[Tuple[np.ndarray, np.ndarray]]] = None,
+	limit: int = POSTPROCESS_MAX_ALTERNATIVES,
+) -> List[PostprocessImageResponse]:
+	"""
+	returns the closest words of the index for each ocr word, sorted by
+	their edit distance which is returned in the meta. the confidence of
+	the ocr word (mean of max_prob) is added when the probabilities are sent.
+	"""
+	ret = []
+	for idx, word in enumerate(words):
+		matches = index.lookup(word.text, limit)
+		meta = {'distances': [i[1] for i in matches]}
+		if probs is not None and probs[idx][1].size:
+			meta['confidence'] = float(probs[idx][1].astype(np.float32).mean())
+		ret.append(PostprocessImageResponse(
+			text=[i[0] for i in matches],
+			meta=meta,
+		))
+	return ret
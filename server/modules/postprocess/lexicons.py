@@ -0,0 +1,133 @@
+"""
+Vocabularies and lexicons registered once and referenced by their handle.
+
+The words are saved on disk under the sha256 of their content, so the
+handles survive restarts and are shared by all the api processes. The
+indices built from them are kept in a small in-memory lru, keyed by the
+handles they were built from.
+"""
+
+import hashlib
+import os
+import re
+import threading
+from collections import OrderedDict
+from os.path import join
+from typing import Dict, List, Optional, Tuple
+
+from fastapi import HTTPException
+
+from server.config import (LEXICON_CACHE_MAX_ITEMS, LEXICON_FOLDER,
+                           POSTPROCESS_MAX_DISTANCE)
+
+from .engine import LexiconIndex
+
+HANDLE = re.compile('[0-9a-f]{64}')
+
+
+def normalise_words(words: List[str]) -> List[str]:
+	return [i for i in (j.strip() for j in words) if i]
+
+
+def lexicon_handle(words: List[str]) -> str:
+	return hashlib.sha256('\n'.join(words).encode('utf-8')).hexdigest()
+
+
+class LexiconStore:
+
+	def __init__(self, folder: str, max_items: int = 8, max_distance: int = 2):
+		self.folder = folder
+		self.max_items = max_items
+		self.max_distance = max_distance
+		self.indices: 'OrderedDict[Tuple[str, ...], LexiconIndex]' = OrderedDict()
+		self.build_locks: Dict[Tuple[str, ...], threading.Lock] = {}
+		self.lock = threading.Lock()
+		self.hits = 0
+		self.misses = 0
+		self.evictions = 0
+
+	def _path(self, handle: str) -> str:
+		return join(self.folder, handle[:2], f'{handle}.txt')
+
+	def exists(self, handle: str) -> bool:
+		return os.path.exists(self._path(handle))
+
+	def register(self, words: List[str]) -> Tuple[str, int]:
+		"""
+		saves the words, builds their index and returns the (handle, size)
+		"""
+		words = normalise_words(words)
+		handle = lexicon_handle(words)
+		path = self._path(handle)
+		if not os.path.exists(path):
+			os.makedirs(os.path.dirname(path), exist_ok=True)
+			tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+			with open(tmp_path, 'w', encoding='utf-8') as f:
+				f.write('\n'.join(words))
+			os.replace(tmp_path, path)
+		self.index(handle)
+		return handle, len(words)
+
+	def words(self, handle: str) -> List[str]:
+		"""
+		returns the registered words, raises a 404 for an unknown handle
+		"""
+		try:
+			if not HANDLE.fullmatch(handle):
+				raise ValueError(handle)
+			with open(self._path(handle), 'r', encoding='utf-8') as f:
+				return normalise_words(f.read().split('\n'))
+		except (OSError, ValueError):
+			raise HTTPException(
+				status_code=404,
+				detail=f'Unknown vocabulary/lexicon {handle}'
+			)
+
+	def _get(self, key: Tuple[str, ...]) -> Optional[LexiconIndex]:
+		with self.lock:
+			index = self.indices.get(key)
+			if index is not None:
+				self.indices.move_to_end(key)
+			return index
+
+	def index(self, *handles: str) -> LexiconIndex:
+		"""
+		returns the index of the words of all the handles, the words of the
+		first handles are ranked before the later ones
+		"""
+		key = tuple(handles)
+		index = self._get(key)
+		if index is not None:
+			with self.lock:
+				self.hits += 1
+			return index
+		with self.lock:
+			self.misses += 1
+			build_lock = self.build_locks.setdefault(key, threading.Lock())
+		# the same index is only built once when it is requested concurrently
+		with build_lock:
+			index = self._get(key)
+			if index is not None:
+				return index
+			index = LexiconIndex(max_distance=self.max_distance)
+			for handle in handles:
+				for word in self.words(handle):
+					index.add(word)
+			with self.lock:
+				self.indices[key] = index
+				while len(self.indices) > self.max_items:
+					self.indices.popitem(last=False)
+					self.evictions += 1
+				self.build_locks.pop(key, None)
+		return index
+
+	def loaded(self, handle: str) -> bool:
+		with self.lock:
+			return any(handle in i for i in self.indices)
+
+
+lexicon_store = LexiconStore(
+	LEXICON_FOLDER,
+	max_items=LEXICON_CACHE_MAX_ITEMS,
+	max_distance=POSTPROCESS_MAX_DISTANCE,
+)
@@ -0,0 +1,13 @@
+from typing import List
+
+from pydantic import BaseModel, Field
+
+
+class LexiconRequest(BaseModel):
+	words: List[str]
+
+
+class Lexicon(BaseModel):
+	id: str = Field(description='Content hash of the words, used as vocabulary_id/lexicon_id')
+	size: int = Field(description='Number of words')
+	loaded: bool = Field(description='Whether an index of the words is loaded in memory')
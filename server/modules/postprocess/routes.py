@@ -0,0 +1,57 @@
+import json
+
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.concurrency import run_in_threadpool
+
+from server.modules.ingest.stream import parse_streamed, request_body
+
+from .lexicons import lexicon_store
+from .models import Lexicon, LexiconRequest
+
+router = APIRouter(
+	prefix='/ocr/lexicons',
+	tags=['Postprocess'],
+)
+
+
+@router.post(
+	'',
+	response_model=Lexicon,
+	openapi_extra=request_body(LexiconRequest, {
+		'text/plain': {'schema': {
+			'type': 'string',
+			'description': 'one word per line',
+		}},
+	}),
+)
+async def register_lexicon(request: Request) -> Lexicon:
+	"""
+	Registers a vocabulary or a lexicon and returns its handle, which can
+	be sent as vocabulary_id/lexicon_id to the postprocess endpoints
+	instead of the words. The large lists are faster to send as text/plain
+	with one word per line.
+	"""
+	body = await request.body()
+	plain = request.headers.get('content-type', '').startswith('text/plain')
+	try:
+		body = body.decode('utf-8') if plain else json.loads(body)
+	except ValueError:
+		raise HTTPException(
+			status_code=400,
+			detail='Unable to parse the words'
+		)
+	words = body.split('\n') if plain else parse_streamed(LexiconRequest, body).words
+	handle, size = await run_in_threadpool(lexicon_store.register, words)
+	return Lexicon(id=handle, size=size, loaded=True)
+
+
+@router.get(
+	'/{handle}',
+	response_model=Lexicon,
+)
+def get_lexicon(handle: str) -> Lexicon:
+	return Lexicon(
+		id=handle,
+		size=len(lexicon_store.words(handle)),
+		loaded=lexicon_store.loaded(handle),
+	)
@@ -0,0 +1,173 @@
+"""
+Declarative registry of the models that can be served.
+
+The models are described in capabilities.json, one entry per version with
+the backend that runs it and the (modality, language) pairs it supports.
+The file is expanded once into a dict keyed by (version, modality, language)
+so validating a request is a single lookup.
+
+	{
+		"backend": "worker",      # worker, script, v0, tesseract, page_pu, page_tesseract_bi
+		"command": "./x.sh ...",  # script backend, formatted with the model and the folder
+		"model_dir": "...",       # formatted with the version, modality and language
+		"bilingual": false,       # the model expects english_<language>
+		"preload": false,         # started when the api starts
+		"prob_format": "pts",     # pts (prob.json) or packed (prob.bin), see PROB_FORMAT
+		"batch": {"max_batch_size": 64, "max_wait": 0.05},
+		"models": [{"modalities": [...], "languages": [...], "exclude": [...]}]
+	}
+
+the models can also be the name of a shared rule, languages can refer to a
+language group with @<group> and anything left out is taken from defaults.
+"""
+
+import json
+from dataclasses import dataclass, field
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from fastapi import HTTPException
+
+from server.config import MODEL_REGISTRY_FILE, PROB_FORMAT
+
+PAGE_LEVEL_BACKENDS = ['page_pu', 'page_tesseract_bi']
+
+
+@dataclass
+class Capability:
+	version: str
+	modality: str
+	language: str
+	backend: str
+	command: Optional[str] = None
+	model_dir: Optional[str] = None
+	bilingual: bool = False
+	preload: bool = False
+	prob_format: str = PROB_FORMAT
+	batch: Dict = field(default_factory=dict)
+
+	@property
+	def model_language(self) -> str:
+		"""
+		language passed to the model, the bilingual models expect english_<language>
+		"""
+		if self.bilingual:
+			return f'english_{self.language}'
+		return self.language
+
+	@property
+	def page_level(self) -> bool:
+		"""
+		whether the model returns the words of a page instead of one result per image
+		"""
+		return self.backend in PAGE_LEVEL_BACKENDS
+
+	@property
+	def key(self) -> Tuple[str, str, str]:
+		return (self.version, self.modality, self.model_language)
+
+
+class ModelRegistry:
+
+	def __init__(self, data: Dict):
+		self.versions: List[str] = list(data['versions'])
+		self.capabilities: Dict[Tuple[str, str, str], Capability] = {}
+		# keyed by the language passed to the model, see Capability.key
+		self.models: Dict[Tuple[str, str, str], Capability] = {}
+		groups = data.get('language_groups', {})
+		defaults = data.get('defaults', {})
+		rules = data.get('rules', {})
+		for version, entry in data['versions'].items():
+			entry = {**defaults, **entry}
+			models = entry.get('models', [{}])
+			if isinstance(models, str):
+				models = rules[models]
+			for model in models:
+				languages = self._languages(model.get('languages', entry['languages']), groups)
+				exclude = set(model.get('exclude', []))
+				for modality in model.get('modalities', entry['modalities']):
+					for language in languages:
+						if language in exclude:
+							continue
+						capability = Capability(
+							version=version,
+							modality=modality,
+							language=language,
+							backend=entry['backend'],
+							command=entry.get('command'),
+							model_dir=self._model_dir(entry.get('model_dir'), version, modality, language),
+							bilingual=entry.get('bilingual', False),
+							preload=entry.get('preload', False),
+							prob_format=entry.get('prob_format', PROB_FORMAT),
+							batch=entry.get('batch', {}),
+						)
+						self.capabilities[(version, modality, language)] = capability
+						self.models[capability.key] = capability
+
+	@staticmethod
+	def _languages(languages: List[str], groups: Dict[str, List[str]]) -> List[str]:
+		ret = []
+		for language in languages:
+			if language.startswith('@'):
+				ret.extend(groups[language[1:]])
+			else:
+				ret.append(language)
+		return ret
+
+	@staticmethod
+	def _model_dir(model_dir: Optional[str], version: str, modality: str, language: str) -> Optional[str]:
+		if model_dir is None:
+			return None
+		return model_dir.format(version=version, modality=modality, language=language)
+
+	@classmethod
+	def load(cls, path: str) -> 'ModelRegistry':
+		with open(path, 'r', encoding='utf-8') as f:
+			return cls(json.load(f))
+
+	def get(self, version: str, modality: str, language: str) -> Optional[Capability]:
+		return self.capabilities.get((version, modality, language))
+
+	def model(self, version: str, modality: str, model_language: str) -> Optional[Capability]:
+		"""
+		returns the capability from the key the backends are called with
+		"""
+		return self.models.get((version, modality, model_language))
+
+	def verify(self, version: str, modality: str, language: str) -> Capability:
+		"""
+		returns the capability of the model or raises a 400 if it is not available
+		"""
+		capability = self.get(version, modality, language)
+		if capability is None:
+			raise HTTPException(
+				status_code=400,
+				detail=f'No model available for {language} {version} {modality}'
+			)
+		return capability
+
+	def filter(
+		self,
+		version: Optional[str] = None,
+		modality: Optional[str] = None,
+		language: Optional[str] = None,
+	) -> Iterator[Capability]:
+		for capability in self.capabilities.values():
+			if version is not None and capability.version != version:
+				continue
+			if modality is not None and capability.modality != modality:
+				continue
+			if language is not None and capability.language != language:
+				continue
+			yield capability
+
+	def batch_overrides(self) -> Dict[Tuple[str, str, str], Dict]:
+		"""
+		returns the batch limits of the models in the format of BATCH_OVERRIDES
+		"""
+		return {i.key: i.batch for i in self.capabilities.values() if i.batch}
+
+	def preloaded(self) -> List[Capability]:
+		return [i for i in self.capabilities.values() if i.preload]
+
+
+model_registry = ModelRegistry.load(MODEL_REGISTRY_FILE)
@@ -0,0 +1,17 @@
+from typing import Optional
+
+from pydantic import BaseModel, Field
+
+
+class ModelCapability(BaseModel):
+	version: str
+	modality: str
+	language: str
+	backend: str = Field(description='Backend that runs the model')
+	model_dir: Optional[str] = None
+	bilingual: bool
+	page_level: bool = Field(description='Whether one result is returned per page instead of per image')
+	preload: bool
+	prob_format: str = Field(description='Format the probabilities are written in, pts or packed')
+	max_batch_size: Optional[int] = None
+	max_wait: Optional[float] = None
@@ -0,0 +1,39 @@
+from typing import List, Optional
+
+from fastapi import APIRouter
+
+from .capabilities import model_registry
+from .models import ModelCapability
+
+router = APIRouter(
+	prefix='/ocr/models',
+	tags=['Models'],
+)
+
+
+@router.get(
+	'',
+	response_model=List[ModelCapability],
+	response_model_exclude_none=True,
+)
+def list_models(
+	version: Optional[str] = None,
+	modality: Optional[str] = None,
+	language: Optional[str] = None,
+) -> List[ModelCapability]:
+	"""
+	Returns the models that can be served, optionally filtered by the
+	version, modality and language.
+	"""
+	return [ModelCapability(
+		version=i.version,
+		modality=i.modality,
+		language=i.language,
+		backend=i.backend,
+		model_dir=i.model_dir,
+		bilingual=i.bilingual,
+		page_level=i.page_level,
+		preload=i.preload,
+		prob_format=i.prob_format,
+		**i.batch,
+	) for i in model_registry.filter(version, modality, language)]
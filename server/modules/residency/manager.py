@@ -0,0 +1,174 @@
+"""
+In-process registry of the models that are currently loaded on the machine.
+
+The manager only keeps the bookkeeping, loading and unloading the models is
+left to the caller:
+
+	if not manager.hit(key):
+		for victim in manager.evict_for(key):
+			unload(victim)
+		load(key)
+		manager.loaded(key, load_cost)
+"""
+
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Dict, Hashable, Iterable, List
+
+
+@dataclass
+class ModelStats:
+	key: Hashable
+	load_cost: float = 0
+	hits: int = 0
+	loaded_at: float = field(default_factory=time.time)
+	last_used: float = field(default_factory=time.time)
+
+
+class LRUPolicy:
+	"""
+	evicts the model that was used least recently
+	"""
+	name = 'lru'
+
+	def victim(self, models: List[ModelStats]) -> ModelStats:
+		return min(models, key=lambda x: x.last_used)
+
+
+class LFUPolicy:
+	"""
+	evicts the model with the least hits since it was loaded
+	"""
+	name = 'lfu'
+
+	def victim(self, models: List[ModelStats]) -> ModelStats:
+		return min(models, key=lambda x: (x.hits, x.last_used))
+
+
+class CostAwarePolicy:
+	"""
+	evicts the model that saves the least loading time per second,
+	ie. hit rate since loading multiplied by the time it takes to load it.
+	"""
+	name = 'cost'
+
+	def victim(self, models: List[ModelStats]) -> ModelStats:
+		now = time.time()
+		return min(models, key=lambda x: (
+			(x.hits + 1) * x.load_cost / max(now - x.loaded_at, 1),
+			x.last_used,
+		))
+
+
+POLICIES = {
+	'lru': LRUPolicy,
+	'lfu': LFUPolicy,
+	'cost': CostAwarePolicy,
+}
+
+# every manager registers itself here, it is exposed by /ocr/residency
+residency_managers: Dict[str, 'ResidencyManager'] = {}
+
+
+class ResidencyManager:
+	"""
+	tracks the loaded models keyed by (version, modality, language) and
+	picks the ones to evict with the configured policy.
+	"""
+
+	def __init__(self, name: str, capacity: int, policy: str = 'lru'):
+		if policy not in POLICIES:
+			raise ValueError(f'unknown eviction policy: {policy}')
+		self.name = name
+		self.capacity = capacity
+		self.policy = POLICIES[policy]()
+		self.models: Dict[Hashable, ModelStats] = {}
+		# load cost of the models seen before, reused when they are reloaded
+		self.load_costs: Dict[Hashable, float] = {}
+		self.hits = 0
+		self.misses = 0
+		self.loads = 0
+		self.evictions = 0
+		self.lock = threading.Lock()
+		residency_managers[name] = self
+
+	def hit(self, key: Hashable) -> bool:
+		"""
+		records a request for the model and returns whether it is loaded
+		"""
+		with self.lock:
+			stats = self.models.get(key)
+			if stats is None:
+				self.misses += 1
+				return False
+			self.hits += 1
+			stats.hits += 1
+			stats.last_used = time.time()
+			return True
+
+	def evict_for(self, key: Hashable) -> List[Hashable]:
+		"""
+		removes the models chosen by the policy until there is space for
+		the given model and returns their keys so that they can be unloaded
+		"""
+		victims = []
+		with self.lock:
+			while self.models and len(self.models) >= self.capacity and key not in self.models:
+				victim = self.policy.victim(list(self.models.values()))
+				del self.models[victim.key]
+				self.evictions += 1
+				victims.append(victim.key)
+		for victim in victims:
+			print(f'[{self.name}] evicting {victim} ({self.policy.name})')
+		return victims
+
+	def loaded(self, key: Hashable, load_cost: float = None) -> None:
+		"""
+		registers a model that was just loaded along with the load time
+		"""
+		with self.lock:
+			if load_cost is None:
+				load_cost = self.load_costs.get(key, 0)
+			else:
+				self.loads += 1
+				self.load_costs[key] = load_cost
+			self.models[key] = ModelStats(key=key, load_cost=load_cost)
+
+	def remove(self, key: Hashable) -> None:
+		"""
+		forgets a model that was unloaded outside the manager (eg. it crashed)
+		"""
+		with self.lock:
+			self.models.pop(key, None)
+
+	def sync(self, keys: Iterable[Hashable]) -> None:
+		"""
+		registers the models which are already loaded, used on startup
+		"""
+		for key in keys:
+			if key not in self.models:
+				self.loaded(key)
+
+	def state(self) -> Dict:
+		with self.lock:
+			total = self.hits + self.misses
+			return {
+				'name': self.name,
+				'policy': self.policy.name,
+				'capacity': self.capacity,
+				'hits': self.hits,
+				'misses': self.misses,
+				'hit_rate': self.hits / total if total else 0,
+				'loads': self.loads,
+				'evictions': self.evictions,
+				'models': [{
+					'version': i.key[0],
+					'modality': i.key[1],
+					'language': i.key[2],
+					'load_cost': i.load_cost,
+					'hits': i.hits,
+					'loaded_at': i.loaded_at,
+					'last_used': i.last_used,
+				} for i in self.models.values()],
+			}
@@ -0,0 +1,25 @@
+from typing import List
+
+from pydantic import BaseModel, Field
+
+
+class ResidentModel(BaseModel):
+	version: str
+	modality: str
+	language: str
+	load_cost: float = Field(description='Seconds taken to load the model')
+	hits: int = Field(description='Number of requests served since it was loaded')
+	loaded_at: float
+	last_used: float
+
+
+class ResidencyState(BaseModel):
+	name: str
+	policy: str
+	capacity: int
+	hits: int
+	misses: int
+	hit_rate: float
+	loads: int
+	evictions: int
+	models: List[ResidentModel]
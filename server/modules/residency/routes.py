@@ -0,0 +1,23 @@
+from typing import List
+
+from fastapi import APIRouter
+
+from .manager import residency_managers
+from .models import ResidencyState
+
+router = APIRouter(
+	prefix='/ocr/residency',
+	tags=['Model Residency'],
+)
+
+
+@router.get(
+	'/',
+	response_model=List[ResidencyState],
+)
+def get_residency() -> List[ResidencyState]:
+	"""
+	Returns the models loaded by each residency manager along with the
+	hit/miss and load/evict counters.
+	"""
+	return [i.state() for i in residency_managers.values()]
@@ -0,0 +1,261 @@
+"""
+Pool of initialised Tesseract engines.
+
+pytesseract forks a tesseract process per image which loads the traineddata
+every time. When tesserocr is installed the engines are kept initialised in
+the process instead, one pool per language combination (eg. 'hin' or
+'eng+hin') with at most one engine per core. tesserocr releases the GIL
+while recognising, so a batch of images is recognised in parallel with
+threads. Without tesserocr the pool falls back to pytesseract and only
+bounds the number of tesseract processes.
+"""
+
+import io
+import os
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Tuple, Union
+
+from PIL import Image
+
+from server.config import TESS_LANG, TESSERACT_DATA_PATH, TESSERACT_POOL_SIZE
+
+try:
+	import tesserocr
+except ImportError:
+	tesserocr = None
+import pytesseract
+
+# the text of a word and its [left, top, width, height]
+Word = Tuple[str, List[int]]
+
+
+def tesseract_language(language: str, bilingual: bool = False) -> str:
+	"""
+	returns the tesseract language of the language name, eg. eng+hin
+	"""
+	if bilingual:
+		return f'eng+{TESS_LANG[language]}'
+	return TESS_LANG[language]
+
+
+def open_image(image: Union[str, bytes, Image.Image]) -> Image.Image:
+	"""
+	returns the decoded image of a path, the encoded bytes or an image
+	"""
+	if isinstance(image, Image.Image):
+		return image
+	if isinstance(image, bytes):
+		image = io.BytesIO(image)
+	img = Image.open(image)
+	img.load()
+	return img
+
+
+def pad_image(image: Image.Image, size: int) -> Image.Image:
+	"""
+	returns the image with a white border of size pixels
+	"""
+	w, h = image.size
+	out = Image.new(image.mode, (w + size * 2, h + size * 2), 'white')
+	out.paste(image, (size, size))
+	return out
+
+
+class TesseractEngine:
+	"""
+	one initialised engine for a language combination, not thread safe
+	"""
+
+	def __init__(self, lang: str, path: Optional[str] = None):
+		self.lang = lang
+		self.api = None
+		if tesserocr is not None:
+			if path is None:
+				self.api = tesserocr.PyTessBaseAPI(lang=lang)
+			else:
+				self.api = tesserocr.PyTessBaseAPI(path=path, lang=lang)
+
+	def text(self, image: Union[str, Image.Image]) -> str:
+		image = open_image(image)
+		if self.api is None:
+			return pytesseract.image_to_string(image, lang=self.lang).strip()
+		self.api.SetImage(image)
+		return self.api.GetUTF8Text().strip()
+
+	def words(self, image: Union[str, Image.Image]) -> List[Word]:
+		"""
+		returns the recognised words along with their bounding box
+		"""
+		image = open_image(image)
+		if self.api is None:
+			data = pytesseract.image_to_data(
+				image,
+				lang=self.lang,
+				output_type=pytesseract.Output.DICT,
+			)
+			return [
+				(data['text'][i].strip(), [
+					int(data['left'][i]),
+					int(data['top'][i]),
+					int(data['width'][i]),
+					int(data['height'][i]),
+				])
+				for i in range(len(data['text']))
+				if float(data['conf'][i]) != -1
+			]
+		self.api.SetImage(image)
+		self.api.Recognize()
+		ret = []
+		level = tesserocr.RIL.WORD
+		for word in tesserocr.iterate_level(self.api.GetIterator(), level):
+			text = word.GetUTF8Text(level)
+			box = word.BoundingBox(level)
+			if text is None or box is None:
+				continue
+			x1, y1, x2, y2 = box
+			ret.append((text.strip(), [x1, y1, x2 - x1, y2 - y1]))
+		return ret
+
+	def close(self) -> None:
+		if self.api is not None:
+			self.api.End()
+			self.api = None
+
+
+class EnginePool:
+	"""
+	engines of one language combination, created on demand up to size
+	"""
+
+	def __init__(self, lang: str, size: int, path: Optional[str] = None):
+		self.lang = lang
+		self.size = size
+		self.path = path
+		self.idle: 'queue.LifoQueue[TesseractEngine]' = queue.LifoQueue()
+		self.created = 0
+		self.lock = threading.Lock()
+
+	@contextmanager
+	def engine(self) -> Iterator[TesseractEngine]:
+		try:
+			engine = self.idle.get_nowait()
+		except queue.Empty:
+			with self.lock:
+				create = self.created < self.size
+				if create:
+					self.created += 1
+			if create:
+				try:
+					engine = TesseractEngine(self.lang, self.path)
+				except BaseException:
+					with self.lock:
+						self.created -= 1
+					raise
+			else:
+				engine = self.idle.get()
+		try:
+			yield engine
+		finally:
+			self.idle.put(engine)
+
+	def close(self) -> None:
+		while True:
+			try:
+				self.idle.get_nowait().close()
+			except queue.Empty:
+				break
+		with self.lock:
+			self.created = 0
+
+
+class TesseractPools:
+	"""
+	one engine pool per language combination sharing a thread pool of the
+	same size, so at most size images are recognised at a time
+	"""
+
+	def __init__(self, size: Optional[int] = None, path: Optional[str] = None):
+		self.size = size or os.cpu_count() or 1
+		self.path = path
+		self.pools: Dict[str, EnginePool] = {}
+		self.lock = threading.Lock()
+		self.executor = ThreadPoolExecutor(self.size, thread_name_prefix='tesseract')
+
+	def get(self, lang: str) -> EnginePool:
+		with self.lock:
+			pool = self.pools.get(lang)
+			if pool is None:
+				pool = self.pools[lang] = EnginePool(lang, self.size, self.path)
+			return pool
+
+	def _run(self, lang: str, method: str, image, padding: int):
+		# the images are decoded and padded in the threads as well
+		image = open_image(image)
+		if padding:
+			image = pad_image(image, padding)
+		with self.get(lang).engine() as engine:
+			return getattr(engine, method)(image)
+
+	def _map(self, func, images: List, max_parallel: Optional[int] = None) -> List:
+		"""
+		runs func on the images in the thread pool, at most max_parallel
+		images of the call are recognised at a time
+		"""
+		if not max_parallel or max_parallel >= len(images):
+			return list(self.executor.map(func, images))
+		slots = threading.Semaphore(max_parallel)
+		futures = []
+		for image in images:
+			slots.acquire()
+			future = self.executor.submit(func, image)
+			future.add_done_callback(lambda _: slots.release())
+			futures.append(future)
+		return [i.result() for i in futures]
+
+	def text(
+		self,
+		lang: str,
+		images: List,
+		padding: int = 0,
+		max_parallel: Optional[int] = None,
+	) -> List[str]:
+		"""
+		recognises the images (paths, encoded bytes or images) in parallel,
+		returns their text in order
+		"""
+		return self._map(
+			lambda x: self._run(lang, 'text', x, padding),
+			images,
+			max_parallel,
+		)
+
+	def words(
+		self,
+		lang: str,
+		images: List,
+		padding: int = 0,
+		max_parallel: Optional[int] = None,
+	) -> List[List[Word]]:
+		"""
+		recognises the images in parallel, returns their words in order
+		"""
+		return self._map(
+			lambda x: self._run(lang, 'words', x, padding),
+			images,
+			max_parallel,
+		)
+
+	def shutdown(self) -> None:
+		"""
+		releases the engines, they are initialised again when needed
+		"""
+		with self.lock:
+			for pool in self.pools.values():
+				pool.close()
+			self.pools.clear()
+
+
+tesseract_pools = TesseractPools(TESSERACT_POOL_SIZE, TESSERACT_DATA_PATH)
@@ -1,18 +1,25 @@
-import base64
-import imghdr
 import json
 import os
-import shutil
 from datetime import datetime
 from os.path import join
-from tempfile import TemporaryDirectory
-from typing import List
-from uuid import uuid4
+from typing import AsyncIterator, Dict, List, Tuple
 
 import pytz
-import requests
-from fastapi import HTTPException
-from PIL import Image
+from fastapi import HTTPException, Request
+from fastapi.concurrency import run_in_threadpool
+
+from server.config import STREAM_CHUNK_SIZE, ULCA_LOGS_FOLDER
+from server.helper import link_images
+from server.modules.archive.images import image_archive
+from server.modules.cache.results import ainfer_with_cache, astream_with_cache
+from server.modules.core.aio import backend_limit, run_script
+from server.modules.core.tracing import current_request_id
+from server.modules.ingest.download import download_images
+from server.modules.ingest.stream import (StreamedImage, ingest_json,
+                                          parse_streamed)
+from server.modules.logs.writer import LogWriter
+from server.modules.metrics.timing import stage
+from server.modules.workspaces.manager import Workspace
 
 from .models import *
 
@@ -33,82 +40,50 @@ LANGUAGES = {
 	'ur': 'urdu',
 }
 
-async def save_logs(request, response):
-	dt = datetime.now(pytz.timezone('Asia/Kolkata')).isoformat()
-	ret = {
-		'ip_addr': str(request.client.host),
-		'timestamp': dt,
-		'request': await request.json(),
-		'response': response.dict(),
-	}
-	dt = dt.strip().split('+')[0]
-	with open('/home/ocr/ulca_logs/{}.json'.format(dt), 'w', encoding='utf-8') as f:
-		json.dump(ret, f, indent=4)
+request_logs = LogWriter(ULCA_LOGS_FOLDER, 'ulca')
 
-def process_image_content(image_content: str, savename: str) -> None:
+
+async def save_logs(request, ocr_request, response):
 	"""
-	input the base64 encoded image and saves the image inside the folder.
-	savename is the name of the image to be saved as
+	queues the log of the request, it is written in the background
 	"""
-	print('received image as base64')
-	savefolder = '/home/ocr/website/images'
-	assert isinstance(image_content, str)
-	with open(join(savefolder, savename), 'wb') as f:
-		f.write(base64.b64decode(image_content))
-	os.system('cp {} /home/ocr/ulca_images/{}.jpg'.format(
-		join(savefolder, savename),
-		str(uuid4())
-	))
-
-
-def process_image_url(image_url: str, savename: str) -> None:
+	request_logs.log({
+		'request_id': current_request_id.get(),
+		'ip_addr': str(request.client.host),
+		'timestamp': datetime.now(pytz.timezone('Asia/Kolkata')).isoformat(),
+		# the imageContent of the streamed images is their sha256
+		'request': ocr_request.dict(),
+		'response': response.dict(),
+	})
+
+
+async def read_request(request: Request, workspace: Workspace) -> Tuple[OCRRequest, Dict[int, StreamedImage]]:
 	"""
-	input the url of the image and download and saves the image inside the folder.
-	savename is the name of the image to be saved as
+	reads the request body, the base64 encoded images are decoded straight
+	into the workspace while the body is received
 	"""
-	print('received image as URL')
-	tmp = TemporaryDirectory(prefix='save_image')
-	savefolder = '/home/ocr/website/images'
-	r = requests.get(image_url, stream=True)
-	print(r.status_code)
-	if r.status_code == 200:
-		r.raw.decode_content = True
-		img_path = join(tmp.name, 'image')
-		with open(img_path, 'wb') as f:
-			shutil.copyfileobj(r.raw, f)
-		img = Image.open(img_path)
-		if imghdr.what(img_path) == 'png':
-			img = img.convert('RGB')
-		img.save(join(savefolder, savename))
-		print('downloaded the image:', image_url)
-	else:
-		raise Exception('status_code is not 200 while downloading the image from url')
-
-def process_images(images: List[ImageFile]):
+	with stage('decode'):
+		body, images = await ingest_json(request, workspace, ('image', '*', 'imageContent'))
+	return parse_streamed(OCRRequest, body), images
+
+
+async def process_images(
+	images: List[ImageFile],
+	streamed: Dict[int, StreamedImage],
+	workspace: Workspace,
+) -> List[str]:
 	"""
 	processes all the images in the given list.
-	it saves all the images in the /home/ocr/website/images folder and
-	returns this absolute path.
+	the base64 encoded images are already saved in the workspace by
+	read_request, the urls are downloaded there concurrently.
+	returns the sha256 of every image.
 	"""
-	print('deleting all the previous data from the images folder')
-	os.system('rm -rf /home/ocr/website/images/*')
+	urls = {}
 	for idx, image in enumerate(images):
-		if image.imageContent is not None:
-			try:
-				process_image_content(image.imageContent, '{}.jpg'.format(idx))
-			except:
-				raise HTTPException(
-					status_code=400,
-					detail='Error while decodeing and saving the image #{}'.format(idx)
-				)
+		if idx in streamed:
+			pass
 		elif image.imageUri is not None:
-			try:
-				process_image_url(image.imageUri, '{}.jpg'.format(idx))
-			except:
-				raise HTTPException(
-					status_code=400,
-					detail='Error while downloading and saving the image #{}'.format(idx)
-				)
+			urls[idx] = image.imageUri
 		else:
 			raise HTTPException(
 				status_code=400,
@@ -116,6 +91,13 @@ def process_images(images: List[ImageFile]):
 					idx
 				)
 			)
+	# the uploaded images are archived in the background
+	await run_in_threadpool(
+		image_archive.archive_files,
+		[(i.path, i.digest) for i in streamed.values()],
+	)
+	streamed = {**streamed, **await download_images(urls, workspace)}
+	return [streamed[idx].digest for idx in range(len(images))]
 
 def process_config(config: OCRConfig):
 	global LANGUAGES
@@ -134,18 +116,19 @@ def process_config(config: OCRConfig):
 		)
 	return (language_code, language, modality, dlevel)
 
-def process_ocr_output(language_code: str, modality: str, dlevel: str) -> OCRResponse:
+def process_ocr_output(language_code: str, modality: str, dlevel: str, folder: str) -> OCRResponse:
 	"""
-	process the ./images/out.json file and returns the ocr response.
+	process the out.json file of the folder and returns the ocr response.
 	"""
 	try:
-		a = open('/home/ocr/website/images/out.json', 'r').read().strip()
-		a = json.loads(a)
-		a = [(i, a[i]) for i in a]
-		print(a)
-		if len(a)>1:
-			a = sorted(a, key=lambda x:int(x[0].split('.')[0]))
-		a = [Sentence(source=i[1]) for i in a]
+		with stage('parse'):
+			a = open(join(folder, 'out.json'), 'r').read().strip()
+			a = json.loads(a)
+			a = [(i, a[i]) for i in a]
+			print(a)
+			if len(a)>1:
+				a = sorted(a, key=lambda x:int(x[0].split('.')[0]))
+			a = [Sentence(source=i[1]) for i in a]
 	except Exception as e:
 		print(e)
 		raise HTTPException(
@@ -160,3 +143,96 @@ def process_ocr_output(language_code: str, modality: str, dlevel: str) -> OCRRes
 		),
 		output=a.copy(),
 	)
+
+
+async def infer_ulca(
+	script: str,
+	version: str,
+	workspace: Workspace,
+	digests: List[str],
+	language_code: str,
+	language: str,
+	modality: str,
+	dlevel: str,
+) -> OCRResponse:
+	"""
+	runs the ulca model on the images of the workspace that are not
+	already present in the result cache.
+	"""
+	def remove_cached_images(missing: List[int]) -> None:
+		missing = set(missing)
+		for idx in range(len(digests)):
+			if idx not in missing:
+				os.remove(join(workspace.path, '{}.jpg'.format(idx)))
+
+	async def infer(missing: List[int]) -> List[dict]:
+		await run_in_threadpool(remove_cached_images, missing)
+		async with backend_limit('ulca'):
+			await run_script(f'./{script} {modality} {language} {workspace.path}')
+		ret = await run_in_threadpool(
+			process_ocr_output,
+			language_code,
+			modality,
+			dlevel,
+			workspace.path,
+		)
+		return [i.dict() for i in ret.output]
+
+	output = await ainfer_with_cache(
+		digests,
+		(version, modality, language),
+		infer,
+	)
+	return OCRResponse(
+		config=OCRConfig(
+			languages=[LanguagePair(
+				sourceLanguage=language_code,
+			)],
+		),
+		output=[Sentence(**i) for i in output],
+	)
+
+
+async def stream_ulca(
+	script: str,
+	version: str,
+	workspace: Workspace,
+	digests: List[str],
+	language_code: str,
+	language: str,
+	modality: str,
+	dlevel: str,
+	chunk_size: int = STREAM_CHUNK_SIZE,
+) -> AsyncIterator[Tuple[int, dict]]:
+	"""
+	streaming version of infer_ulca, yields the (index, sentence) of the
+	cached images first and then runs the model on the others chunk_size
+	images at a time, each chunk in its own folder of the workspace.
+	"""
+	async def infer(missing: List[int]) -> AsyncIterator[Tuple[List[int], List[dict]]]:
+		for start in range(0, len(missing), chunk_size):
+			indices = missing[start:start + chunk_size]
+			folder = join(workspace.path, f'chunk_{start}')
+			os.makedirs(folder)
+			await run_in_threadpool(
+				link_images,
+				[join(workspace.path, '{}.jpg'.format(idx)) for idx in indices],
+				folder,
+			)
+			async with backend_limit('ulca'):
+				await run_script(f'./{script} {modality} {language} {folder}')
+			ret = await run_in_threadpool(
+				process_ocr_output,
+				language_code,
+				modality,
+				dlevel,
+				folder,
+			)
+			yield indices, [i.dict() for i in ret.output]
+
+	async for idx, result in astream_with_cache(
+		digests,
+		(version, modality, language),
+		infer,
+	):
+		yield idx, result
@@ -1,10 +1,17 @@
-from subprocess import call
+from typing import AsyncIterator, Optional, Tuple
 
 from fastapi import APIRouter, Request
+from starlette.background import BackgroundTask
 
-from .helper import (process_config, process_images, process_ocr_output,
-                     save_logs)
-from .models import OCRRequest, OCRResponse
+from server.modules.core.streaming import (STREAM_RESPONSES, stream_results,
+                                           stream_type)
+from server.modules.ingest.stream import request_body
+from server.modules.metrics.timing import set_model
+from server.modules.workspaces.manager import workspace_manager
+
+from .helper import (infer_ulca, process_config, process_images, read_request,
+                     save_logs, stream_ulca)
+from .models import LanguagePair, OCRConfig, OCRRequest, OCRResponse, Sentence
 
 router = APIRouter(
 	prefix='/ocr/ulca',
@@ -12,77 +19,102 @@ router = APIRouter(
 )
 
 
+async def serve_ulca(
+	request: Request,
+	script: str,
+	version: str,
+	modality: Optional[str] = None,
+):
+	"""
+	runs the ulca model on the images of the request, modality overrides
+	the one of the request config. the results are streamed when the
+	client accepts it.
+	"""
+	with workspace_manager.create('ulca') as workspace:
+		ocr_request, images = await read_request(request, workspace)
+		lcode, language, config_modality, dlevel = process_config(ocr_request.config)
+		modality = modality or config_modality
+		if modality == 'scenetext' and language == 'malayalam':
+			# This is due to unavailability of the scenetext malayalam model
+			modality = 'printed'
+		set_model(version, modality, language)
+		digests = await process_images(ocr_request.image, images, workspace)
+		args = (script, version, workspace, digests, lcode, language, modality, dlevel)
+		media_type = stream_type(request)
+		if media_type is None:
+			ret = await infer_ulca(*args)
+			await save_logs(request, ocr_request, ret)
+			return ret
+		# the workspace is removed once all the results are streamed
+		workspace = workspace.handover()
+		args = (script, version, workspace, *args[3:])
+
+	async def results() -> AsyncIterator[Tuple[int, dict]]:
+		output = {}
+		async for idx, result in stream_ulca(*args):
+			output[idx] = result
+			yield idx, result
+		await save_logs(request, ocr_request, OCRResponse(
+			config=OCRConfig(languages=[LanguagePair(sourceLanguage=lcode)]),
+			output=[Sentence(**output[i]) for i in sorted(output)],
+		))
+
+	return stream_results(media_type, results(), BackgroundTask(workspace.cleanup))
+
+
 @router.post(
 	'/v2',
 	response_model=OCRResponse,
-	response_model_exclude_none=True
+	response_model_exclude_none=True,
+	openapi_extra=request_body(OCRRequest),
+	responses=STREAM_RESPONSES,
 )
-async def infer_ulca_v2_ocr_printed(ocr_request: OCRRequest, request: Request) -> OCRResponse:
+async def infer_ulca_v2_ocr_printed(request: Request) -> OCRResponse:
 	"""
 	This is the printed modality of the v2 ocr given to ulca.
 	this was transfered to ulca on late sept and was online by first week oct.
 	"""
-	process_images(ocr_request.image)
-	lcode, language, modality, dlevel = process_config(ocr_request.config)
-	call(f'./infer_ulca_v2.sh {modality} {language}', shell=True)
-	ret = process_ocr_output(lcode, modality, dlevel)
-	await save_logs(request, ret)
-	return ret
+	return await serve_ulca(request, 'infer_ulca_v2.sh', 'ulca_v2')
 
 
 @router.post(
 	'/v3/printed',
 	response_model=OCRResponse,
-	response_model_exclude_none=True
+	response_model_exclude_none=True,
+	openapi_extra=request_body(OCRRequest),
+	responses=STREAM_RESPONSES,
 )
-async def infer_ulca_v3_ocr_printed(ocr_request: OCRRequest, request: Request) -> OCRResponse:
+async def infer_ulca_v3_ocr_printed(request: Request) -> OCRResponse:
 	"""
 	This is the printed modality of the v2 ocr given to ulca.
 	this was transfered to ulca on late sept and was online by first week oct.
 	"""
-	process_images(ocr_request.image)
-	lcode, language, modality, dlevel = process_config(ocr_request.config)
-	modality = 'printed'
-	call(f'./infer_ulca_v3.sh {modality} {language}', shell=True)
-	ret = process_ocr_output(lcode, modality, dlevel)
-	await save_logs(request, ret)
-	return ret
+	return await serve_ulca(request, 'infer_ulca_v3.sh', 'ulca_v3', 'printed')
 
 
 @router.post(
 	'/v2/handwritten',
 	response_model=OCRResponse,
-	response_model_exclude_none=True
+	response_model_exclude_none=True,
+	openapi_extra=request_body(OCRRequest),
+	responses=STREAM_RESPONSES,
 )
-async def infer_ulca_v2_ocr_handwritten(ocr_request: OCRRequest, request: Request) -> OCRResponse:
+async def infer_ulca_v2_ocr_handwritten(request: Request) -> OCRResponse:
 	"""
 	This is the handwritten modality of the v2 ocr given to ulca.
 	"""
-	process_images(ocr_request.image)
-	lcode, language, modality, dlevel = process_config(ocr_request.config)
-	modality = 'handwritten'
-	call(f'./infer_ulca_v2.sh {modality} {language}', shell=True)
-	ret = process_ocr_output(lcode, modality, dlevel)
-	await save_logs(request, ret)
-	return ret
+	return await serve_ulca(request, 'infer_ulca_v2.sh', 'ulca_v2', 'handwritten')
 
 
 @router.post(
 	'/v2/scenetext',
 	response_model=OCRResponse,
-	response_model_exclude_none=True
+	response_model_exclude_none=True,
+	openapi_extra=request_body(OCRRequest),
+	responses=STREAM_RESPONSES,
 )
-async def infer_ulca_v2_ocr_scenetext(ocr_request: OCRRequest, request: Request) -> OCRResponse:
+async def infer_ulca_v2_ocr_scenetext(request: Request) -> OCRResponse:
 	"""
 	This is the handwritten modality of the v2 ocr given to ulca.
 	"""
-	process_images(ocr_request.image)
-	lcode, language, modality, dlevel = process_config(ocr_request.config)
-	modality = 'scenetext'
-	if language == 'malayalam':
-		# This is due to unavailability of the scenetext malayalam model
-		modality = 'printed'
-	call(f'./infer_ulca_v2.sh {modality} {language}', shell=True)
-	ret = process_ocr_output(lcode, modality, dlevel)
-	await save_logs(request, ret)
-	return ret
\ No newline at end of file
+	return await serve_ulca(request, 'infer_ulca_v2.sh', 'ulca_v2', 'scenetext')
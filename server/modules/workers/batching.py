@@ -0,0 +1,120 @@
+"""
+Micro batching of the inference requests.
+
+Concurrent requests for the same model are collected into one batch for up
+to max_wait seconds (or until max_batch_size images are collected). The
+first request of a batch waits for the others, runs the whole batch and
+hands every request back its own slice of the results.
+"""
+
+import threading
+import time
+from typing import Callable, Dict, Hashable, List, Optional, Tuple
+
+
+class Batch:
+
+	def __init__(self, max_batch_size: int):
+		self.max_batch_size = max_batch_size
+		self.images = []
+		self.closed = False
+		self.done = threading.Event()
+		self.results: Optional[List] = None
+		self.error: Optional[BaseException] = None
+
+	def is_full(self) -> bool:
+		return len(self.images) >= self.max_batch_size
+
+
+class BatchScheduler:
+
+	def __init__(
+		self,
+		run: Callable[[Hashable, List], List],
+		max_batch_size: int = 32,
+		max_wait: float = 0.02,
+		overrides: Optional[Dict[Tuple[str, str, str], Dict]] = None,
+	):
+		"""
+		run is called with the key and all the images of a batch and must
+		return one result per image in the same order.
+		overrides maps a (version, modality, language) to the
+		max_batch_size and/or max_wait to be used for that model.
+		"""
+		self.run = run
+		self.max_batch_size = max_batch_size
+		self.max_wait = max_wait
+		self.overrides = overrides or {}
+		self.pending: Dict[Hashable, Batch] = {}
+		self.lock = threading.Lock()
+		self.condition = threading.Condition(self.lock)
+
+	def limits(self, key: Hashable) -> Tuple[int, float]:
+		"""
+		returns the (max_batch_size, max_wait) of the model. the first three
+		items of the key are the (version, modality, language).
+		"""
+		override = self.overrides.get(tuple(key[:3]), {})
+		return (
+			override.get('max_batch_size', self.max_batch_size),
+			override.get('max_wait', self.max_wait),
+		)
+
+	def submit(self, key: Hashable, images: List) -> List:
+		"""
+		adds the images to the open batch of the model and blocks until
+		the results of the batch are available
+		"""
+		if not images:
+			return []
+		max_batch_size, max_wait = self.limits(key)
+		with self.lock:
+			batch = self.pending.get(key)
+			if batch is not None and len(batch.images) + len(images) > max_batch_size:
+				# no space left, the batch is started right away
+				batch.closed = True
+				del self.pending[key]
+				self.condition.notify_all()
+				batch = None
+			leader = batch is None
+			if leader:
+				batch = Batch(max_batch_size)
+				self.pending[key] = batch
+			start = len(batch.images)
+			batch.images.extend(images)
+			if batch.is_full():
+				batch.closed = True
+				del self.pending[key]
+				self.condition.notify_all()
+
+		if leader:
+			self._lead(key, batch, max_wait)
+		else:
+			batch.done.wait()
+		if batch.error is not None:
+			raise batch.error
+		return batch.results[start:start + len(images)]
+
+	def _lead(self, key: Hashable, batch: Batch, max_wait: float) -> None:
+		deadline = time.time() + max_wait
+		with self.lock:
+			while not batch.closed:
+				remaining = deadline - time.time()
+				if remaining <= 0:
+					break
+				self.condition.wait(remaining)
+			if self.pending.get(key) is batch:
+				del self.pending[key]
+			batch.closed = True
+		try:
+			print(f'running a batch of {len(batch.images)} images for {key}')
+			results = self.run(key, batch.images)
+			if len(results) != len(batch.images):
+				raise ValueError(
+					f'expected {len(batch.images)} results for the batch, got {len(results)}'
+				)
+			batch.results = results
+		except BaseException as e:
+			batch.error = e
+		finally:
+			batch.done.set()
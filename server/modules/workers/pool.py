@@ -0,0 +1,298 @@
+"""
+Pool of long lived inference workers.
+
+Every worker is a single process (normally a docker container started by
+worker.sh) serving one (version, modality, language) model. It loads the
+model once and then talks to the api over its stdin/stdout using one json
+object per line:
+
+	worker -> api   {"status": "ready"}
+	api -> worker   {"id": "<uuid>", "folder": "<path relative to root>", "request_id": "..."}
+	worker -> api   {"id": "<uuid>", "status": "ok", "out": {"0.jpg": "text"}}
+
+"out" (and the optional "prob") carry the same content that infer.py writes
+to out.json (and prob.json). If they are missing from the reply the files
+written by the worker inside the folder are read instead. The probabilities
+can also be written to prob.bin in the packed format of
+server/modules/core/tensors.py, which is requested with "prob_format".
+The request_id is the id of the api request (see server/modules/core/tracing.py),
+to be included in the logs of the worker, it is null outside of a request.
+Any stdout line that is not a json object is treated as worker logging.
+
+A worker that exits with EXIT_UNSUPPORTED while starting has no model for
+its key (worker.sh when the model folder is missing), the model is then
+served by the inference scripts until the api restarts. The other start
+failures (timeout, crash, ...) are retried after WORKER_RETRY_AFTER seconds,
+up to WORKER_MAX_START_FAILURES starts in a row before the model is treated
+as unsupported as well.
+"""
+
+import os
+import select
+import shlex
+import subprocess
+import threading
+import time
+from os.path import join, relpath
+from tempfile import TemporaryDirectory
+from typing import Dict, Optional, Tuple
+from uuid import uuid4
+
+from server.config import (RESIDENCY_POLICY, WORKER_COMMAND,
+                           WORKER_DATA_ROOT, WORKER_INFER_TIMEOUT,
+                           WORKER_MAX_START_FAILURES, WORKER_POOL_MAX_WORKERS,
+                           WORKER_RETRY_AFTER, WORKER_START_TIMEOUT)
+from server.modules.core.serialization import dumps, loads
+from server.modules.core.tensors import read_probabilities
+from server.modules.core.tracing import current_request_id
+from server.modules.metrics.timing import stage
+from server.modules.residency.manager import ResidencyManager
+
+
+EXIT_UNSUPPORTED = 3
+
+
+class WorkerError(Exception):
+
+	def __init__(self, message: str, unsupported: bool = False):
+		super().__init__(message)
+		# whether the worker has no model for the key, rather than failed
+		self.unsupported = unsupported
+
+
+class Worker:
+	"""
+	wrapper around one worker process. requests are serialised by a lock.
+	"""
+
+	def __init__(self, key: Tuple[str, str, str], command: str, root: str):
+		self.key = key
+		self.root = root
+		self.lock = threading.Lock()
+		self.last_used = time.time()
+		self._buffer = b''
+		print(f'starting the inference worker for {key}: {command}')
+		self.process = subprocess.Popen(
+			shlex.split(command),
+			stdin=subprocess.PIPE,
+			stdout=subprocess.PIPE,
+		)
+
+	def is_alive(self) -> bool:
+		return self.process.poll() is None
+
+	def _send(self, message: Dict) -> None:
+		try:
+			self.process.stdin.write(dumps(message) + b'\n')
+			self.process.stdin.flush()
+		except (BrokenPipeError, OSError) as e:
+			raise WorkerError(f'worker {self.key} is not accepting requests: {e}')
+
+	def _receive(self, timeout: float) -> Dict:
+		deadline = time.time() + timeout
+		fd = self.process.stdout.fileno()
+		while True:
+			while b'\n' in self._buffer:
+				line, self._buffer = self._buffer.split(b'\n', 1)
+				line = line.strip()
+				if line.startswith(b'{'):
+					return loads(line)
+				if line:
+					print(f'[worker {"-".join(self.key)}]', line.decode('utf-8', 'replace'))
+			remaining = deadline - time.time()
+			if remaining <= 0:
+				raise WorkerError(f'timed out while waiting for worker {self.key}')
+			ready, _, _ = select.select([fd], [], [], remaining)
+			if not ready:
+				continue
+			chunk = os.read(fd, 65536)
+			if not chunk:
+				code = self.process.wait()
+				raise WorkerError(
+					f'worker {self.key} exited with code {code}',
+					unsupported=code == EXIT_UNSUPPORTED,
+				)
+			self._buffer += chunk
+
+	def wait_ready(self, timeout: float) -> None:
+		message = self._receive(timeout)
+		if message.get('status') != 'ready':
+			raise WorkerError(f'unexpected handshake from worker {self.key}: {message}')
+
+	def infer(self, folder: str, timeout: float, **options) -> Tuple[Dict, Optional[Dict]]:
+		"""
+		runs the model over all the images inside the folder and returns
+		the (out.json, prob.json) equivalent dicts.
+		"""
+		request_id = str(uuid4())
+		with stage('inference'), self.lock:
+			self.last_used = time.time()
+			self._send({
+				'id': request_id,
+				'folder': relpath(folder, self.root),
+				'request_id': current_request_id.get(),
+				**options,
+			})
+			message = self._receive(timeout)
+			while message.get('id') != request_id:
+				message = self._receive(timeout)
+		if message.get('status') != 'ok':
+			raise WorkerError(message.get('detail', f'worker {self.key} failed'))
+		with stage('parse'):
+			out, prob = message.get('out'), message.get('prob')
+			if out is None:
+				with open(join(folder, 'out.json'), 'rb') as f:
+					out = loads(f.read())
+				prob_path = join(folder, 'prob.json')
+				if prob is None and os.path.exists(prob_path):
+					with open(prob_path, 'rb') as f:
+						prob = loads(f.read())
+			packed_path = join(folder, 'prob.bin')
+			if prob is None and os.path.exists(packed_path):
+				names = sorted(out, key=lambda x: int(x.split('.')[0]))
+				prob = read_probabilities(packed_path, names)
+		return out, prob
+
+	def stop(self, timeout: float = 10) -> None:
+		print(f'stopping the inference worker for {self.key}')
+		try:
+			self.process.stdin.close()
+			self.process.wait(timeout)
+		except (OSError, subprocess.TimeoutExpired):
+			self.process.kill()
+			self.process.wait()
+
+
+class WorkerPool:
+	"""
+	keeps one warm worker per (version, modality, language).
+	at most max_workers are kept alive, the residency manager decides which
+	worker is stopped to make space for a new model.
+	"""
+
+	def __init__(
+		self,
+		command: str,
+		root: str,
+		max_workers: int = 4,
+		start_timeout: float = 300,
+		infer_timeout: float = 600,
+		retry_after: float = 30,
+		max_start_failures: int = 3,
+		policy: str = 'lru',
+		name: str = 'workers',
+	):
+		self.command = command
+		self.root = root
+		self.start_timeout = start_timeout
+		self.infer_timeout = infer_timeout
+		self.retry_after = retry_after
+		self.max_start_failures = max_start_failures
+		self.workers: Dict[Tuple[str, str, str], Worker] = {}
+		self.residency = ResidencyManager(name, max_workers, policy)
+		self.unsupported = set()
+		# time after which the models that failed to start are tried again
+		self.retry_at: Dict[Tuple[str, str, str], float] = {}
+		self.start_failures: Dict[Tuple[str, str, str], int] = {}
+		self.start_locks = {}
+		self.lock = threading.Lock()
+
+	def workspace(self, prefix: str = 'ocr_images') -> TemporaryDirectory:
+		"""
+		returns a temporary folder inside the root shared with the workers
+		"""
+		os.makedirs(self.root, exist_ok=True)
+		return TemporaryDirectory(prefix=prefix, dir=self.root)
+
+	def _start(self, key: Tuple[str, str, str]) -> Worker:
+		version, modality, language = key
+		command = self.command.format(
+			version=version,
+			modality=modality,
+			language=language,
+			root=self.root,
+		)
+		try:
+			worker = Worker(key, command, self.root)
+		except OSError as e:
+			# the worker command is not available at all
+			raise WorkerError(f'unable to start the worker for {key}: {e}', unsupported=True)
+		try:
+			worker.wait_ready(self.start_timeout)
+		except WorkerError:
+			worker.stop()
+			raise
+		return worker
+
+	def get(self, key: Tuple[str, str, str]) -> Worker:
+		"""
+		returns the running worker for the model, starting it if required.
+		a slow model start only blocks the requests for the same model.
+		"""
+		if key in self.unsupported:
+			raise WorkerError(f'no worker available for {key}', unsupported=True)
+		if self.retry_at.get(key, 0) > time.time():
+			raise WorkerError(f'the worker for {key} failed to start, not retried yet')
+		with self.lock:
+			start_lock = self.start_locks.setdefault(key, threading.Lock())
+		with start_lock:
+			with self.lock:
+				worker = self.workers.get(key)
+				if worker is not None and not worker.is_alive():
+					print(f'inference worker for {key} died, restarting it')
+					del self.workers[key]
+					self.residency.remove(key)
+				if self.residency.hit(key):
+					return worker
+				# free the memory before the new model is loaded
+				evicted = [self.workers.pop(i) for i in self.residency.evict_for(key)]
+			for victim in evicted:
+				with victim.lock:
+					victim.stop()
+			start = time.time()
+			try:
+				with stage('start'):
+					worker = self._start(key)
+			except WorkerError as e:
+				failures = self.start_failures.get(key, 0) + 1
+				self.start_failures[key] = failures
+				if e.unsupported or failures >= self.max_start_failures:
+					self.unsupported.add(key)
+				else:
+					self.retry_at[key] = time.time() + self.retry_after
+				raise
+			self.retry_at.pop(key, None)
+			self.start_failures.pop(key, None)
+			with self.lock:
+				self.workers[key] = worker
+				self.residency.loaded(key, time.time() - start)
+		return worker
+
+	def infer(
+		self,
+		key: Tuple[str, str, str],
+		folder: str,
+		**options
+	) -> Tuple[Dict, Optional[Dict]]:
+		return self.get(key).infer(folder, self.infer_timeout, **options)
+
+	def shutdown(self) -> None:
+		with self.lock:
+			workers = list(self.workers.values())
+			for key in self.workers:
+				self.residency.remove(key)
+			self.workers.clear()
+		for worker in workers:
+			worker.stop()
+
+
+worker_pool = WorkerPool(
+	WORKER_COMMAND,
+	WORKER_DATA_ROOT,
+	max_workers=WORKER_POOL_MAX_WORKERS,
+	start_timeout=WORKER_START_TIMEOUT,
+	infer_timeout=WORKER_INFER_TIMEOUT,
+	retry_after=WORKER_RETRY_AFTER,
+	max_start_failures=WORKER_MAX_START_FAILURES,
+	policy=RESIDENCY_POLICY,
+)
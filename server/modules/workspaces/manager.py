@@ -0,0 +1,218 @@
+"""
+Per request scratch folders.
+
+Every request gets its own folder under the root (preferably on tmpfs) that
+is removed as soon as the request is done, so the routes that used to share
+/home/ocr/website/images can be served concurrently:
+
+	with workspace_manager.create('ulca') as workspace:
+		workspace.write('0.jpg', image)
+		call(f'./infer.sh ... {workspace.path}', shell=True)
+
+The bytes written to the folders are accounted against a quota per
+workspace and a quota shared by all the workspaces of the process.
+"""
+
+import os
+import shutil
+import tempfile
+import threading
+from os.path import join
+from typing import BinaryIO
+
+from fastapi import HTTPException
+
+from server.config import (WORKSPACE_QUOTA, WORKSPACE_ROOT,
+                           WORKSPACE_TOTAL_QUOTA)
+from server.modules.metrics.timing import stage
+
+
+def folder_size(path: str) -> int:
+	"""
+	bytes of the files inside the folder, the files removed meanwhile are
+	skipped
+	"""
+	ret = 0
+	for root, _, files in os.walk(path):
+		for name in files:
+			try:
+				ret += os.path.getsize(join(root, name))
+			except OSError:
+				pass
+	return ret
+
+
+class Workspace:
+
+	def __init__(self, manager: 'WorkspaceManager', path: str, quota: int):
+		self.manager = manager
+		self.path = path
+		self.quota = quota
+		self.size = 0
+		self.detached = False
+
+	def reserve(self, size: int) -> None:
+		"""
+		accounts size bytes to the workspace, raises a 413 when the
+		request is over its quota and a 503 when the server is out of space
+		"""
+		if self.size + size > self.quota:
+			raise HTTPException(
+				status_code=413,
+				detail=f'The request exceeds the workspace quota of {self.quota} bytes'
+			)
+		self.manager.reserve(size)
+		self.size += size
+
+	def write(self, name: str, data: bytes) -> str:
+		self.reserve(len(data))
+		path = join(self.path, name)
+		with open(path, 'wb') as f:
+			f.write(data)
+		return path
+
+	def copy(self, name: str, source: BinaryIO, chunk_size: int = 1 << 20) -> str:
+		"""
+		copies the file object in chunks, stops as soon as the quota is hit
+		"""
+		path = join(self.path, name)
+		with open(path, 'wb') as f:
+			while True:
+				chunk = source.read(chunk_size)
+				if not chunk:
+					break
+				self.reserve(len(chunk))
+				f.write(chunk)
+		return path
+
+	def account(self, name: str) -> str:
+		"""
+		accounts a file that was written to the workspace by someone else
+		(eg. PIL) and returns its path
+		"""
+		path = join(self.path, name)
+		self.reserve(os.path.getsize(path))
+		return path
+
+	def release(self, size: int) -> None:
+		"""
+		gives back the bytes of a file that was removed from the workspace
+		"""
+		size = min(size, self.size)
+		self.manager.release(size)
+		self.size -= size
+
+	def detach(self) -> str:
+		"""
+		keeps the folder after the request (eg. for a job), it has to be
+		removed by its new owner. its bytes stay accounted by the manager
+		until they are gone from the disk (see WorkspaceManager.account_detached)
+		"""
+		self.manager.detach(self.size)
+		self.size = 0
+		self.detached = True
+		return self.path
+
+	def handover(self) -> 'Workspace':
+		"""
+		moves the folder and its accounting to a new workspace, eg. for a
+		streamed response that uses it after the request handler returned
+		"""
+		other = Workspace(self.manager, self.path, self.quota)
+		other.size = self.size
+		self.size = 0
+		self.detached = True
+		return other
+
+	def cleanup(self) -> None:
+		if not self.detached:
+			shutil.rmtree(self.path, ignore_errors=True)
+		self.manager.release(self.size)
+		self.size = 0
+
+	def __enter__(self) -> 'Workspace':
+		return self
+
+	def __exit__(self, *args) -> None:
+		self.cleanup()
+
+
+class WorkspaceManager:
+
+	def __init__(self, root: str, quota: int, total_quota: int):
+		self.root = root
+		self.quota = quota
+		self.total_quota = total_quota
+		self.used = 0
+		# bytes of the detached workspaces that are still on disk
+		self.detached = 0
+		self.lock = threading.Lock()
+
+	def create(self, prefix: str = 'ocr') -> Workspace:
+		"""
+		creates a new empty workspace named <prefix>.<pid>.<random>, the pid
+		is used to find the folders left behind by crashed processes. the
+		random part of mkdtemp never contains a dot.
+		"""
+		with stage('workspace'):
+			os.makedirs(self.root, exist_ok=True)
+			path = tempfile.mkdtemp(prefix=f'{prefix}.{os.getpid()}.', dir=self.root)
+		return Workspace(self, path, self.quota)
+
+	def reserve(self, size: int) -> None:
+		with self.lock:
+			if self.used + self.detached + size > self.total_quota:
+				raise HTTPException(
+					status_code=503,
+					detail='Not enough scratch space to process the request, try again later'
+				)
+			self.used += size
+
+	def release(self, size: int) -> None:
+		with self.lock:
+			self.used = max(self.used - size, 0)
+
+	def detach(self, size: int) -> None:
+		with self.lock:
+			self.used = max(self.used - size, 0)
+			self.detached += size
+
+	def account_detached(self) -> None:
+		"""
+		measures the detached workspaces left on disk, their new owners (eg.
+		the job workers in other processes) remove them without telling the
+		manager
+		"""
+		size = folder_size(self.root)
+		with self.lock:
+			self.detached = max(size - self.used, 0)
+
+	def cleanup_stale(self) -> None:
+		"""
+		removes the workspaces of the processes that are not running anymore
+		"""
+		try:
+			names = os.listdir(self.root)
+		except OSError:
+			return
+		for name in names:
+			try:
+				pid = int(name.split('.')[-2])
+			except (IndexError, ValueError):
+				continue
+			if pid == os.getpid():
+				continue
+			try:
+				os.kill(pid, 0)
+			except ProcessLookupError:
+				print(f'removing the stale workspace {name}')
+				shutil.rmtree(join(self.root, name), ignore_errors=True)
+			except PermissionError:
+				pass
+
+
+workspace_manager = WorkspaceManager(
+	WORKSPACE_ROOT,
+	WORKSPACE_QUOTA,
+	WORKSPACE_TOTAL_QUOTA,
+)
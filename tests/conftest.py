@@ -1,5 +1,17 @@
+import os
+
 import pytest
 
+import server.helper
+from server.models import OCRImageResponse
+from server.modules.archive.images import image_archive
+from server.modules.cache.results import result_cache
+from server.modules.logs.writer import writers
+from server.modules.metrics.timing import stage
+from server.modules.residency.manager import residency_managers
+from server.modules.workers.pool import worker_pool
+from server.modules.workspaces.manager import workspace_manager
+
 def pytest_addoption(parser):
 	parser.addoption(
 		'--modality',
@@ -33,4 +45,65 @@ def ver(request):
 	value = request.config.option.ver
 	if value is None:
 		value = 'v2'
-	return value
\ No newline at end of file
+	return value
+@pytest.fixture
+def fake_model(monkeypatch):
+	"""
+	replaces the models with one that returns the content of the images,
+	returns the list of the images it was called with. like the models
+	without workers, the probabilities are only returned when requested.
+	"""
+	calls = []
+
+	def infer_folder(folder, lcode, language, version, modality, include_probability=False):
+		# runs in the threadpool, the timer of the request is still available
+		with stage('inference'):
+			images = []
+			for idx in range(len(os.listdir(folder))):
+				with open(f'{folder}/{idx}.jpg', 'rb') as f:
+					images.append(f.read().decode('utf-8', 'replace'))
+			calls.append(images)
+			meta = {'max_prob': 'p'} if include_probability else {}
+			return [OCRImageResponse(text=i, meta=meta) for i in images]
+
+	monkeypatch.setattr(server.helper, 'infer_folder', infer_folder)
+	return calls
+
+
+@pytest.fixture(autouse=True)
+def registries():
+	"""
+	unregisters the log writers and the residency managers created by the
+	test, so that they are not exported by /ocr/metrics and /ocr/residency
+	or closed with the api for the rest of the session
+	"""
+	registered_writers = list(writers)
+	registered_managers = dict(residency_managers)
+	yield
+	for writer in writers:
+		if writer not in registered_writers:
+			writer.close()
+	writers[:] = registered_writers
+	residency_managers.clear()
+	residency_managers.update(registered_managers)
+
+
+@pytest.fixture
+def isolated_server(monkeypatch, tmp_path):
+	"""
+	keeps the folders written by the api inside tmp_path and disables the
+	result cache, so that every request of the test reaches the model
+	"""
+	monkeypatch.setattr(worker_pool, 'root', str(tmp_path / 'workers'))
+	monkeypatch.setattr(workspace_manager, 'root', str(tmp_path / 'workspaces'))
+	monkeypatch.setattr(image_archive, 'folder', str(tmp_path / 'archive'))
+	monkeypatch.setattr(result_cache, 'enabled', False)
+	return tmp_path
+
+
+@pytest.fixture
+def native_engine(monkeypatch):
+	"""
+	postprocesses with the in-process lexicon index instead of the containers
+	"""
+	monkeypatch.setattr('server.app.POSTPROCESS_ENGINE', 'native')
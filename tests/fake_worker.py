@@ -0,0 +1,37 @@
+"""
+stand-in for the worker.py entrypoint of the model images.
+it follows the protocol of server/modules/workers/pool.py and returns
+"<language> <image content>" as the text of every image.
+
+usage: python tests/fake_worker.py <modality> <language> <version> <root>
+"""
+
+import json
+import os
+import sys
+import time
+from os.path import join
+
+
+def main():
+	modality, language, version, root = sys.argv[1:5]
+	delay = float(os.environ.get('FAKE_WORKER_DELAY', '0'))
+	print('loading the fake model')
+	print(json.dumps({'status': 'ready'}), flush=True)
+	for line in sys.stdin:
+		request = json.loads(line)
+		folder = join(root, request['folder'])
+		time.sleep(delay)
+		images = sorted(i for i in os.listdir(folder) if i.endswith('.jpg'))
+		out = {}
+		for i in images:
+			with open(join(folder, i), 'rb') as f:
+				out[i] = f'{language} {f.read().decode("utf-8", "replace")}'
+		reply = {'id': request['id'], 'status': 'ok', 'out': out}
+		if request.get('include_probability'):
+			reply['prob'] = {i: {'data_prob': '', 'max_prob': ''} for i in images}
+		print(json.dumps(reply), flush=True)
+
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,28 @@
+import asyncio
+import time
+
+from server.modules.core.aio import backend_limit, run_script
+
+
+def test_scripts_do_not_block_the_event_loop():
+	async def main():
+		start = time.time()
+		await asyncio.gather(*[run_script('sleep 0.3') for _ in range(3)])
+		return time.time() - start
+	assert asyncio.run(main()) < 0.8
+
+
+def test_backend_limit():
+	async def main():
+		running = []
+		peak = []
+
+		async def job():
+			async with backend_limit('test_aio'):
+				running.append(1)
+				peak.append(len(running))
+				await asyncio.sleep(0.01)
+				running.pop()
+		await asyncio.gather(*[job() for _ in range(4)])
+		return max(peak)
+	assert asyncio.run(main()) == 1
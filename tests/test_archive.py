@@ -0,0 +1,54 @@
+import hashlib
+import os
+
+from server.modules.archive.images import ImageArchive
+
+
+def digest(image):
+	return hashlib.sha256(image).hexdigest()
+
+
+def test_images_are_archived_once(tmp_path):
+	archive = ImageArchive(str(tmp_path / 'archive'))
+	image = b'image'
+	assert archive.archive(digest(image), image)
+	# the known images are not queued again
+	assert not archive.archive(digest(image), image)
+	archive.flush()
+	path = archive.path(digest(image))
+	assert path == str(tmp_path / 'archive' / digest(image)[:2] / digest(image)[2:4] / f'{digest(image)}.jpg')
+	with open(path, 'rb') as f:
+		assert f.read() == image
+	# nor written again by another process
+	other = ImageArchive(str(tmp_path / 'archive'))
+	assert other.archive(digest(image), image)
+	other.flush()
+	assert (other.archived, other.skipped) == (0, 1)
+	archive.close()
+	other.close()
+
+
+def test_files_are_read_when_queued(tmp_path):
+	archive = ImageArchive(str(tmp_path / 'archive'))
+	path = tmp_path / 'image.jpg'
+	path.write_bytes(b'image')
+	archive.archive_files([(str(path), digest(b'image'))])
+	os.remove(path)
+	archive.flush()
+	assert os.path.exists(archive.path(digest(b'image')))
+	archive.close()
+
+
+def test_sampling_and_queue_limit(tmp_path):
+	images = [str(i).encode() for i in range(100)]
+	archive = ImageArchive(str(tmp_path), sample_rate=0)
+	assert not any(archive.archive(digest(i), i) for i in images)
+	archive = ImageArchive(str(tmp_path), sample_rate=0.5)
+	sampled = [archive.sampled(digest(i)) for i in images]
+	assert 20 < sum(sampled) < 80
+	assert sampled == [archive.sampled(digest(i)) for i in images]
+	archive = ImageArchive(str(tmp_path), max_bytes=4)
+	archive._start = lambda: None
+	assert archive.archive(digest(b'abc'), b'abc')
+	assert not archive.archive(digest(b'def'), b'def')
+	assert archive.dropped == 1
@@ -0,0 +1,114 @@
+import os
+import threading
+import time
+
+import server.helper
+from server.models import OCRImageResponse
+from server.modules.workers.batching import BatchScheduler
+from server.modules.workspaces.manager import WorkspaceManager
+
+KEY = ('v4', 'printed', 'hindi')
+
+
+class Model:
+	"""
+	records the batches it was called with and returns the images in upper case
+	"""
+
+	def __init__(self, delay=0):
+		self.batches = []
+		self.delay = delay
+
+	def __call__(self, key, images):
+		self.batches.append(list(images))
+		time.sleep(self.delay)
+		return [i.upper() for i in images]
+
+
+def submit_concurrently(scheduler, requests, key=KEY):
+	results = [None] * len(requests)
+
+	def submit(idx):
+		results[idx] = scheduler.submit(key, requests[idx])
+
+	threads = [threading.Thread(target=submit, args=(i,)) for i in range(len(requests))]
+	for thread in threads:
+		thread.start()
+	for thread in threads:
+		thread.join()
+	return results
+
+
+def test_concurrent_requests_are_batched():
+	model = Model()
+	scheduler = BatchScheduler(model, max_batch_size=100, max_wait=0.2)
+	requests = [[f'{i}a', f'{i}b'] for i in range(5)]
+	results = submit_concurrently(scheduler, requests)
+	assert results == [[f'{i}A', f'{i}B'] for i in range(5)]
+	assert len(model.batches) == 1
+	assert sorted(model.batches[0]) == sorted(sum(requests, []))
+
+
+def test_full_batch_is_started_right_away():
+	model = Model()
+	scheduler = BatchScheduler(model, max_batch_size=4, max_wait=10)
+	start = time.time()
+	results = submit_concurrently(scheduler, [['a', 'b'], ['c', 'd']])
+	assert time.time() - start < 5
+	assert sorted(results) == [['A', 'B'], ['C', 'D']]
+
+
+def test_batches_do_not_exceed_the_limit():
+	model = Model()
+	scheduler = BatchScheduler(model, max_batch_size=4, max_wait=0.1)
+	results = submit_concurrently(scheduler, [['a', 'b', 'c']] * 4)
+	assert results == [['A', 'B', 'C']] * 4
+	assert all(len(i) <= 4 for i in model.batches)
+
+
+def test_per_model_limits():
+	scheduler = BatchScheduler(
+		Model(),
+		max_batch_size=8,
+		max_wait=0.01,
+		overrides={KEY: {'max_batch_size': 64}},
+	)
+	assert scheduler.limits(KEY + ('hi', False)) == (64, 0.01)
+	assert scheduler.limits(('v4', 'printed', 'tamil')) == (8, 0.01)
+
+
+def test_errors_reach_every_request():
+	def fail(key, images):
+		raise RuntimeError('model crashed')
+
+	scheduler = BatchScheduler(fail, max_wait=0.1)
+	errors = []
+
+	def submit():
+		try:
+			scheduler.submit(KEY, ['a'])
+		except RuntimeError as e:
+			errors.append(e)
+
+	threads = [threading.Thread(target=submit) for _ in range(3)]
+	for thread in threads:
+		thread.start()
+	for thread in threads:
+		thread.join()
+	assert len(errors) == 3
+
+
+def test_batch_images_are_linked(monkeypatch, isolated_server, tmp_path):
+	inodes = []
+
+	def infer_folder(folder, lcode, language, version, modality, include_probability=False):
+		inodes.append(os.stat(os.path.join(folder, '0.jpg')).st_ino)
+		return [OCRImageResponse(text='text')]
+
+	monkeypatch.setattr(server.helper, 'infer_folder', infer_folder)
+	with WorkspaceManager(str(tmp_path / 'workspaces'), 1 << 20, 1 << 20).create('test') as workspace:
+		path = workspace.write('0.jpg', b'image')
+		assert server.helper.run_batch(('v4', 'printed', 'hindi', 'hi', False), [path]) == [
+			{'text': 'text', 'meta': {}}
+		]
+		assert inodes == [os.stat(path).st_ino]
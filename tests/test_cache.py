@@ -0,0 +1,98 @@
+import base64
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+
+from server.app import app
+from server.modules.cache.results import (ResultCache, lookup_results,
+                                         result_cache, store_results)
+
+
+def encode(image):
+	return base64.b64encode(image.encode('utf-8')).decode('utf-8')
+
+
+def test_memory_tier_is_bounded():
+	cache = ResultCache(max_items=2)
+	for i in range(3):
+		cache.set(str(i), {'text': str(i)})
+	assert cache.get('0') is None
+	assert cache.get('2') == {'text': '2'}
+
+
+def test_results_expire():
+	cache = ResultCache(ttl=0.01)
+	cache.set('a', {'text': 'a'})
+	time.sleep(0.02)
+	assert cache.get('a') is None
+
+
+def test_disk_tier_is_shared(tmp_path):
+	ResultCache(folder=str(tmp_path)).set('ab12', {'text': 'a'})
+	other = ResultCache(folder=str(tmp_path))
+	assert other.get('ab12') == {'text': 'a'}
+	assert other.hits == 1
+
+
+def test_key_depends_on_the_model():
+	cache = ResultCache()
+	keys = {
+		cache.key('digest', 'v4', 'printed', 'hindi'),
+		cache.key('digest', 'v4', 'printed', 'tamil'),
+		cache.key('other', 'v4', 'printed', 'hindi'),
+	}
+	assert len(keys) == 3
+
+
+@pytest.fixture
+def inferred(monkeypatch, isolated_server, fake_model):
+	"""
+	caches the results of the fake model, returns the images it was called with
+	"""
+	monkeypatch.setattr(result_cache, 'folder', None)
+	monkeypatch.setattr(result_cache, 'enabled', True)
+	result_cache.clear()
+	yield fake_model
+	result_cache.clear()
+
+
+def call_infer(images, include_probability=False):
+	return TestClient(app).post('/ocr/infer', json={
+		'imageContent': [encode(i) for i in images],
+		'language': 'hi',
+		'version': 'v4',
+		'meta': {'include_probability': include_probability},
+	})
+
+
+def test_partial_hits_are_merged_in_order(inferred):
+	assert [i['text'] for i in call_infer(['a', 'b']).json()] == ['a', 'b']
+	response = call_infer(['c', 'b', 'a', 'd'])
+	assert [i['text'] for i in response.json()] == ['c', 'b', 'a', 'd']
+	assert inferred == [['a', 'b'], ['c', 'd']]
+	call_infer(['d', 'a'])
+	assert len(inferred) == 2
+
+
+def test_probabilities_are_cached_with_the_text(inferred):
+	call_infer(['a'])
+	response = call_infer(['a', 'b'], include_probability=True)
+	# a was inferred without the probabilities, so it is inferred again
+	assert inferred == [['a'], ['a', 'b']]
+	assert [i['meta'] for i in response.json()] == [{'max_prob': 'p'}] * 2
+	assert call_infer(['b', 'a']).json() == [{'text': 'b', 'meta': {}}, {'text': 'a', 'meta': {}}]
+	call_infer(['a'], include_probability=True)
+	assert len(inferred) == 2
+
+
+def test_probabilities_are_only_cached_when_requested(monkeypatch):
+	monkeypatch.setattr(result_cache, 'folder', None)
+	monkeypatch.setattr(result_cache, 'enabled', True)
+	result_cache.clear()
+	model = ('v4', 'printed', 'hindi')
+	keys, results, missing = lookup_results(['a'], model)
+	# a model that returns the probabilities anyway
+	store_results(keys, results, missing, [{'text': 'a', 'meta': {'max_prob': 'p'}}])
+	assert result_cache.get(keys[0]) == {'result': {'text': 'a', 'meta': {}}, 'probability': False}
+	result_cache.clear()
@@ -0,0 +1,22 @@
+import base64
+import json
+import os
+
+from fastapi.testclient import TestClient
+
+import server.modules.cegis.helper
+from server.app import app
+
+
+def test_results_only_carry_the_text(monkeypatch, isolated_server):
+	def call(command, shell, env):
+		folder = command.split()[-1]
+		names = [i for i in os.listdir(folder) if i.endswith('.jpg')]
+		with open(os.path.join(folder, 'out.json'), 'w') as f:
+			json.dump({i: 'text' for i in names}, f)
+		with open(os.path.join(folder, 'prob.json'), 'w') as f:
+			json.dump({i: {'confidence': 0.5} for i in names}, f)
+
+	monkeypatch.setattr(server.modules.cegis.helper, 'call', call)
+	response = TestClient(app).post('/ocr/cegis/', json={'images': [base64.b64encode(b'image').decode()]})
+	assert response.json() == [{'text': 'text'}]
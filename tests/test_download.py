@@ -0,0 +1,96 @@
+import asyncio
+import io
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+from fastapi import HTTPException
+from PIL import Image
+
+from server.modules.ingest.download import download_images
+from server.modules.workspaces.manager import WorkspaceManager
+
+
+def encode(format):
+	f = io.BytesIO()
+	Image.new('RGBA' if format == 'PNG' else 'RGB', (4, 4)).save(f, format)
+	return f.getvalue()
+
+
+FILES = {
+	'/image.jpg': encode('JPEG'),
+	'/image.png': encode('PNG'),
+	'/large.jpg': encode('JPEG') + b'\0' * 1000,
+}
+
+
+class Handler(BaseHTTPRequestHandler):
+
+	def do_GET(self):
+		if self.path == '/slow.jpg':
+			time.sleep(0.2)
+		content = FILES.get(self.path.replace('/slow', '/image'))
+		if content is None:
+			self.send_response(404)
+			self.end_headers()
+			return
+		self.send_response(200)
+		self.send_header('Content-Length', str(len(content)))
+		self.end_headers()
+		self.wfile.write(content)
+
+	def log_message(self, *args):
+		pass
+
+
+@pytest.fixture(scope='module')
+def server():
+	httpd = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+	threading.Thread(target=httpd.serve_forever, daemon=True).start()
+	yield f'http://127.0.0.1:{httpd.server_address[1]}'
+	httpd.shutdown()
+
+
+@pytest.fixture
+def workspace(tmp_path):
+	with WorkspaceManager(str(tmp_path), 1 << 20, 1 << 20).create('test') as workspace:
+		yield workspace
+
+
+def download(urls, workspace, **kwargs):
+	return asyncio.run(download_images(urls, workspace, **kwargs))
+
+
+def test_jpeg_is_kept_and_png_is_converted(server, workspace):
+	images = download({0: f'{server}/image.jpg', 2: f'{server}/image.png'}, workspace)
+	with open(images[0].path, 'rb') as f:
+		assert f.read() == FILES['/image.jpg']
+	with Image.open(images[2].path) as img:
+		assert (img.format, img.mode) == ('JPEG', 'RGB')
+	assert images[2].path.endswith('2.jpg')
+	assert workspace.size == images[0].size + images[2].size
+
+
+def test_converted_image_is_accounted_once(server, tmp_path):
+	# the quota does not fit both the png and its jpeg
+	quota = len(FILES['/image.png']) + len(FILES['/image.jpg']) - 1
+	with WorkspaceManager(str(tmp_path), quota, 1 << 20).create('test') as workspace:
+		images = download({0: f'{server}/image.png'}, workspace)
+		assert workspace.size == images[0].size
+		assert workspace.manager.used == images[0].size
+
+
+def test_downloads_are_concurrent(server, workspace):
+	start = time.time()
+	download({i: f'{server}/slow.jpg' for i in range(4)}, workspace, concurrency=4)
+	assert time.time() - start < 0.6
+
+
+def test_errors(server, workspace):
+	with pytest.raises(HTTPException) as e:
+		download({0: f'{server}/missing.jpg'}, workspace)
+	assert e.value.status_code == 400
+	with pytest.raises(HTTPException) as e:
+		download({0: f'{server}/large.jpg'}, workspace, max_size=1000)
+	assert e.value.status_code == 413
@@ -0,0 +1,155 @@
+import asyncio
+import base64
+import hashlib
+import json
+
+import pytest
+from fastapi import HTTPException
+from fastapi.testclient import TestClient
+
+from server.app import app
+from server.modules.ingest.stream import ingest_json, ingest_multipart
+from server.modules.workspaces.manager import WorkspaceManager
+
+
+class StreamedRequest:
+
+	def __init__(self, body, chunk_size, headers=None):
+		self.body = body
+		self.chunk_size = chunk_size
+		self.headers = headers or {}
+
+	async def stream(self):
+		for i in range(0, len(self.body), self.chunk_size):
+			yield self.body[i:i + self.chunk_size]
+
+
+@pytest.fixture
+def workspace(tmp_path):
+	with WorkspaceManager(str(tmp_path), 1 << 20, 1 << 20).create('test') as workspace:
+		yield workspace
+
+
+def ingest(workspace, body, chunk_size=7, **limits):
+	request = StreamedRequest(body, chunk_size)
+	return asyncio.run(ingest_json(request, workspace, ('imageContent', '*'), **limits))
+
+
+@pytest.mark.parametrize('chunk_size', [1, 3, 7, 1024])
+def test_images_are_streamed_to_the_workspace(workspace, chunk_size):
+	images = [bytes(range(256)) * 3, b'image 1']
+	encoded = [base64.b64encode(i).decode() for i in images]
+	body = json.dumps({
+		'imageContent': encoded,
+		'language': 'hi',
+		'meta': {'text': 'हिन्दी \"quoted\"', 'values': [1, 2.5, True, None]},
+	}).replace('/', '\\/').encode('utf-8')
+	parsed, streamed = ingest(workspace, body, chunk_size)
+	assert parsed['language'] == 'hi'
+	assert parsed['meta'] == {'text': 'हिन्दी \"quoted\"', 'values': [1, 2.5, True, None]}
+	assert parsed['imageContent'] == [hashlib.sha256(i).hexdigest() for i in images]
+	for idx, image in enumerate(images):
+		assert streamed[idx].size == len(image)
+		with open(streamed[idx].path, 'rb') as f:
+			assert f.read() == image
+	assert workspace.size == sum(map(len, images))
+
+
+@pytest.mark.parametrize('body', [b'{"imageContent": [', b'{"a" 1}', b'[1, 2] 3', b'{"a": tru}'])
+def test_invalid_body(workspace, body):
+	with pytest.raises(HTTPException) as e:
+		ingest(workspace, body)
+	assert e.value.status_code == 400
+
+
+def test_size_limits(workspace):
+	body = json.dumps({'imageContent': [base64.b64encode(b'0' * 100).decode()]}).encode()
+	with pytest.raises(HTTPException) as e:
+		ingest(workspace, body, max_image_size=99)
+	assert e.value.status_code == 413
+	with pytest.raises(HTTPException) as e:
+		ingest(workspace, body, max_request_size=len(body) - 1)
+	assert e.value.status_code == 413
+	with pytest.raises(HTTPException) as e:
+		ingest(workspace, b'{"language": "' + b'a' * 20 + b'"}', max_field_size=10)
+	assert e.value.status_code == 413
+
+
+def multipart_body(fields, images):
+	parts = [
+		f'--b\r\nContent-Disposition: form-data; name="{k}"\r\n\r\n{v}\r\n'.encode()
+		for k, v in fields.items()
+	]
+	parts += [
+		f'--b\r\nContent-Disposition: form-data; name="images"; filename="{i}.jpg"\r\n'.encode()
+		+ b'Content-Type: image/jpeg\r\n\r\n' + image + b'\r\n'
+		for i, image in enumerate(images)
+	]
+	return b''.join(parts) + b'--b--\r\n'
+
+
+def ingest_form(workspace, body, chunk_size=7, **limits):
+	request = StreamedRequest(body, chunk_size, {'content-type': 'multipart/form-data; boundary=b'})
+	return asyncio.run(ingest_multipart(request, workspace, **limits))
+
+
+@pytest.mark.parametrize('chunk_size', [1, 7, 1024])
+def test_multipart_images_are_streamed_to_the_workspace(workspace, chunk_size):
+	images = [bytes(range(256)) * 3, b'image 1']
+	body = multipart_body({'language': 'hi', 'meta': '{"a": 1}'}, images)
+	parsed, streamed = ingest_form(workspace, body, chunk_size)
+	assert parsed['language'] == 'hi' and parsed['meta'] == {'a': 1}
+	assert parsed['imageContent'] == [hashlib.sha256(i).hexdigest() for i in images]
+	with open(streamed[0].path, 'rb') as f:
+		assert f.read() == images[0]
+	assert workspace.size == sum(map(len, images))
+
+
+def test_multipart_limits(workspace):
+	body = multipart_body({'language': 'hi'}, [b'0' * 100])
+	for limits in [
+		{'max_image_size': 99},
+		{'max_request_size': len(body) - 1},
+		{'max_field_size': 1},
+	]:
+		with pytest.raises(HTTPException) as e:
+			ingest_form(workspace, body, **limits)
+		assert e.value.status_code == 413
+	with pytest.raises(HTTPException) as e:
+		ingest_form(workspace, body[:-10])
+	assert e.value.status_code == 400
+
+
+@pytest.fixture
+def echo_model(isolated_server, fake_model):
+	return fake_model
+
+
+def frame(data):
+	return len(data).to_bytes(4, 'big') + data
+
+
+def test_binary_bodies(echo_model):
+	client = TestClient(app)
+	expected = [{'text': f'image {i}', 'meta': {}} for i in range(3)]
+	response = client.post(
+		'/ocr/infer',
+		data={'language': 'hi', 'version': 'v4', 'meta': '{}'},
+		files=[('images', (f'{i}.jpg', f'image {i}'.encode())) for i in range(3)],
+	)
+	assert response.json() == expected
+	response = client.post(
+		'/ocr/infer',
+		content=b''.join(
+			[frame(json.dumps({'language': 'hi', 'version': 'v4'}).encode())]
+			+ [frame(f'image {i}'.encode()) for i in range(3)]
+		),
+		headers={'content-type': 'application/octet-stream'},
+	)
+	assert response.json() == expected
+	response = client.post(
+		'/ocr/infer',
+		content=frame(b'{"language": "hi"}') + frame(b'image')[:-1],
+		headers={'content-type': 'application/octet-stream'},
+	)
+	assert response.status_code == 400
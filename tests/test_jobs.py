@@ -0,0 +1,266 @@
+import asyncio
+import base64
+import copy
+import hashlib
+import os
+import time
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+import pytest
+from fastapi import HTTPException
+from fastapi.testclient import TestClient
+
+import server.modules.core.mixins
+import server.modules.jobs.models
+import server.modules.jobs.worker
+from server.app import app
+from server.modules.jobs.models import Job
+from server.modules.jobs.routes import jobs_storage
+from server.modules.jobs.worker import run_job
+
+
+class MemoryJob(Job):
+	"""
+	records the updates and the results instead of saving them in mongo
+	"""
+	updates: list = []
+	saved: dict = {}
+	claimed: bool = True
+	beats: int = 0
+
+	async def update(self, **kwargs):
+		self.updates.append(kwargs)
+
+	async def save_results(self, start, results):
+		self.saved.update({start + idx: i for idx, i in enumerate(results)})
+
+	async def heartbeat(self):
+		self.beats += 1
+		return self.claimed
+
+
+@pytest.fixture
+def job(isolated_server, tmp_path, fake_model):
+	folder = tmp_path / 'job'
+	folder.mkdir()
+	for idx in range(5):
+		(folder / f'{idx}.jpg').write_text(f'image {idx}')
+	job = MemoryJob(
+		request={
+			'imageContent': [hashlib.sha256(f'image {i}'.encode()).hexdigest() for i in range(5)],
+			'language': 'hi',
+			'version': 'v4',
+		},
+		folder=str(folder),
+		images=5,
+		updates=[],
+		saved={},
+	)
+	return job
+
+
+def test_job_is_processed_in_chunks(job):
+	asyncio.run(run_job(job, chunk_size=2))
+	assert [i.get('completed') for i in job.updates] == [2, 4, 5, None]
+	assert job.saved == {i: {'text': f'image {i}', 'meta': {}} for i in range(5)}
+	assert job.updates[-1]['status'] == 'done'
+	assert not os.path.exists(job.folder)
+
+
+def test_failed_job(job):
+	job.request['version'] = 'unknown'
+	asyncio.run(run_job(job))
+	assert job.updates[-1]['status'] == 'failed'
+	assert job.updates[-1]['error']
+
+
+@pytest.fixture
+def slow_chunks(monkeypatch):
+	infer_chunk = server.modules.jobs.worker.infer_chunk
+
+	def slow_chunk(*args):
+		time.sleep(0.05)
+		return infer_chunk(*args)
+
+	monkeypatch.setattr(server.modules.jobs.worker, 'infer_chunk', slow_chunk)
+
+
+def test_claim_is_renewed_while_the_chunks_run(job, slow_chunks):
+	asyncio.run(run_job(job, chunk_size=2, heartbeat_interval=0.01))
+	assert job.beats > 1
+	assert job.updates[-1]['status'] == 'done'
+
+
+def test_job_claimed_by_another_worker_is_left_to_it(job, slow_chunks):
+	job.claimed = False
+	asyncio.run(run_job(job, chunk_size=2, heartbeat_interval=0.01))
+	assert job.saved == {}
+	assert job.updates == []
+	assert os.path.exists(job.folder)
+
+
+@pytest.fixture
+def no_scratch_space(monkeypatch):
+	def infer_chunk(*args):
+		raise HTTPException(status_code=503, detail='Not enough scratch space')
+
+	monkeypatch.setattr(server.modules.jobs.worker, 'infer_chunk', infer_chunk)
+
+
+def test_transient_errors_requeue_the_job(job, no_scratch_space):
+	asyncio.run(run_job(job, max_attempts=2))
+	update = job.updates[-1]
+	assert update['status'] == 'queued' and update['worker'] is None
+	assert update['attempts'] == 1 and update['retry_at']
+	assert os.path.exists(job.folder)
+	# the last attempt fails the job
+	job.attempts = 1
+	asyncio.run(run_job(job, max_attempts=2))
+	assert job.updates[-1]['status'] == 'failed'
+	assert not os.path.exists(job.folder)
+
+
+OPERATORS = {
+	'$lt': lambda value, arg: value is not None and value < arg,
+	'$gt': lambda value, arg: value is not None and value > arg,
+	'$gte': lambda value, arg: value is not None and value >= arg,
+}
+
+
+def matches(doc, query):
+	"""
+	the subset of the mongo queries used by the jobs
+	"""
+	for key, cond in query.items():
+		if key == '$or':
+			if not any(matches(doc, i) for i in cond):
+				return False
+		elif isinstance(cond, dict):
+			for op, arg in cond.items():
+				if op == '$not':
+					ok = not matches(doc, {key: arg})
+				else:
+					ok = OPERATORS[op](doc.get(key), arg)
+				if not ok:
+					return False
+		elif doc.get(key) != cond:
+			return False
+	return True
+
+
+class MemoryCollection:
+	"""
+	stands in for the motor collections used by the jobs
+	"""
+
+	def __init__(self):
+		self.docs = []
+
+	async def insert_one(self, doc):
+		self.docs.append(copy.deepcopy(doc))
+
+	async def find_one(self, query):
+		return next((copy.deepcopy(i) for i in self.docs if matches(i, query)), None)
+
+	async def update_one(self, query, update):
+		for doc in self.docs:
+			if matches(doc, query):
+				doc.update(update['$set'])
+				return SimpleNamespace(matched_count=1)
+		return SimpleNamespace(matched_count=0)
+
+	async def find_one_and_update(self, query, update, sort, return_document):
+		key, _ = sort[0]
+		docs = sorted((i for i in self.docs if matches(i, query)), key=lambda x: x[key])
+		if not docs:
+			return None
+		docs[0].update(update['$set'])
+		return copy.deepcopy(docs[0])
+
+	def find(self, query):
+		async def cursor():
+			for doc in self.docs:
+				if matches(doc, query):
+					yield copy.deepcopy(doc)
+		return cursor()
+
+	async def bulk_write(self, requests, ordered):
+		for request in requests:
+			self.docs = [i for i in self.docs if not matches(i, request._filter)]
+			self.docs.append(copy.deepcopy(request._doc))
+
+	async def create_index(self, keys, unique):
+		pass
+
+
+@pytest.fixture
+def db(monkeypatch, isolated_server, tmp_path, fake_model):
+	collections = {}
+
+	def get_db():
+		return collections
+
+	monkeypatch.setattr(server.modules.jobs.models, 'get_db', get_db)
+	monkeypatch.setattr(server.modules.core.mixins, 'get_db', get_db)
+	monkeypatch.setattr(jobs_storage, 'root', str(tmp_path / 'jobs'))
+	collections['jobs'] = MemoryCollection()
+	collections['job_results'] = MemoryCollection()
+	return collections
+
+
+def submit(client, count):
+	return client.post('/ocr/jobs', json={
+		'imageContent': [base64.b64encode(f'image {i}'.encode()).decode() for i in range(count)],
+		'language': 'hi',
+		'version': 'v4',
+	})
+
+
+def test_submitted_job_is_queued(db):
+	client = TestClient(app)
+	response = submit(client, 3)
+	assert response.status_code == 202
+	job = response.json()
+	assert (job['status'], job['images'], job['completed']) == ('queued', 3, 0)
+	assert client.get(f'/ocr/jobs/{job["id"]}').json() == job
+	assert client.get('/ocr/jobs/unknown').status_code == 404
+	folder = db['jobs'].docs[0]['folder']
+	assert sorted(os.listdir(folder)) == ['0.jpg', '1.jpg', '2.jpg']
+	# the queued job stays accounted until it is processed
+	assert jobs_storage.detached == 3 * len('image 0')
+
+
+def test_results_are_paged(db):
+	client = TestClient(app)
+	job_id = submit(client, 5).json()['id']
+	job = asyncio.run(Job.get(job_id))
+	asyncio.run(job.save_results(0, [{'text': f'image {i}', 'meta': {}} for i in range(3)]))
+	page = client.get(f'/ocr/jobs/{job_id}/results', params={'limit': 2}).json()
+	assert page['offset'] == 0 and page['next'] == 2
+	assert [i['text'] for i in page['results']] == ['image 0', 'image 1']
+	page = client.get(f'/ocr/jobs/{job_id}/results', params={'offset': 2, 'limit': 4}).json()
+	assert 'next' not in page
+	assert page['results'] == [{'text': 'image 2', 'meta': {}}, None, None]
+	assert client.get(f'/ocr/jobs/{job_id}/results', params={'offset': 9}).json()['results'] == []
+	assert client.get(f'/ocr/jobs/{job_id}/results/1').json() == {'text': 'image 1', 'meta': {}}
+	assert client.get(f'/ocr/jobs/{job_id}/results/3').status_code == 409
+	assert client.get(f'/ocr/jobs/{job_id}/results/5').status_code == 404
+	assert client.get('/ocr/jobs/unknown/results/0').status_code == 404
+
+
+def test_claim(db):
+	now = datetime.now()
+
+	def add(id, **fields):
+		fields.setdefault('created', now)
+		asyncio.run(Job(id=id, request={}, folder='', images=1, **fields).save())
+
+	add('fresh', status='running', modified=now, created=now - timedelta(seconds=3))
+	add('requeued', retry_at=now + timedelta(seconds=60), created=now - timedelta(seconds=2))
+	add('stale', status='running', modified=now - timedelta(seconds=120), created=now - timedelta(seconds=1))
+	add('queued')
+	assert asyncio.run(Job.claim('worker', 60)).id == 'stale'
+	job = asyncio.run(Job.claim('worker', 60))
+	assert (job.id, job.status, job.worker) == ('queued', 'running', 'worker')
+	assert asyncio.run(Job.claim('worker', 60)) is None
@@ -0,0 +1,50 @@
+import gzip
+import json
+import os
+
+from server.modules.logs.writer import LogWriter, writers
+
+
+def read_lines(path):
+	opener = gzip.open if path.endswith('.gz') else open
+	with opener(path, 'rt', encoding='utf-8') as f:
+		return [json.loads(i) for i in f]
+
+
+def test_records_are_appended_in_the_background(tmp_path):
+	writer = LogWriter(str(tmp_path), 'test', flush_interval=0.01)
+	for i in range(10):
+		assert writer.log({'index': i, 'text': 'अ'})
+	writer.flush()
+	assert read_lines(writer.path) == [{'index': i, 'text': 'अ'} for i in range(10)]
+	writer.close()
+	assert writer.written == 10
+
+
+def test_files_are_rotated_and_compressed(tmp_path):
+	writer = LogWriter(str(tmp_path), 'test', max_bytes=100, flush_interval=0.01)
+	for i in range(20):
+		writer.log({'index': i, 'padding': 'x' * 20})
+		writer.flush()
+	writer.close()
+	rotated = sorted(i for i in os.listdir(tmp_path) if i.endswith('.jsonl.gz'))
+	assert rotated
+	records = []
+	for name in rotated:
+		records.extend(read_lines(str(tmp_path / name)))
+	if os.path.exists(writer.path):
+		records.extend(read_lines(writer.path))
+	assert sorted(i['index'] for i in records) == list(range(20))
+
+
+def test_records_are_dropped_when_the_queue_is_full(tmp_path):
+	writer = LogWriter(str(tmp_path), 'test', max_queue=1)
+	# the writer is not started, nothing takes the records off the queue
+	writer._start = lambda: None
+	assert writer.log({'index': 0})
+	assert not writer.log({'index': 1})
+	assert writer.dropped == 1
+
+
+def test_writers_of_the_other_tests_are_unregistered():
+	assert [i for i in writers if i.name == 'test'] == []
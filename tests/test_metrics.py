@@ -0,0 +1,72 @@
+import base64
+
+import pytest
+from fastapi.testclient import TestClient
+
+from server.app import app
+from server.modules.metrics.registry import Registry
+
+
+def test_metrics_are_rendered_in_the_text_format():
+	registry = Registry()
+	counter = registry.counter('test_total', 'a "counter"', ('name',))
+	histogram = registry.histogram('test_seconds', 'a histogram', buckets=(0.1, 1))
+	registry.callback('test_queue', 'a callback', 'gauge', lambda: {('a',): 3}, ('name',))
+	counter.inc(name='x\ny')
+	counter.inc(2, name='x\ny')
+	for value in (0.05, 0.1, 0.5, 5):
+		histogram.observe(value)
+	assert registry.render().splitlines() == [
+		'# HELP test_total a \\"counter\\"',
+		'# TYPE test_total counter',
+		'test_total{name="x\\ny"} 3',
+		'# HELP test_seconds a histogram',
+		'# TYPE test_seconds histogram',
+		'test_seconds_bucket{le="0.1"} 2',
+		'test_seconds_bucket{le="1"} 3',
+		'test_seconds_bucket{le="+Inf"} 4',
+		'test_seconds_sum 5.65',
+		'test_seconds_count 4',
+		'# HELP test_queue a callback',
+		'# TYPE test_queue gauge',
+		'test_queue{name="a"} 3',
+	]
+	with pytest.raises(ValueError):
+		counter.inc()
+
+
+def test_stages_are_timed_per_endpoint_and_model(isolated_server, fake_model):
+	client = TestClient(app)
+	response = client.post(
+		'/ocr/infer',
+		json={'imageContent': [base64.b64encode(b'image').decode()], 'language': 'hi', 'version': 'v4'},
+	)
+	assert response.json() == [{'text': 'image', 'meta': {}}]
+	response = client.get('/ocr/metrics')
+	assert response.headers['content-type'].startswith('text/plain; version=0.0.4')
+	lines = response.text.splitlines()
+	labels = 'endpoint="/ocr/infer",stage="{}",version="v4",modality="printed",language="hindi"'
+	for name in ('decode', 'workspace', 'inference', 'serialize'):
+		assert any(i.startswith(f'ocr_stage_duration_seconds_count{{{labels.format(name)}}}') for i in lines)
+	assert any(i.startswith('ocr_requests_total{endpoint="/ocr/infer",method="POST",status="200"}') for i in lines)
+	assert 'ocr_requests_in_flight 1' in lines
+	assert any(i.startswith('ocr_cache_hits_total{cache="results"}') for i in lines)
+
+
+def test_stages_of_streamed_responses_are_timed(isolated_server, fake_model):
+	def inference_count():
+		labels = 'endpoint="/ocr/infer",stage="inference",version="v4",modality="printed",language="hindi"'
+		for line in client.get('/ocr/metrics').text.splitlines():
+			if line.startswith(f'ocr_stage_duration_seconds_count{{{labels}}}'):
+				return float(line.split()[-1])
+		return 0
+
+	client = TestClient(app)
+	before = inference_count()
+	response = client.post(
+		'/ocr/infer',
+		json={'imageContent': [base64.b64encode(b'image').decode()], 'language': 'hi', 'version': 'v4'},
+		headers={'accept': 'application/x-ndjson'},
+	)
+	assert response.text.splitlines() == ['{"index":0,"result":{"text":"image","meta":{}}}']
+	assert inference_count() == before + 1
@@ -0,0 +1,115 @@
+import pytest
+from fastapi.testclient import TestClient
+
+import server.modules.postprocess.helper
+import server.modules.postprocess.routes
+from server.app import app
+from server.modules.postprocess.engine import LexiconIndex, edit_distance
+from server.modules.postprocess.lexicons import LexiconStore
+
+
+def test_edit_distance():
+	assert edit_distance('kitten', 'sitting', 3) == 3
+	assert edit_distance('ab', 'ba', 2) == 1
+	assert edit_distance('kitten', 'sitting', 2) == 3
+	assert edit_distance('नमस्ते', 'नमस्कार', 3) == 3
+
+
+def test_lookup_is_ranked():
+	index = LexiconIndex(['hello', 'help', 'hell', 'world'], max_distance=2)
+	assert index.lookup('helo') == [('hello', 1), ('help', 1), ('hell', 1)]
+	assert index.lookup('wrold') == [('world', 1)]
+	assert index.lookup('xyz') == []
+
+
+def test_long_words_are_found_past_the_prefix():
+	index = LexiconIndex(['internationalisation'], max_distance=2, prefix_length=5)
+	assert index.lookup('internationalization') == [('internationalisation', 1)]
+	assert index.lookup('internationalizatoin') == [('internationalisation', 2)]
+
+
+def test_postprocess_endpoints(native_engine):
+	client = TestClient(app)
+	body = {
+		'language': 'en',
+		'vocabulary': ['cart', 'card'],
+		'lexicon': ['care'],
+		'words': [{'text': 'carx'}, {'text': 'zzzz'}],
+	}
+	response = client.post('/ocr/newpostprocess', json=body)
+	assert response.json() == [
+		{'text': ['care', 'cart', 'card'], 'meta': {'distances': [1, 1, 1]}},
+		{'text': [], 'meta': {'distances': []}},
+	]
+	response = client.post('/ocr/postprocess', json=body)
+	assert response.json()[0]['text'] == ['cart', 'card']
+	# an empty vocabulary is still a vocabulary
+	body['vocabulary'] = []
+	response = client.post('/ocr/newpostprocess', json=body)
+	assert response.json()[0]['text'] == ['care']
+	assert client.post('/ocr/postprocess', json=body).json()[0]['text'] == []
+
+
+def test_null_meta(native_engine):
+	client = TestClient(app)
+	body = {
+		'language': 'hi',
+		'vocabulary': ['abc'],
+		'lexicon': [],
+		'words': [{'text': 'abd', 'meta': None}],
+	}
+	for path in ('/ocr/postprocess', '/ocr/newpostprocess'):
+		response = client.post(path, json=body)
+		assert response.status_code == 200
+		assert response.json()[0]['text'] == ['abc']
+
+
+@pytest.fixture
+def store(monkeypatch, tmp_path):
+	store = LexiconStore(str(tmp_path), max_items=2)
+	monkeypatch.setattr(server.modules.postprocess.helper, 'lexicon_store', store)
+	monkeypatch.setattr(server.modules.postprocess.routes, 'lexicon_store', store)
+	yield store
+
+
+def test_indices_are_cached_and_evicted(tmp_path):
+	store = LexiconStore(str(tmp_path), max_items=2)
+	a, _ = store.register(['cart', 'card'])
+	b, _ = store.register(['care'])
+	assert store.register([' cart', 'card', '']) == (a, 2)
+	assert store.index(a) is store.index(a)
+	store.index(b, a)
+	assert list(store.indices) == [(a,), (b, a)]
+	assert store.evictions == 1
+	assert store.index(b, a).lookup('carx')[0] == ('care', 1)
+	# the words are on disk, so another process can rebuild the index
+	assert LexiconStore(str(tmp_path)).index(a).lookup('cart') == [('cart', 0), ('card', 1)]
+
+
+def test_postprocess_with_handles(store, native_engine):
+	client = TestClient(app)
+	response = client.post(
+		'/ocr/lexicons',
+		content='cart\ncard\n'.encode('utf-8'),
+		headers={'content-type': 'text/plain'},
+	)
+	vocabulary = response.json()
+	assert vocabulary['size'] == 2 and vocabulary['loaded']
+	lexicon = client.post('/ocr/lexicons', json={'words': ['care']}).json()
+	assert client.get(f'/ocr/lexicons/{lexicon["id"]}').json()['size'] == 1
+	response = client.post('/ocr/newpostprocess', json={
+		'language': 'en',
+		'vocabulary_id': vocabulary['id'],
+		'lexicon_id': lexicon['id'],
+		'words': [{'text': 'carx'}],
+	})
+	assert response.json()[0]['text'] == ['care', 'cart', 'card']
+	assert store.index(lexicon['id'], vocabulary['id']) is store.index(lexicon['id'], vocabulary['id'])
+
+
+def test_unknown_handles(store):
+	client = TestClient(app)
+	assert client.get('/ocr/lexicons/../../etc').status_code == 404
+	assert client.get(f'/ocr/lexicons/{"0" * 64}').status_code == 404
+	response = client.post('/ocr/postprocess', json={'language': 'en', 'words': []})
+	assert response.status_code == 422
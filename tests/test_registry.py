@@ -0,0 +1,72 @@
+import pytest
+from fastapi import HTTPException
+from fastapi.testclient import TestClient
+
+from server.app import app
+from server.modules.registry.capabilities import ModelRegistry, model_registry
+
+DATA = {
+	'language_groups': {'major': ['english', 'hindi', 'tamil']},
+	'defaults': {
+		'backend': 'worker',
+		'model_dir': '/models/{version}/{modality}/{language}',
+		'modalities': ['printed', 'handwritten'],
+		'languages': ['@major'],
+	},
+	'rules': {'printed_tamil': [{'modalities': ['printed'], 'languages': ['tamil']}]},
+	'versions': {
+		'v1': {},
+		'v2': {'models': [{'modalities': ['printed'], 'exclude': ['english']}]},
+		'v2_bilingual': {'bilingual': True, 'batch': {'max_batch_size': 8}, 'models': 'printed_tamil'},
+		'page': {'backend': 'page_pu', 'model_dir': None},
+		'v3': {'prob_format': 'packed', 'models': 'printed_tamil'},
+	},
+}
+
+
+def test_entries_are_expanded():
+	registry = ModelRegistry(DATA)
+	assert len(list(registry.filter(version='v1'))) == 6
+	assert sorted(i.language for i in registry.filter(version='v2')) == ['hindi', 'tamil']
+	assert registry.get('v2', 'handwritten', 'hindi') is None
+	assert registry.get('v1', 'printed', 'hindi').model_dir == '/models/v1/printed/hindi'
+	assert registry.get('page', 'printed', 'hindi').page_level
+	# the models write prob.json unless they opt in to prob.bin
+	assert registry.get('v1', 'printed', 'hindi').prob_format == 'pts'
+	assert registry.get('v3', 'printed', 'tamil').prob_format == 'packed'
+
+
+def test_bilingual_models():
+	registry = ModelRegistry(DATA)
+	capability = registry.verify('v2_bilingual', 'printed', 'tamil')
+	assert capability.model_language == 'english_tamil'
+	assert registry.model('v2_bilingual', 'printed', 'english_tamil') is capability
+	assert registry.batch_overrides() == {
+		('v2_bilingual', 'printed', 'english_tamil'): {'max_batch_size': 8},
+	}
+
+
+def test_unknown_model_is_rejected():
+	with pytest.raises(HTTPException) as e:
+		ModelRegistry(DATA).verify('v4', 'printed', 'hindi')
+	assert e.value.status_code == 400
+
+
+def test_minor_languages_only_have_the_robust_model():
+	assert model_registry.get('v4_robust', 'printed', 'sanskrit') is not None
+	assert model_registry.get('v4', 'printed', 'sanskrit') is None
+
+
+def test_models_endpoint():
+	response = TestClient(app).get('/ocr/models', params={'version': 'v4.13'})
+	assert response.status_code == 200
+	assert [(i['modality'], i['language']) for i in response.json()] == [('printed', 'english')]
+
+
+def test_infer_rejects_unavailable_model():
+	response = TestClient(app).post('/ocr/infer', json={
+		'imageContent': [],
+		'language': 'ur',
+		'version': 'v4',
+	})
+	assert response.status_code == 400
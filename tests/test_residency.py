@@ -0,0 +1,67 @@
+import pytest
+from fastapi.testclient import TestClient
+
+from server.app import app
+from server.modules.residency.manager import ResidencyManager, residency_managers
+
+HINDI = ('v4', 'printed', 'hindi')
+TAMIL = ('v4', 'printed', 'tamil')
+TELUGU = ('v4', 'printed', 'telugu')
+
+
+def load(manager, key, load_cost=1):
+	if manager.hit(key):
+		return []
+	victims = manager.evict_for(key)
+	manager.loaded(key, load_cost)
+	return victims
+
+
+def test_lru_keeps_the_hot_model():
+	manager = ResidencyManager('test_lru', 2, 'lru')
+	load(manager, HINDI)
+	load(manager, TAMIL)
+	load(manager, HINDI)
+	assert load(manager, TELUGU) == [TAMIL]
+	assert manager.hits == 1 and manager.misses == 3
+	assert manager.evictions == 1
+
+
+def test_lfu_evicts_the_least_used_model():
+	manager = ResidencyManager('test_lfu', 2, 'lfu')
+	load(manager, HINDI)
+	for _ in range(3):
+		load(manager, HINDI)
+	load(manager, TAMIL)
+	load(manager, TAMIL)
+	# hindi is the oldest and least recently used but it has more hits
+	assert load(manager, TELUGU) == [TAMIL]
+
+
+def test_cost_aware_keeps_the_expensive_model():
+	manager = ResidencyManager('test_cost', 2, 'cost')
+	load(manager, HINDI, load_cost=60)
+	load(manager, TAMIL, load_cost=2)
+	load(manager, TAMIL, load_cost=2)
+	assert load(manager, TELUGU) == [TAMIL]
+
+
+def test_unknown_policy():
+	with pytest.raises(ValueError):
+		ResidencyManager('test_unknown', 2, 'fifo')
+
+
+def test_residency_endpoint():
+	manager = ResidencyManager('test_endpoint', 2)
+	load(manager, HINDI, load_cost=5)
+	load(manager, HINDI)
+	response = TestClient(app).get('/ocr/residency/')
+	assert response.status_code == 200
+	state = {i['name']: i for i in response.json()}['test_endpoint']
+	assert state['hits'] == 1 and state['misses'] == 1
+	assert state['models'][0]['language'] == 'hindi'
+	assert state['models'][0]['load_cost'] == 5
+
+
+def test_managers_of_the_other_tests_are_unregistered():
+	assert [i for i in residency_managers if i.startswith('test_')] == []
@@ -0,0 +1,57 @@
+import gzip
+import json
+
+from starlette.requests import Request
+
+from server.modules.core import serialization
+from server.modules.core.serialization import (JSON, accepted, encode_response,
+                                               encoded_responses)
+
+
+def make_request(**headers):
+	return Request({
+		'type': 'http',
+		'headers': [(k.replace('_', '-').encode(), v.encode()) for k, v in headers.items()],
+	})
+
+
+def test_accepted_values_by_preference():
+	assert accepted('') == []
+	assert accepted('gzip;q=0.5, br, identity;q=0') == ['br', 'gzip']
+	assert accepted('application/msgpack, application/json;q=0.9') == ['application/msgpack', 'application/json']
+
+
+def test_results_are_encoded_as_json():
+	results = [{'text': 'अ', 'meta': {}}]
+	response = encode_response(make_request(), results)
+	assert response.media_type == JSON
+	assert json.loads(response.body) == results
+	assert 'content-encoding' not in response.headers
+	# the media types that are not available fall back to json
+	response = encode_response(make_request(accept='application/x-unknown'), results)
+	assert response.media_type == JSON
+
+
+def test_large_bodies_are_compressed(monkeypatch):
+	monkeypatch.setattr(serialization, 'RESPONSE_COMPRESSION_MIN_SIZE', 100)
+	small = [{'text': 'a', 'meta': {}}]
+	large = [{'text': 'a' * 200, 'meta': {'max_prob': [0.5] * 50}}]
+	response = encode_response(make_request(accept_encoding='gzip'), small)
+	assert 'content-encoding' not in response.headers
+	response = encode_response(make_request(accept_encoding='gzip, deflate'), large)
+	assert response.headers['content-encoding'] == 'gzip'
+	assert json.loads(gzip.decompress(response.body)) == large
+	response = encode_response(make_request(accept_encoding='identity'), large)
+	assert 'content-encoding' not in response.headers
+
+
+def test_optional_encodings(monkeypatch):
+	monkeypatch.setitem(serialization.ENCODERS, 'application/msgpack', lambda x: b'packed')
+	response = encode_response(make_request(accept='application/msgpack'), [])
+	assert response.media_type == 'application/msgpack'
+	assert response.body == b'packed'
+	assert set(encoded_responses({200: {'content': {'text/event-stream': {}}}})[200]['content']) >= {
+		JSON,
+		'application/msgpack',
+		'text/event-stream',
+	}
@@ -0,0 +1,92 @@
+import base64
+import json
+import os
+
+import pytest
+from fastapi.testclient import TestClient
+
+import server.modules.ulca.helper
+import server.modules.ulca.routes
+from server.app import app
+from server.modules.cache.results import result_cache
+
+
+def encode(image):
+	return base64.b64encode(image.encode('utf-8')).decode('utf-8')
+
+
+@pytest.fixture
+def client(monkeypatch, isolated_server, fake_model):
+	"""
+	replaces the models with ones that return the content of the images
+	"""
+	async def run_script(command):
+		folder = command.split()[-1]
+		out = {}
+		for name in os.listdir(folder):
+			if name.endswith('.jpg'):
+				with open(os.path.join(folder, name)) as f:
+					out[name] = f.read()
+		with open(os.path.join(folder, 'out.json'), 'w') as f:
+			json.dump(out, f)
+
+	async def save_logs(request, ocr_request, response):
+		pass
+
+	monkeypatch.setattr(result_cache, 'folder', None)
+	monkeypatch.setattr(result_cache, 'enabled', True)
+	monkeypatch.setattr(server.modules.ulca.helper, 'run_script', run_script)
+	monkeypatch.setattr(server.modules.ulca.routes, 'save_logs', save_logs)
+	result_cache.clear()
+	yield TestClient(app)
+	result_cache.clear()
+	assert os.listdir(isolated_server / 'workspaces') == []
+
+
+def infer(client, images, accept):
+	return client.post(
+		'/ocr/infer',
+		json={'imageContent': [encode(i) for i in images], 'language': 'hi', 'version': 'v4'},
+		headers={'accept': accept},
+	)
+
+
+def test_ndjson_results_are_streamed_with_their_index(client):
+	infer(client, ['image 3'], 'application/json')
+	response = infer(client, [f'image {i}' for i in range(12)], 'application/x-ndjson')
+	assert response.headers['content-type'].startswith('application/x-ndjson')
+	lines = [json.loads(i) for i in response.text.splitlines()]
+	# the cached result comes first
+	assert lines[0] == {'index': 3, 'result': {'text': 'image 3', 'meta': {}}}
+	assert sorted(i['index'] for i in lines) == list(range(12))
+	assert all(i['result']['text'] == f'image {i["index"]}' for i in lines)
+
+
+def test_sse_events(client):
+	# invalid requests are rejected before the response starts
+	response = client.post(
+		'/ocr/infer',
+		json={'imageContent': [encode('a')], 'language': 'hi', 'version': 'unknown'},
+		headers={'accept': 'text/event-stream'},
+	)
+	assert response.status_code == 422
+	response = infer(client, ['a'], 'text/event-stream')
+	events = response.text.strip().split('\n\n')
+	name, data = events[0].split('\n')
+	assert name == 'event: result'
+	assert json.loads(data[len('data: '):]) == {'index': 0, 'result': {'text': 'a', 'meta': {}}}
+	assert events[-1] == 'event: done\ndata: {}'
+
+
+def test_ulca_results_are_streamed(client):
+	response = client.post(
+		'/ocr/ulca/v2',
+		json={
+			'image': [{'imageContent': encode(f'image {i}')} for i in range(10)],
+			'config': {'languages': [{'sourceLanguage': 'hi'}]},
+		},
+		headers={'accept': 'application/x-ndjson'},
+	)
+	lines = [json.loads(i) for i in response.text.splitlines()]
+	assert [i['index'] for i in lines] == list(range(10))
+	assert [i['result']['source'] for i in lines] == [f'image {i}' for i in range(10)]
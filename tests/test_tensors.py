@@ -0,0 +1,77 @@
+import json
+
+import numpy as np
+import pytest
+from fastapi.testclient import TestClient
+
+from server.app import app
+from server.helper import process_ocr_output
+from server.modules.core.serialization import dumps
+from server.modules.core.tensors import (TensorFormatError, decode_tensors,
+                                         encode_tensors, encoded_meta,
+                                         load_tensors, pack_tensors,
+                                         unpack_tensors)
+
+
+def test_round_trip():
+	tensors = [np.random.rand(3, 5), np.random.rand(7), np.zeros((0, 4))]
+	blob = pack_tensors(tensors)
+	ret = unpack_tensors(blob)
+	assert [i.shape for i in ret] == [(3, 5), (7,), (0, 4)]
+	assert all(i.dtype == np.float16 for i in ret)
+	assert np.allclose(ret[0], tensors[0], atol=1e-3)
+	# float16 takes 2 bytes per value plus a small header
+	assert len(blob) < 2 * 22 + 100
+
+
+def test_memory_mapped(tmp_path):
+	path = tmp_path / 'prob.bin'
+	path.write_bytes(pack_tensors([[1, 2], [[3], [4]]], dtype='<f4'))
+	ret = load_tensors(str(path))
+	assert ret[1].tolist() == [[3], [4]]
+	assert not ret[0].flags.writeable
+
+
+def test_invalid_blob():
+	with pytest.raises(TensorFormatError):
+		unpack_tensors(b'nope')
+	with pytest.raises(TensorFormatError):
+		unpack_tensors(pack_tensors([[1, 2]])[:12])
+
+
+def test_packed_probabilities_of_the_models(tmp_path):
+	(tmp_path / 'out.json').write_text(json.dumps({'1.jpg': 'b', '0.jpg': 'a'}))
+	(tmp_path / 'prob.bin').write_bytes(pack_tensors([[[0.5]], [0.5], [[0.25]], [0.25]]))
+	ret = process_ocr_output(str(tmp_path))
+	assert [i.text for i in ret] == ['a', 'b']
+	assert ret[1].meta['prob_format'] == 'packed'
+	# the tensors are views of prob.bin until the response is serialised
+	assert ret[1].meta['max_prob'].arrays[0].tolist() == [0.25]
+	meta = json.loads(dumps(ret[1].meta))
+	assert decode_tensors(meta['max_prob'])[0].tolist() == [0.25]
+	assert encoded_meta(ret[1].meta) == meta
+
+
+def test_postprocess_with_packed_probabilities(native_engine):
+	client = TestClient(app)
+	body = {
+		'language': 'en',
+		'vocabulary': ['cart'],
+		'words': [{'text': 'cart'}, {'text': 'carx'}],
+		'probabilities': encode_tensors([[[1.0]], [1.0], [[0.5]], [0.5, 0.25]]),
+	}
+	response = client.post('/ocr/postprocess', json=body)
+	assert [i['meta']['confidence'] for i in response.json()] == [1.0, 0.375]
+	body['probabilities'] = encode_tensors([[1.0]])
+	assert client.post('/ocr/postprocess', json=body).status_code == 400
+
+
+def test_postprocess_containers_reject_packed_probabilities():
+	body = {
+		'language': 'en',
+		'vocabulary': ['cart'],
+		'words': [{'text': 'cart'}],
+		'probabilities': encode_tensors([[[1.0]], [1.0]]),
+	}
+	response = TestClient(app).post('/ocr/postprocess', json=body)
+	assert response.status_code == 400
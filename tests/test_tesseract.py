@@ -0,0 +1,115 @@
+import io
+import threading
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+from PIL import Image
+
+import server.helper
+import server.modules.external.helper
+import server.modules.tesseract.engine as engine
+from server.app import app
+from server.modules.tesseract.engine import TesseractPools
+
+
+class FakeEngine:
+	"""
+	returns the language and the width of the image, records the engines
+	created and the images being recognised at the same time
+	"""
+	created = []
+	active = 0
+	max_active = 0
+	lock = threading.Lock()
+
+	def __init__(self, lang, path=None):
+		self.lang = lang
+		FakeEngine.created.append(lang)
+
+	def _recognise(self, image):
+		with FakeEngine.lock:
+			FakeEngine.active += 1
+			FakeEngine.max_active = max(FakeEngine.max_active, FakeEngine.active)
+		time.sleep(0.01)
+		with FakeEngine.lock:
+			FakeEngine.active -= 1
+		return engine.open_image(image).size[0]
+
+	def text(self, image):
+		return f'{self.lang} {self._recognise(image)}'
+
+	def words(self, image):
+		return [(self.lang, [0, 0, self._recognise(image), 1])]
+
+	def close(self):
+		pass
+
+
+@pytest.fixture
+def fake_engine(monkeypatch):
+	monkeypatch.setattr(engine, 'TesseractEngine', FakeEngine)
+	FakeEngine.created = []
+	FakeEngine.max_active = 0
+	yield FakeEngine
+
+
+def test_engines_are_reused(fake_engine):
+	pools = TesseractPools(size=2)
+	images = [Image.new('L', (i + 1, 1)) for i in range(8)]
+	assert pools.text('hin', images) == [f'hin {i + 1}' for i in range(8)]
+	pools.text('hin', images)
+	assert fake_engine.created == ['hin', 'hin']
+	assert fake_engine.max_active == 2
+
+
+def test_one_pool_per_language(fake_engine):
+	pools = TesseractPools(size=1)
+	pools.text('hin', [Image.new('L', (1, 1))])
+	assert pools.text('eng+hin', [Image.new('L', (1, 1))]) == ['eng+hin 1']
+	assert fake_engine.created == ['hin', 'eng+hin']
+
+
+def test_page_tesseract_returns_the_coords(fake_engine, monkeypatch, tmp_path):
+	monkeypatch.setattr(server.helper, 'tesseract_pools', TesseractPools(size=1))
+	Image.new('L', (5, 1)).save(tmp_path / '0.jpg')
+	ret = server.helper.call_page_tesseract_bi('hindi', str(tmp_path))
+	assert [i.dict() for i in ret] == [
+		{'text': 'eng+hin', 'meta': {'coords': [0, 0, 5, 1], 'image': 0}},
+	]
+
+
+def test_page_tesseract_recognises_all_the_images(fake_engine, monkeypatch, tmp_path):
+	monkeypatch.setattr(server.helper, 'tesseract_pools', TesseractPools(size=4))
+	monkeypatch.setattr(server.helper, 'TESSERACT_REQUEST_PARALLELISM', 2)
+	for idx in range(12):
+		Image.new('L', (idx + 1, 1)).save(tmp_path / f'{idx}.jpg')
+	ret = server.helper.call_page_tesseract('hindi', str(tmp_path))
+	assert [(i.meta['image'], i.meta['coords'][2]) for i in ret] == [
+		(idx, idx + 1) for idx in range(12)
+	]
+	assert fake_engine.max_active == 2
+
+
+def test_tesseract_pads_in_memory(fake_engine, monkeypatch, tmp_path):
+	monkeypatch.setattr(server.helper, 'tesseract_pools', TesseractPools(size=2))
+	for idx in range(11):
+		Image.new('L', (idx + 1, 1)).save(tmp_path / f'{idx}.jpg')
+	ret = server.helper.call_tesseract('hindi', str(tmp_path))
+	assert [i.text for i in ret] == [f'hin {idx + 21}' for idx in range(11)]
+	assert Image.open(tmp_path / '0.jpg').size == (1, 1)
+
+
+def test_tesseract_endpoint(fake_engine, monkeypatch):
+	monkeypatch.setattr(server.modules.external.helper, 'tesseract_pools', TesseractPools(size=1))
+	image = io.BytesIO()
+	Image.new('L', (7, 1)).save(image, format='PNG')
+	client = TestClient(app)
+	response = client.post(
+		'/ocr/tesseract',
+		files={'image': ('a.png', image.getvalue())},
+		data={'language': 'hindi', 'bilingual': 'true'},
+	)
+	assert response.json() == {'text': 'eng+hin 7'}
+	response = client.post('/ocr/tesseract', files={'image': ('a.png', b'not an image')})
+	assert response.status_code == 400
@@ -0,0 +1,43 @@
+import asyncio
+import base64
+import io
+
+from fastapi.testclient import TestClient
+
+from server.app import app
+from server.modules.core.aio import run_script
+from server.modules.core.tracing import RequestIdStream, current_request_id
+
+
+def test_request_id_and_server_timing(isolated_server, fake_model):
+	client = TestClient(app)
+	body = {'imageContent': [base64.b64encode(b'image').decode()], 'language': 'hi', 'version': 'v4'}
+	response = client.post('/ocr/infer', json=body, headers={'x-request-id': 'abc-1'})
+	assert response.headers['x-request-id'] == 'abc-1'
+	timing = response.headers['server-timing'].split(', ')
+	assert timing[-1].startswith('total;dur=')
+	assert any(i.startswith('decode;dur=') for i in timing)
+	# the invalid ids are replaced
+	response = client.get('/ocr/ping', headers={'x-request-id': 'bad id'})
+	assert len(response.headers['x-request-id']) == 32
+
+
+def test_scripts_get_the_request_id(tmp_path):
+	async def main():
+		current_request_id.set('abc-2')
+		await run_script(f'echo $OCR_REQUEST_ID > {tmp_path}/id')
+	asyncio.run(main())
+	assert (tmp_path / 'id').read_text().strip() == 'abc-2'
+
+
+def test_log_lines_are_prefixed():
+	stream = io.StringIO()
+	out = RequestIdStream(stream)
+	out.write('before\n')
+	token = current_request_id.set('abc-3')
+	out.write('first')
+	out.write(' line\nsecond line')
+	out.write('\n')
+	current_request_id.reset(token)
+	out.write('after\n')
+	assert stream.getvalue() == 'before\n[abc-3] first line\n[abc-3] second line\nafter\n'
@@ -0,0 +1,153 @@
+import base64
+import sys
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+
+from server.app import app
+from server.modules.cache.results import result_cache
+from server.modules.workers.pool import WorkerError, WorkerPool, worker_pool
+
+FAKE_WORKER = f'{sys.executable} tests/fake_worker.py {{modality}} {{language}} {{version}} {{root}}'
+
+
+def encode(image):
+	return base64.b64encode(image.encode('utf-8')).decode('utf-8')
+
+
+@pytest.fixture
+def pool(tmp_path):
+	pool = WorkerPool(
+		FAKE_WORKER,
+		str(tmp_path),
+		max_workers=2,
+		start_timeout=10,
+		infer_timeout=10,
+		name='test_workers',
+	)
+	yield pool
+	pool.shutdown()
+
+
+def write_images(folder, count):
+	for idx in range(count):
+		with open(f'{folder}/{idx}.jpg', 'wb') as f:
+			f.write(f'image {idx}'.encode('utf-8'))
+
+
+def test_worker_is_reused(pool):
+	key = ('v4', 'printed', 'hindi')
+	for count in (3, 2):
+		tmp = pool.workspace()
+		write_images(tmp.name, count)
+		out, prob = pool.infer(key, tmp.name)
+		assert out == {f'{i}.jpg': f'hindi image {i}' for i in range(count)}
+		assert prob is None
+	assert len(pool.workers) == 1
+	assert pool.workers[key].is_alive()
+
+
+def test_least_recently_used_worker_is_stopped(pool):
+	tmp = pool.workspace()
+	write_images(tmp.name, 1)
+	first = pool.get(('v4', 'printed', 'hindi'))
+	pool.get(('v4', 'printed', 'tamil'))
+	pool.get(('v4', 'printed', 'hindi'))
+	pool.get(('v4', 'printed', 'telugu'))
+	assert list(pool.workers) == [('v4', 'printed', 'hindi'), ('v4', 'printed', 'telugu')]
+	assert pool.workers[('v4', 'printed', 'hindi')] is first
+
+
+def test_dead_worker_is_restarted(pool):
+	key = ('v4', 'printed', 'hindi')
+	worker = pool.get(key)
+	worker.process.kill()
+	worker.process.wait()
+	tmp = pool.workspace()
+	write_images(tmp.name, 1)
+	assert pool.infer(key, tmp.name)[0] == {'0.jpg': 'hindi image 0'}
+
+
+def test_unavailable_worker(tmp_path):
+	pool = WorkerPool('./does-not-exist.sh', str(tmp_path), name='test_workers')
+	with pytest.raises(WorkerError):
+		pool.get(('v4', 'printed', 'hindi'))
+	assert ('v4', 'printed', 'hindi') in pool.unsupported
+
+
+def test_missing_model_is_not_started_again(tmp_path):
+	pool = WorkerPool(f'{sys.executable} -c "exit(3)"', str(tmp_path), name='test_workers')
+	with pytest.raises(WorkerError):
+		pool.get(('v4', 'printed', 'hindi'))
+	assert ('v4', 'printed', 'hindi') in pool.unsupported
+
+
+def test_failed_start_is_retried(pool):
+	key = ('v4', 'printed', 'hindi')
+	pool.command = f'{sys.executable} -c "exit(1)"'
+	pool.retry_after = 0.2
+	with pytest.raises(WorkerError):
+		pool.get(key)
+	assert key not in pool.unsupported
+	# the worker could start now, but it is only tried again after retry_after
+	pool.command = FAKE_WORKER
+	with pytest.raises(WorkerError):
+		pool.get(key)
+	time.sleep(0.2)
+	assert pool.get(key).is_alive()
+	assert key not in pool.start_failures
+
+
+def test_repeated_start_failures_are_not_retried(pool):
+	key = ('v4', 'printed', 'hindi')
+	pool.command = f'{sys.executable} -c "exit(1)"'
+	pool.retry_after = 0
+	pool.max_start_failures = 2
+	with pytest.raises(WorkerError):
+		pool.get(key)
+	assert key not in pool.unsupported
+	with pytest.raises(WorkerError):
+		pool.get(key)
+	assert key in pool.unsupported
+
+
+def test_infer_endpoint_uses_worker(monkeypatch, isolated_server):
+	monkeypatch.setattr('server.helper.WORKER_POOL_ENABLED', True)
+	monkeypatch.setattr(worker_pool, 'command', FAKE_WORKER)
+	client = TestClient(app)
+	response = client.post('/ocr/infer', json={
+		'imageContent': [encode(f'image {i}') for i in range(3)],
+		'language': 'hi',
+		'version': 'v4',
+		'modality': 'printed',
+	})
+	worker_pool.shutdown()
+	assert response.status_code == 200
+	assert response.json() == [
+		{'text': f'hindi image {i}', 'meta': {}} for i in range(3)
+	]
+
+
+def test_worker_probabilities_are_served_from_the_cache(monkeypatch, isolated_server):
+	monkeypatch.setattr('server.helper.WORKER_POOL_ENABLED', True)
+	monkeypatch.setattr(worker_pool, 'command', FAKE_WORKER)
+	monkeypatch.setattr(result_cache, 'folder', None)
+	monkeypatch.setattr(result_cache, 'enabled', True)
+	monkeypatch.setattr(result_cache, 'hits', 0)
+	result_cache.clear()
+	client = TestClient(app)
+	body = {
+		'imageContent': [encode('image 0')],
+		'language': 'hi',
+		'version': 'v4',
+	}
+	body['meta'] = {'include_probability': True}
+	assert client.post('/ocr/infer', json=body).json()[0]['meta'] == {'data_prob': '', 'max_prob': ''}
+	# the probabilities are only inferred and cached when they are requested
+	del body['meta']
+	response = client.post('/ocr/infer', json=body)
+	worker_pool.shutdown()
+	result_cache.clear()
+	assert response.json()[0]['meta'] == {}
+	assert result_cache.hits == 1
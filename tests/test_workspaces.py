@@ -0,0 +1,101 @@
+import asyncio
+import base64
+import io
+import json
+import os
+import shutil
+
+import httpx
+import pytest
+from fastapi import HTTPException
+
+import server.modules.ulca.helper
+import server.modules.ulca.routes
+from server.app import app
+from server.modules.workspaces.manager import WorkspaceManager
+
+
+def test_workspace_is_removed(tmp_path):
+	manager = WorkspaceManager(str(tmp_path), quota=10, total_quota=10)
+	with manager.create('test') as workspace:
+		workspace.write('0.jpg', b'image')
+		assert os.path.exists(os.path.join(workspace.path, '0.jpg'))
+		assert manager.used == 5
+	assert not os.path.exists(workspace.path)
+	assert manager.used == 0
+
+
+def test_workspace_quota(tmp_path):
+	manager = WorkspaceManager(str(tmp_path), quota=8, total_quota=12)
+	with manager.create('test') as workspace:
+		workspace.write('0.jpg', b'image')
+		with pytest.raises(HTTPException) as e:
+			workspace.copy('1.jpg', io.BytesIO(b'image'), chunk_size=2)
+		assert e.value.status_code == 413
+		with manager.create('test') as other:
+			with pytest.raises(HTTPException) as e:
+				other.write('0.jpg', b'picture')
+			assert e.value.status_code == 503
+
+
+def test_detached_workspaces_stay_accounted(tmp_path):
+	manager = WorkspaceManager(str(tmp_path), quota=10, total_quota=10)
+	with manager.create('job') as workspace:
+		workspace.write('0.jpg', b'image')
+		path = workspace.detach()
+	assert (manager.used, manager.detached) == (0, 5)
+	with manager.create('job') as workspace:
+		with pytest.raises(HTTPException) as e:
+			workspace.write('0.jpg', b'picture')
+		assert e.value.status_code == 503
+	# the folder was removed by its new owner
+	shutil.rmtree(path)
+	manager.account_detached()
+	assert manager.detached == 0
+
+
+def test_stale_workspaces_are_removed(tmp_path):
+	manager = WorkspaceManager(str(tmp_path), quota=10, total_quota=10)
+	os.makedirs(tmp_path / 'ulca.999999999.abc')
+	# the random part can contain underscores and numbers
+	live = f'job_chunk.{os.getppid()}.x_999999999_y'
+	os.makedirs(tmp_path / live)
+	current = manager.create('ulca')
+	manager.cleanup_stale()
+	assert sorted(os.listdir(tmp_path)) == sorted([os.path.basename(current.path), live])
+
+
+def test_concurrent_ulca_requests_are_isolated(monkeypatch, isolated_server):
+	async def run_script(command):
+		# stands in for the ulca script, the folder is the last argument
+		folder = command.split()[-1]
+		await asyncio.sleep(0.1)
+		out = {}
+		for name in os.listdir(folder):
+			with open(os.path.join(folder, name)) as f:
+				out[name] = f.read()
+		with open(os.path.join(folder, 'out.json'), 'w') as f:
+			json.dump(out, f)
+
+	async def save_logs(request, ocr_request, response):
+		pass
+
+	monkeypatch.setattr(server.modules.ulca.helper, 'run_script', run_script)
+	monkeypatch.setattr(server.modules.ulca.routes, 'save_logs', save_logs)
+
+	async def call(text):
+		transport = httpx.ASGITransport(app=app)
+		async with httpx.AsyncClient(transport=transport, base_url='http://test') as client:
+			return await client.post('/ocr/ulca/v2', json={
+				'image': [{'imageContent': base64.b64encode(text.encode()).decode()}],
+				'config': {'languages': [{'sourceLanguage': 'hi'}]},
+			})
+
+	async def main():
+		return await asyncio.gather(*[call(f'image {i}') for i in range(4)])
+
+	responses = asyncio.run(main())
+	assert [i.json()['output'][0]['source'] for i in responses] == [
+		f'image {i}' for i in range(4)
+	]
+	assert os.listdir(isolated_server / 'workspaces') == []
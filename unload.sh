@@ -0,0 +1,14 @@
+#!/bin/bash
+
+# This script removes the docker container of the given model that was
+# previously started by the load.sh script.
+# The model to be removed is chosen by the residency manager of the api.
+
+MODALITY="$1"
+LANGUAGE="$2"
+VERSION="$3"
+
+CONTAINER_NAME="infer-$(echo $MODALITY)-$(echo $LANGUAGE)-$(echo $VERSION)"
+echo "Removing the docker container: $CONTAINER_NAME"
+
+docker rm -f $CONTAINER_NAME
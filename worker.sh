@@ -0,0 +1,36 @@
+#!/bin/bash
+
+# Given the set of params such as modality, language and version, this script
+# starts a long lived docker container that loads the model once and then
+# serves the inference requests sent by the api over stdin/stdout.
+# The protocol is documented in server/modules/workers/pool.py
+# All the image folders handed to the worker live inside DATA_ROOT.
+
+
+MODALITY="$1"
+LANGUAGE="$2"
+VERSION="$3"
+DATA_ROOT="$4"
+
+
+echo "Starting the inference worker for $VERSION $LANGUAGE $MODALITY" >&2
+
+MODEL_DIR="/home/ocr/models/pretrained/$VERSION/$MODALITY/$LANGUAGE"
+
+# exit code 3 tells the api that there is no worker for this model
+if [ ! -d "$MODEL_DIR" ]; then
+	echo "$MODEL_DIR : No such Directory" >&2
+	exit 3
+fi
+
+if [ ! -d "$DATA_ROOT" ]; then
+	echo "$DATA_ROOT : Enter a valid data directory" >&2
+	exit 1
+fi
+
+exec docker run --rm -i --gpus all --net host \
+	--name "worker-$VERSION-$MODALITY-$LANGUAGE" \
+	-v $MODEL_DIR:/model:ro \
+	-v $DATA_ROOT:/data \
+	ocr:$VERSION \
+	python worker.py $MODALITY $LANGUAGE